@@ -0,0 +1,194 @@
+"""
+End-to-end handler benchmark against a stub WebUI
+
+Starts stub WebUIs (benchmarks/stub_webui.py) in their own processes and
+replays the job corpus (benchmarks/corpus.py) through `handler`, the same
+entry point RunPod calls. Each workload runs in a fresh subprocess so peak
+RSS and the stage metrics are per workload. Reports jobs/s, job latency,
+per-stage p50/p95/p99, peak RSS and payload sizes.
+
+With the stub's per-step time near zero, the numbers are the handler's own
+overhead; raise --step-seconds to see how well the pipeline hides it.
+
+Usage:
+    python benchmarks/bench_handler.py                          # every workload
+    python benchmarks/bench_handler.py --workloads story_20 --jobs 5 --json results.json
+    python benchmarks/bench_handler.py --concurrency 4 --backends 2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import WORKLOADS, build_corpus
+from memory import peak_rss_kb
+
+# Stages shown in the table; every stage is in the JSON output
+REPORTED_STAGES = ("reference_preprocess", "build", "queue", "webui", "decode", "encode", "serialize")
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def count_errors(outputs):
+    """Failed jobs plus failed scenes among a job's yielded results"""
+    errors = 0
+    for output in outputs:
+        errors += "error" in output or "scene_error" in output
+        errors += sum("error" in scene for scene in output.get("scenes", []))
+    return errors
+
+
+def run_workload(name, corpus_file, jobs, concurrency):
+    """Replay one workload through the handler; runs inside its own subprocess"""
+    import handler
+
+    with open(corpus_file) as f:
+        job_input = json.load(f)[name]
+
+    # Same bring-up as a deployed worker, minus provisioning and warm-up
+    handler.orchestrate_startup()
+    if handler.startup_state["error"]:
+        raise RuntimeError(handler.startup_state["error"])
+    handler.job_watchdog.start()
+    handler.progress_reporter.start()
+
+    def run_job(i):
+        start = time.perf_counter()
+        outputs = list(handler.stream_handler({"id": f"bench-{name}-{i}", "input": dict(job_input)}))
+        return time.perf_counter() - start, count_errors(outputs)
+
+    baseline_rss = peak_rss_kb()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        runs = list(pool.map(run_job, range(jobs)))
+    elapsed = time.perf_counter() - start
+
+    latencies = [seconds for seconds, _ in runs]
+    byte_totals = handler.stage_metrics.byte_totals()
+    return {
+        "workload": name,
+        "jobs": jobs,
+        "concurrency": concurrency,
+        "errors": sum(errors for _, errors in runs),
+        "jobs_per_second": round(jobs / elapsed, 3),
+        "job_p50_seconds": round(statistics.median(latencies), 3),
+        "job_p95_seconds": round(percentile(latencies, 0.95), 3),
+        "peak_rss_mb": round(peak_rss_kb() / 1024, 1),
+        "peak_rss_delta_mb": round((peak_rss_kb() - baseline_rss) / 1024, 1),
+        "avg_input_kb": round(byte_totals.get("job_input", 0) / jobs / 1024, 1),
+        "avg_output_kb": round(byte_totals.get("job_output", 0) / jobs / 1024, 1),
+        "webui_request_kb": round(byte_totals.get("webui_request", 0) / 1024, 1),
+        "webui_response_kb": round(byte_totals.get("webui_response", 0) / 1024, 1),
+        "stages": handler.stage_metrics.summary()
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stubs(count, step_seconds, image_size):
+    """One stub WebUI process per simulated GPU; returns (processes, urls)"""
+    processes, urls = [], []
+    for _ in range(count):
+        port = free_port()
+        command = [sys.executable, os.path.join(BENCH_DIR, "stub_webui.py"), "--port", str(port), "--step-seconds", str(step_seconds)]
+        if image_size:
+            command += ["--image-size", image_size]
+        processes.append(subprocess.Popen(command, stderr=subprocess.DEVNULL))
+        urls.append(f"http://127.0.0.1:{port}")
+    return processes, urls
+
+
+def print_table(results):
+    print(f"{'workload':<14} {'jobs/s':>8} {'p50 s':>8} {'p95 s':>8} {'RSS MB':>8} {'in KB':>9} {'out KB':>9} {'errors':>6}")
+    for r in results:
+        print(f"{r['workload']:<14} {r['jobs_per_second']:>8} {r['job_p50_seconds']:>8} {r['job_p95_seconds']:>8} "
+              f"{r['peak_rss_mb']:>8} {r['avg_input_kb']:>9} {r['avg_output_kb']:>9} {r['errors']:>6}")
+
+    print(f"\n{'stage p50/p95/p99 ms':<22}" + "".join(f"{name:>22}" for name in [r["workload"] for r in results]))
+    for stage in REPORTED_STAGES:
+        cells = []
+        for r in results:
+            s = r["stages"].get(stage)
+            cells.append(f"{s['p50'] * 1000:.1f}/{s['p95'] * 1000:.1f}/{s['p99'] * 1000:.1f}" if s else "-")
+        print(f"{stage:<22}" + "".join(f"{cell:>22}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workloads", default=",".join(WORKLOADS), help="comma-separated corpus workloads")
+    parser.add_argument("--jobs", type=int, default=3, help="jobs per workload")
+    parser.add_argument("--concurrency", type=int, default=1, help="jobs run at once (JOB_CONCURRENCY)")
+    parser.add_argument("--backends", type=int, default=1, help="stub WebUIs, one per simulated GPU")
+    parser.add_argument("--step-seconds", type=float, default=0.005, help="stub time per sampler step")
+    parser.add_argument("--image-size", help="WxH of stub images (default: requested size)")
+    parser.add_argument("--photo-size", default="3024x4032", help="WxH of the corpus reference photos")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_workload(args.worker, args.corpus_file, args.jobs, args.concurrency)))
+        return
+
+    workloads = [name for name in args.workloads.split(",") if name]
+    unknown = set(workloads) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"unknown workloads: {', '.join(sorted(unknown))}")
+
+    photo_width, photo_height = (int(v) for v in args.photo_size.lower().split("x"))
+    stubs, urls = start_stubs(args.backends, args.step_seconds, args.image_size)
+    results = []
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            corpus_file = os.path.join(tmp, "corpus.json")
+            with open(corpus_file, "w") as f:
+                json.dump(build_corpus((photo_width, photo_height)), f)
+
+            for name in workloads:
+                print(f"Running {name}...", file=sys.stderr)
+                env = dict(
+                    os.environ,
+                    WEBUI_URLS=",".join(urls),
+                    WORKER_CACHE_DIR=os.path.join(tmp, f"cache-{name}"),
+                    LORA_DIRS=os.path.join(tmp, "loras"),
+                    PROVISION_LORAS_AT_STARTUP="false",
+                    WARMUP_ENABLED="false",
+                    JOB_CONCURRENCY=str(args.concurrency),
+                    STARTUP_TIMEOUT="60"
+                )
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", name, "--corpus-file", corpus_file,
+                     "--jobs", str(args.jobs), "--concurrency", str(args.concurrency)],
+                    check=True, capture_output=True, text=True, env=env
+                ).stdout
+                results.append(json.loads(output.strip().splitlines()[-1]))
+    finally:
+        for stub in stubs:
+            stub.terminate()
+
+    print_table(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
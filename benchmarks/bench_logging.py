@@ -0,0 +1,120 @@
+"""
+Microbenchmark for handler-side logging overhead per scene
+
+Replays the log lines the handler writes for each story scene (queueing,
+an inference debug line, completion, and every 100th scene a failed
+inference with a large WebUI error body) and measures the time the calling
+thread spends in logging. Variants:
+
+    sync_text           RunPod's default root handler, formatting and writing inline
+    queue_json          logs.configure_logging: JSON records written by a background thread
+    queue_json_sampled  as queue_json with LOG_SCENE_SAMPLE_RATE=0.1
+
+Each variant runs in a fresh subprocess and writes to a file. Scenes are
+--scene-gap-ms apart (untimed), standing in for the WebUI round trip during
+which a real worker's writer thread catches up. "drain ms" is the time the
+writer thread needs after the last record.
+
+Usage:
+    python benchmarks/bench_logging.py --scenes 2000
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+VARIANTS = {
+    "sync_text": {},
+    "queue_json": {"LOG_SCENE_SAMPLE_RATE": "1.0"},
+    "queue_json_sampled": {"LOG_SCENE_SAMPLE_RATE": "0.1"},
+}
+ERROR_BODY = "x" * 200_000
+
+
+def run_variant(variant, scenes, log_path, scene_gap):
+    """Log `scenes` scenes' worth of lines; runs inside its own subprocess"""
+    import logs
+
+    stream = open(log_path, "w")
+    if variant == "sync_text":
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(logging.Formatter("%(filename)-20s:%(lineno)-4d %(asctime)s %(message)s"))
+        logging.getLogger().handlers = [handler]
+        logging.getLogger().setLevel(logging.INFO)
+    else:
+        logs.configure_logging(stream=stream)
+    logger = logging.getLogger("handler")
+
+    latencies = []
+    for i in range(scenes):
+        start = time.perf_counter()
+        with logs.log_context(job_id="bench", story_id="story_bench", scene_index=i):
+            logger.info(f"Queueing scene {i + 1}/{scenes}: a tiny dragon sleeping on the windowsill, page {i + 1}...")
+            logger.debug("Starting img2img inference")
+            if i % 100 == 99:
+                logger.error(f"Inference failed with status 500: {ERROR_BODY}")
+            else:
+                logger.info("img2img inference completed successfully")
+        latencies.append((time.perf_counter() - start) * 1e6)
+        time.sleep(scene_gap)
+
+    drain_start = time.perf_counter()
+    if variant == "sync_text":
+        stream.flush()
+    else:
+        logs.stop_logging()
+    drain_ms = (time.perf_counter() - drain_start) * 1000
+    stream.close()
+
+    latencies.sort()
+    return {
+        "variant": variant,
+        "scenes": scenes,
+        "mean_us_per_scene": round(statistics.mean(latencies), 2),
+        "p99_us_per_scene": round(latencies[int(len(latencies) * 0.99) - 1], 2),
+        "drain_ms": round(drain_ms, 1),
+        "log_kb": round(os.path.getsize(log_path) / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", type=int, default=2000, help="scenes logged per variant")
+    parser.add_argument("--scene-gap-ms", type=float, default=1.0, help="untimed pause between scenes")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument("--worker", choices=list(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument("--log-path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_variant(args.worker, args.scenes, args.log_path, args.scene_gap_ms / 1000)))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for variant, env in VARIANTS.items():
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", variant, "--scenes", str(args.scenes),
+                 "--scene-gap-ms", str(args.scene_gap_ms), "--log-path", os.path.join(tmp, f"{variant}.log")],
+                check=True, capture_output=True, text=True, env=dict(os.environ, **env)
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'variant':<20} {'mean us/scene':>14} {'p99 us/scene':>13} {'drain ms':>9} {'log KB':>9}")
+    for r in results:
+        print(f"{r['variant']:<20} {r['mean_us_per_scene']:>14} {r['p99_us_per_scene']:>13} {r['drain_ms']:>9} {r['log_kb']:>9}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Microbenchmark for reference image ingest
+
+Compares the legacy path (full decode, LANCZOS to a fixed 768x768, default PNG
+encode) with imaging.ingest_reference_image over a corpus of photos. Each
+variant runs in a fresh subprocess so peak RSS is measured per variant.
+
+Usage:
+    python benchmarks/bench_reference_ingest.py                  # synthetic 12 MP corpus
+    python benchmarks/bench_reference_ingest.py --corpus photos/ # your own JPEG/PNG files
+"""
+import os
+import sys
+import json
+import time
+import base64
+import argparse
+import statistics
+import subprocess
+import tempfile
+from io import BytesIO
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from memory import peak_rss_kb
+
+TARGET_SIZES = {
+    "square_small": (768, 768),
+    "pocket_book": (512, 832),
+    "landscape": (880, 680),
+}
+
+
+def build_synthetic_corpus(directory, count):
+    """Write phone-camera-like photos: 12 MP JPEGs, some rotated via EXIF, one PNG"""
+    from PIL import Image
+
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        width, height = (4032, 3024) if i % 2 == 0 else (3024, 4032)
+        # Noise keeps JPEG sizes and decode cost close to real photos
+        noise = Image.effect_noise((width // 4, height // 4), 40 + i).convert("RGB")
+        image = noise.resize((width, height), Image.Resampling.BILINEAR)
+
+        if i == count - 1:
+            image.save(os.path.join(directory, f"photo_{i}.png"))
+            continue
+
+        exif = image.getexif()
+        exif[0x0112] = 6 if i % 3 == 0 else 1
+        image.save(os.path.join(directory, f"photo_{i}.jpg"), quality=90, exif=exif)
+
+
+def legacy_ingest(image_bytes, target_width, target_height):
+    """process_reference_image before the ingest pipeline, for comparison"""
+    from PIL import Image
+
+    image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    image = image.resize((768, 768), Image.Resampling.LANCZOS)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def run_variant(variant, corpus_dir, repeat):
+    """Time one variant over the corpus; runs inside its own subprocess"""
+    from imaging import ingest_reference_image
+
+    ingest = legacy_ingest if variant == "legacy" else ingest_reference_image
+    files = sorted(
+        os.path.join(corpus_dir, f) for f in os.listdir(corpus_dir)
+        if f.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    photos = [open(path, "rb").read() for path in files]
+
+    baseline_rss = peak_rss_kb()
+    latencies = []
+    output_bytes = 0
+    for _ in range(repeat):
+        for image_bytes in photos:
+            for target_width, target_height in TARGET_SIZES.values():
+                start = time.perf_counter()
+                encoded = ingest(image_bytes, target_width, target_height)
+                latencies.append((time.perf_counter() - start) * 1000)
+                output_bytes += len(encoded)
+
+    latencies.sort()
+    return {
+        "variant": variant,
+        "images": len(photos),
+        "samples": len(latencies),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 1),
+        "mean_ms": round(statistics.mean(latencies), 1),
+        "peak_rss_delta_mb": round((peak_rss_kb() - baseline_rss) / 1024, 1),
+        "avg_output_kb": round(output_bytes / len(latencies) / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="directory of sample photos (default: generate a synthetic corpus)")
+    parser.add_argument("--count", type=int, default=6, help="synthetic photos to generate")
+    parser.add_argument("--repeat", type=int, default=2, help="passes over the corpus per variant")
+    parser.add_argument("--worker", choices=["legacy", "pipeline"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_variant(args.worker, args.corpus, args.repeat)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = os.path.join(tmp, "corpus")
+            print(f"Generating {args.count} synthetic photos...")
+            build_synthetic_corpus(corpus_dir, args.count)
+
+        results = []
+        for variant in ("legacy", "pipeline"):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", variant,
+                 "--corpus", corpus_dir, "--repeat", str(args.repeat)],
+                check=True, capture_output=True, text=True
+            ).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    print(f"{'variant':<10} {'p50 ms':>8} {'p95 ms':>8} {'mean ms':>8} {'peak RSS MB':>12} {'out KB':>8}")
+    for r in results:
+        print(f"{r['variant']:<10} {r['p50_ms']:>8} {r['p95_ms']:>8} {r['mean_ms']:>8} {r['peak_rss_delta_mb']:>12} {r['avg_output_kb']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Microbenchmark for per-scene handler overhead
+
+Times the handler's CPU work for each scene of 5-, 50- and 500-scene
+stories, with no WebUI involved: building the scene request and its result
+cache key. The legacy variant rebuilds the scene settings for every scene
+the way build_single_scene_request did before story plans (format table,
+format logging, prompt, LoRA lookup, init image selection and hashing); the
+plan variant compiles one StoryPlan per story and derives each scene from
+it. Encoding the JSON body sent to the WebUI costs the same in both and is
+reported on its own. Log records are formatted inline to /dev/null, so
+every line a variant logs per scene counts against it.
+
+Usage:
+    python benchmarks/bench_scene_build.py
+    python benchmarks/bench_scene_build.py --scenes 5,50,500 --photos 2 --repeat 5
+"""
+import os
+import sys
+import json
+import time
+import struct
+import hashlib
+import logging
+import argparse
+import statistics
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "src"))
+sys.path.insert(0, BENCH_DIR)
+
+from corpus import SCENES, HEROES, build_reference_photo
+
+
+def legacy_scene_request(handler, scene_prompt, story_config, processed_references, scene_index):
+    """build_single_scene_request before story plans, for comparison"""
+    formats = {name: dict(spec) for name, spec in handler.BOOK_FORMATS.items()}  # rebuilt per call
+    book_format = story_config.get("book_format", "square_small")
+    format_info = formats[book_format]
+    scene_width, scene_height = format_info["scene_gen_size"]
+    handler.logger.info(f"Using book format: {format_info['name']}")
+    handler.logger.info(f"Physical size: {format_info['physical_size_inches'][0]}\" x {format_info['physical_size_inches'][1]}\"")
+    handler.logger.info(f"Generation size: {scene_width}x{scene_height} (aspect ratio: {format_info['aspect_ratio']:.3f})")
+    handler.logger.info(f"Target 300 DPI size: {format_info['physical_size_inches'][0] * 300:.0f} x {format_info['physical_size_inches'][1] * 300:.0f}")
+
+    full_prompt = f"""
+    {scene_prompt}, professional children's book illustration,
+    storybook scene, highly detailed, consistent style,
+    vibrant colors, child-friendly artwork,
+    clean composition, narrative illustration,
+    appealing to children aged 4-8, magical atmosphere,
+    whimsical art style, storytelling illustration,
+    professional book illustration quality,
+    detailed but clear, perfect for children's book,
+    bright and engaging, fantasy storybook art
+    """.strip().replace('\n', ' ')
+    request = {
+        "prompt": full_prompt,
+        "negative_prompt": story_config.get("negative_prompt"),
+        "steps": story_config.get("steps", 45),
+        "cfg_scale": story_config.get("cfg_scale", 7.5),
+        "width": scene_width,
+        "height": scene_height,
+        "sampler_name": story_config.get("sampler_name", "DPM++ 2M Karras"),
+        "seed": story_config["style_seed"],
+        "batch_size": 1,
+        "restore_faces": True,
+        "tiling": False,
+        "do_not_save_samples": True,
+        "do_not_save_grid": True,
+        "enable_hr": True,
+        "hr_scale": 1.2,
+        "hr_upscaler": "R-ESRGAN 4x+",
+        "hr_second_pass_steps": 15
+    }
+    handler.apply_quality(request, story_config.get("quality"))
+    request["_book_format_info"] = {
+        "book_format": book_format,
+        "generation_size": f"{scene_width}x{scene_height}",
+        "format_name": format_info["name"],
+        "aspect_ratio": format_info["aspect_ratio"]
+    }
+    story_style = story_config.get("story_style")
+    if story_style and handler.get_lora_filename(story_style):
+        lora_trigger = f"<lora:{story_style}:{story_config.get('lora_weight', 1.0)}>"
+        request["prompt"] = f"{request['prompt']}, {lora_trigger}"
+        handler.logger.info(f"Added LoRA for style consistency: {lora_trigger}")
+
+    characters = handler.get_scene_characters(story_config.get("scene_characters"), scene_index, len(processed_references))
+    init_image = handler.select_init_image(processed_references, characters, (scene_width, scene_height))
+    if init_image:
+        request["init_images"] = [init_image]
+        request["denoising_strength"] = story_config.get("character_strength", 0.65)
+        request["_characters"] = characters
+        return request, "img2img"
+    return request, "txt2img"
+
+
+def legacy_cache_key(handler, request, method):
+    """get_inference_cache_key before init image digests were memoized"""
+    payload = {k: v for k, v in request.items() if not k.startswith("_")}
+    if "init_images" in payload:
+        payload["init_images"] = [hashlib.sha256(image.encode()).hexdigest() for image in payload["init_images"]]
+    canonical = json.dumps({"method": method, "version": handler.RESULT_CACHE_VERSION, "request": payload}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def run_story(handler, variant, prompts, story_config, processed_references):
+    """Per-scene seconds of building and cache-keying, and of encoding the WebUI body"""
+    body_seconds = 0.0
+    start = time.perf_counter()
+    story_plan = handler.compile_story_plan(story_config) if variant == "plan" else None
+    for i, prompt in enumerate(prompts):
+        if variant == "plan":
+            request, method = handler.build_single_scene_request(
+                prompt, None, story_config, processed_references, i, story_plan=story_plan
+            )
+            handler.get_inference_cache_key(request, method)
+        else:
+            request, method = legacy_scene_request(handler, prompt, story_config, processed_references, i)
+            legacy_cache_key(handler, request, method)
+        built = time.perf_counter()
+        json.dumps({k: v for k, v in request.items() if not k.startswith("_")})
+        body_seconds += time.perf_counter() - built
+    build_seconds = time.perf_counter() - start - body_seconds
+    return build_seconds / len(prompts), body_seconds / len(prompts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenes", default="5,50,500", help="comma-separated story lengths")
+    parser.add_argument("--photos", type=int, default=2, help="reference photos per story (0 for txt2img)")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per story length; the median is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-scene-build-")
+    lora_dir = os.path.join(tmp, "loras")
+    os.makedirs(lora_dir)
+    with open(os.path.join(lora_dir, "picture_book.safetensors"), "wb") as f:
+        f.write(struct.pack("<Q", 2) + b"{}")
+    os.environ.update(WORKER_CACHE_DIR=os.path.join(tmp, "cache"), LORA_DIRS=lora_dir)
+
+    import handler
+
+    # Format log records inline, without printing them
+    logging.getLogger().handlers = [logging.StreamHandler(open(os.devnull, "w"))]
+    for log_handler in logging.getLogger().handlers:
+        log_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    photos = [build_reference_photo(i, (1536, 2048)) for i in range(args.photos)]
+    story_config = handler.build_story_config({
+        "story_style": "picture_book",
+        "story_id": "bench",
+        # Solo scenes and a two-character sheet, cycling through the story
+        "scene_characters": [[0], [1], [0, 1]] * 200 if args.photos >= 2 else None
+    }, "bench")
+    story_config["style_seed"] = handler.get_story_seed("bench")
+    processed_references = handler.preprocess_reference_images(photos, handler.compile_story_plan(story_config).size)
+
+    results = []
+    print(f"{'scenes':>7} {'legacy us/scene':>16} {'plan us/scene':>14} {'speedup':>8} {'body us/scene':>14}")
+    for count in (int(n) for n in args.scenes.split(",") if n):
+        prompts = [SCENES[i % len(SCENES)].format(hero=HEROES[i % len(HEROES)]) + f", page {i + 1}" for i in range(count)]
+        row = {"scenes": count}
+        for variant in ("legacy", "plan"):
+            runs = [run_story(handler, variant, prompts, story_config, processed_references) for _ in range(args.repeat)]
+            row[f"{variant}_us_per_scene"] = round(statistics.median(build for build, _ in runs) * 1e6, 1)
+            row[f"{variant}_body_us_per_scene"] = round(statistics.median(body for _, body in runs) * 1e6, 1)
+        row["speedup"] = round(row["legacy_us_per_scene"] / row["plan_us_per_scene"], 2)
+        results.append(row)
+        print(f"{count:>7} {row['legacy_us_per_scene']:>16} {row['plan_us_per_scene']:>14} {row['speedup']:>7}x {row['plan_body_us_per_scene']:>14}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
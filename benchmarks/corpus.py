@@ -0,0 +1,96 @@
+"""
+Replayable job corpus for handler benchmarks
+
+Deterministic job inputs shaped like production traffic: a book cover, a
+single scene and 5/20/40-scene stories with phone-style reference photos.
+
+Usage:
+    python benchmarks/corpus.py --dump corpus/   # write one <workload>.json per job input
+"""
+import os
+import json
+import base64
+import argparse
+from io import BytesIO
+
+SCENES = [
+    "{hero} wakes up to find a tiny dragon sleeping on the windowsill",
+    "{hero} and the dragon share breakfast pancakes in a sunny kitchen",
+    "{hero} rides a bicycle through the village with the dragon in the basket",
+    "a storm rolls in over the hills while {hero} looks worried",
+    "{hero} builds a blanket fort where the dragon can hide",
+    "the dragon lights a lantern so {hero} can read a map",
+    "{hero} crosses a wobbly rope bridge over a sparkling river",
+    "{hero} meets a wise old owl in a hollow oak tree",
+]
+HEROES = ["Emma", "Noah", "Sophie and her little brother Daan"]
+
+WORKLOADS = ("cover", "single_scene", "story_5", "story_20", "story_40")
+
+
+def build_reference_photo(seed, size=(3024, 4032)):
+    """Base64 JPEG that decodes and resizes like a phone photo"""
+    from PIL import Image
+
+    width, height = size
+    noise = Image.effect_noise((width // 8, height // 8), 30 + seed).convert("RGB")
+    buffer = BytesIO()
+    noise.resize((width, height), Image.Resampling.BILINEAR).save(buffer, format="JPEG", quality=88)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def story_input(scene_count, photos, **overrides):
+    prompts = [
+        SCENES[i % len(SCENES)].format(hero=HEROES[i % len(HEROES)]) + f", page {i + 1}"
+        for i in range(scene_count)
+    ]
+    job_input = {
+        "scene_prompts": prompts,
+        "reference_images": photos,
+        "story_style": "picture_book",
+        "book_format": "square_small",
+        "scene_characters": [[i % len(photos)] for i in range(scene_count)] if photos else None,
+        "steps": 30
+    }
+    job_input.update(overrides)
+    return job_input
+
+
+def build_corpus(photo_size=(3024, 4032), photo_count=2):
+    """Job input per workload name"""
+    photos = [build_reference_photo(i, photo_size) for i in range(photo_count)]
+    return {
+        "cover": {
+            "action": "generate_book_cover",
+            "title": "Emma and the Pocket Dragon",
+            "author": "Benchmark",
+            "story_style": "picture_book",
+            "theme": "friendship",
+            "reference_images": photos[:1]
+        },
+        "single_scene": {
+            "prompt": SCENES[0].format(hero=HEROES[0]),
+            "reference_images": photos[:1],
+            "story_style": "picture_book",
+            "steps": 30
+        },
+        "story_5": story_input(5, photos),
+        "story_20": story_input(20, photos),
+        "story_40": story_input(40, photos, pipeline_depth=3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dump", required=True, help="directory to write the corpus to")
+    args = parser.parse_args()
+
+    os.makedirs(args.dump, exist_ok=True)
+    for name, job_input in build_corpus().items():
+        with open(os.path.join(args.dump, f"{name}.json"), "w") as f:
+            json.dump({"input": job_input}, f)
+        print(f"Wrote {name}.json")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+"""Peak memory of a benchmark process, shared by the benchmarks that report it"""
+import resource
+
+
+def peak_rss_kb():
+    """
+    High-water RSS of this process in KB
+
+    Prefers VmHWM, which starts fresh at exec; ru_maxrss can carry over the
+    parent's peak on Linux.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
@@ -0,0 +1,155 @@
+"""
+Stub Stable Diffusion WebUI for benchmarking the handler without a GPU
+
+Implements the parts of the A1111 API the worker uses: txt2img, img2img,
+options, progress, extra-single-image, refresh-loras, interrupt and skip.
+Generations are serialized like on a single GPU and take
+`--step-seconds` per sampler step (plus hires steps when enabled); interrupt
+and skip end the running one early. Returned images are noise PNGs at the
+requested size (or `--image-size`), so payload sizes match real outputs.
+
+Usage:
+    python benchmarks/stub_webui.py --port 3000 --step-seconds 0.02
+"""
+import sys
+import json
+import base64
+import argparse
+import threading
+from io import BytesIO
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubState:
+    """Generation lock, progress and the encoded image per size"""
+
+    def __init__(self, step_seconds, image_size=None):
+        self.step_seconds = step_seconds
+        self.image_size = image_size
+        self.lock = threading.Lock()
+        self.interrupted = threading.Event()
+        self.step = 0
+        self.steps = 0
+        self.running = False
+        self.generations = 0
+        self._images = {}
+        self._images_lock = threading.Lock()
+
+    def image(self, width, height):
+        """Base64 noise PNG, encoded once per size"""
+        width, height = self.image_size or (width, height)
+        with self._images_lock:
+            if (width, height) not in self._images:
+                from PIL import Image
+
+                # Noise keeps PNG sizes close to a real generation's
+                noise = Image.effect_noise((max(1, width // 4), max(1, height // 4)), 48).convert("RGB")
+                buffer = BytesIO()
+                noise.resize((width, height), Image.Resampling.BILINEAR).save(buffer, format="PNG", compress_level=1)
+                self._images[(width, height)] = base64.b64encode(buffer.getvalue()).decode()
+            return self._images[(width, height)]
+
+    def generate(self, payload):
+        steps = int(payload.get("steps") or 20)
+        if payload.get("enable_hr"):
+            steps += int(payload.get("hr_second_pass_steps") or steps)
+        with self.lock:
+            self.interrupted.clear()
+            self.running, self.step, self.steps = True, 0, steps
+            try:
+                for self.step in range(1, steps + 1):
+                    if self.interrupted.wait(self.step_seconds):
+                        break
+            finally:
+                self.running = False
+                self.generations += 1
+        width, height = int(payload.get("width") or 512), int(payload.get("height") or 512)
+        if payload.get("enable_hr"):
+            scale = float(payload.get("hr_scale") or 2)
+            width, height = int(width * scale), int(height * scale)
+        return {
+            "images": [self.image(width, height)] * int(payload.get("batch_size") or 1),
+            "parameters": {},
+            "info": json.dumps({"seed": payload.get("seed", -1)})
+        }
+
+
+def make_handler(state):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, document, status=200):
+            body = json.dumps(document).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            path = self.path.split("?")[0]
+            if path == "/sdapi/v1/progress":
+                self._send({
+                    "progress": state.step / state.steps if state.running and state.steps else 0.0,
+                    "eta_relative": (state.steps - state.step) * state.step_seconds if state.running else 0.0,
+                    "state": {"sampling_step": state.step, "sampling_steps": state.steps, "job_count": int(state.running)},
+                    "current_image": None
+                })
+            elif path == "/sdapi/v1/options":
+                self._send({"sd_model_checkpoint": "stub.safetensors"})
+            else:
+                self._send({"detail": "Not Found"}, 404)
+
+        def do_POST(self):
+            path = self.path.split("?")[0]
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if path in ("/sdapi/v1/txt2img", "/sdapi/v1/img2img"):
+                self._send(state.generate(payload))
+            elif path == "/sdapi/v1/extra-single-image":
+                self._send({"image": payload.get("image"), "html_info": ""})
+            elif path in ("/sdapi/v1/interrupt", "/sdapi/v1/skip"):
+                state.interrupted.set()
+                self._send({})
+            elif path in ("/sdapi/v1/refresh-loras", "/sdapi/v1/options"):
+                self._send({})
+            else:
+                self._send({"detail": "Not Found"}, 404)
+
+    return StubHandler
+
+
+def start_stub(port=0, step_seconds=0.02, image_size=None):
+    """Serve a stub WebUI on a background thread; returns (server, state)"""
+    state = StubState(step_seconds, image_size)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-webui", daemon=True).start()
+    return server, state
+
+
+def parse_size(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=3000)
+    parser.add_argument("--step-seconds", type=float, default=0.02, help="simulated time per sampler step")
+    parser.add_argument("--image-size", type=parse_size, help="WxH of returned images (default: requested size)")
+    args = parser.parse_args()
+
+    server, _ = start_stub(args.port, args.step_seconds, args.image_size)
+    print(f"Stub WebUI on http://127.0.0.1:{server.server_address[1]}", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
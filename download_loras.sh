@@ -1,94 +1,26 @@
 #!/bin/bash
 
-echo "[INFO] Downloading LoRA models from Hugging Face..."
+# Download the story style LoRAs into a /workspace WebUI install.
+# Thin wrapper around src/provision_loras.py: parallel, resumable downloads
+# verified against src/lora_manifest.json, skipping files already present.
 
-# Create LoRA directory
-mkdir -p /workspace/stable-diffusion-webui/models/Lora
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+# LoRAs go into the first of the colon-separated LORA_DIRS
+export LORA_DIRS="${LORA_DIRS:-/workspace/stable-diffusion-webui/models/Lora}"
+lora_dir="${LORA_DIRS%%:*}"
 
-# Base URL for SouthDistrict/storybook-models
-BASE_URL="https://huggingface.co/SouthDistrict/storybook-models/resolve/main/Lora"
-LORA_DIR="/workspace/stable-diffusion-webui/models/Lora"
+echo "[INFO] Provisioning LoRA models into ${lora_dir}..."
 
-# Array of all available LoRA models
-declare -a LORAS=(
-  "3d_animation"
-  "block_world"
-  "clay_animation"
-  "geometric"
-  "paper_cutout"
-  "picture_book"
-  "soft_anime"
-  "whimsical_watercolor"
-)
+python3 "${SCRIPT_DIR}/src/provision_loras.py" --lora-dir "$lora_dir" --cache-dir "${LORA_CACHE_DIR:-}" "$@"
+status=$?
 
-# Function to download a single LoRA
-download_lora() {
-  local lora_name=$1
-  local filename="${lora_name}.safetensors"
-  local url="${BASE_URL}/${filename}"
-  local output_path="${LORA_DIR}/${filename}"
-  
-  echo "[INFO] Downloading ${filename}..."
-  
-  if [ -f "$output_path" ]; then
-    echo "[SKIP] ${filename} already exists"
-    return 0
-  fi
-  
-  if wget --header="Authorization: Bearer $HUGGINGFACE_TOKEN" \
-    "$url" \
-    -O "$output_path"; then
-    echo "[SUCCESS] ${filename} downloaded successfully"
-    return 0
-  else
-    echo "[ERROR] Failed to download ${filename}"
-    return 1
-  fi
-}
-
-# Download all LoRAs
-successful_downloads=0
-failed_downloads=0
-
-for lora in "${LORAS[@]}"; do
-  if download_lora "$lora"; then
-    ((successful_downloads++))
-  else
-    ((failed_downloads++))
-  fi
-done
-
-# Summary
-echo ""
-echo "[SUMMARY] LoRA download completed:"
-echo "  - Successful: ${successful_downloads}"
-echo "  - Failed: ${failed_downloads}"
-echo "  - Total: ${#LORAS[@]}"
-
-# List downloaded files
-echo ""
-echo "[INFO] Downloaded LoRA files:"
-ls -la "$LORA_DIR"/*.safetensors 2>/dev/null || echo "No LoRA files found"
-
-# Verify all expected files are present
 echo ""
-echo "[VERIFY] Checking all expected LoRAs:"
-all_present=true
-for lora in "${LORAS[@]}"; do
-  filename="${lora}.safetensors"
-  if [ -f "${LORA_DIR}/${filename}" ]; then
-    size=$(du -h "${LORA_DIR}/${filename}" | cut -f1)
-    echo "  ✓ ${filename} (${size})"
-  else
-    echo "  ✗ ${filename} - MISSING"
-    all_present=false
-  fi
-done
+echo "[INFO] LoRA files:"
+ls -la "$lora_dir"/*.safetensors 2>/dev/null || echo "No LoRA files found"
 
-if [ "$all_present" = true ]; then
+if [ $status -eq 0 ]; then
   echo "[SUCCESS] All LoRA models are present and ready to use!"
-  exit 0
 else
   echo "[WARNING] Some LoRA models are missing. Check the download process."
-  exit 1
-fi
\ No newline at end of file
+fi
+exit $status
@@ -0,0 +1,276 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from jobs import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+# One WebUI per GPU; the first URL is the default single-GPU setup
+WEBUI_URLS = [
+    url.strip().rstrip("/") for url in os.getenv("WEBUI_URLS", "http://127.0.0.1:3000").split(",") if url.strip()
+]
+BACKEND_HEALTH_INTERVAL = float(os.getenv("BACKEND_HEALTH_INTERVAL", "10"))
+# Consecutive failed health checks before a backend stops receiving work
+BACKEND_MAX_FAILURES = int(os.getenv("BACKEND_MAX_FAILURES", "2"))
+# How long a request waits for any backend to become healthy again
+BACKEND_FAILOVER_WAIT = float(os.getenv("BACKEND_FAILOVER_WAIT", "120"))
+
+
+class BackendUnavailable(Exception):
+    """No healthy WebUI backend could take a request"""
+
+
+# ---------------------------------------------------------------------------- #
+#                                WebUI Backend                                 #
+# ---------------------------------------------------------------------------- #
+class Backend:
+    """One WebUI instance with its own pooled session and health state"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.api_base = f"{base_url}/sdapi/v1"
+
+        self.session = requests.Session()
+        # Only failed connects are retried here: nothing reached the WebUI yet.
+        # Everything else is retried by BackendPool.post within the job's budget.
+        self.session.mount("http://", HTTPAdapter(
+            pool_maxsize=16,
+            max_retries=Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.1)
+        ))
+        # Health probes must fail fast, so no retries
+        self.probe_session = requests.Session()
+        self.probe_session.mount("http://", HTTPAdapter(max_retries=0))
+
+        # Set once startup has warmed the backend up; health checks skip it until then
+        self.started = False
+        self.healthy = False
+        self.outstanding = 0
+        # Job ids of outstanding requests in dispatch order; the WebUI runs the first
+        self.inflight = OrderedDict()
+        # Held while an interrupt is sent, so the interrupted request cannot finish meanwhile
+        self.interrupt_lock = threading.Lock()
+        # When the WebUI finished its last request; it serves one at a time
+        self.free_at = 0.0
+        self.failures = 0
+        self.last_key = None
+        self.last_job = None
+        self.requests = 0
+        self.errors = 0
+        self.failovers = 0
+        self.last_check = None
+
+    def probe(self, timeout=5):
+        """True if the WebUI API answers"""
+        try:
+            response = self.probe_session.get(f"{self.api_base}/options", timeout=timeout)
+            return response.status_code == 200
+        except requests.exceptions.RequestException:
+            return False
+
+    def stats(self):
+        return {
+            "url": self.base_url,
+            "started": self.started,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "failovers": self.failovers,
+            "consecutive_failures": self.failures,
+            "last_check": self.last_check
+        }
+
+
+# ---------------------------------------------------------------------------- #
+#                                Backend Pool                                  #
+# ---------------------------------------------------------------------------- #
+class BackendPool:
+    """
+    Routes WebUI requests across several backends
+
+    Each request goes to the healthy backend with the fewest outstanding
+    requests, preferring on ties the one that last served the same switch
+    key, then the one that last served the same job. Background health checks take backends out of and back into
+    rotation. A request whose backend dies mid-flight is re-sent to another.
+    """
+
+    def __init__(self, urls=WEBUI_URLS, health_interval=BACKEND_HEALTH_INTERVAL, max_failures=BACKEND_MAX_FAILURES):
+        self.backends = [Backend(url) for url in urls]
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+
+        self._cond = threading.Condition()
+        self._health_thread = None
+
+    def __len__(self):
+        return len(self.backends)
+
+    def healthy_backends(self):
+        return [backend for backend in self.backends if backend.healthy]
+
+    def set_health(self, backend, ok):
+        with self._cond:
+            backend.last_check = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+            if ok:
+                if not backend.healthy:
+                    logger.info(f"Backend {backend.base_url} is healthy")
+                backend.healthy = True
+                backend.failures = 0
+                self._cond.notify_all()
+                return
+
+            backend.failures += 1
+            if backend.healthy and backend.failures >= self.max_failures:
+                logger.warning(f"Backend {backend.base_url} failed {backend.failures} health checks, taking it out of rotation")
+                backend.healthy = False
+
+    def mark_down(self, backend, reason):
+        with self._cond:
+            if backend.healthy:
+                logger.warning(f"Backend {backend.base_url} is down: {reason}")
+            backend.healthy = False
+            backend.failures = max(backend.failures, self.max_failures)
+
+    def check_health(self):
+        """Probe every started backend once"""
+        for backend in self.backends:
+            if backend.started:
+                self.set_health(backend, backend.probe())
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_health()
+            except Exception as e:
+                logger.error(f"Backend health check failed: {e}")
+
+    def start_health_checks(self):
+        if self._health_thread is None:
+            self._health_thread = threading.Thread(target=self._health_loop, name="backend-health", daemon=True)
+            self._health_thread.start()
+
+    def _acquire(self, key, exclude, wait, job_id=None):
+        """Least-loaded healthy backend, waiting up to `wait` seconds for one"""
+        deadline = time.monotonic() + wait
+        with self._cond:
+            while True:
+                candidates = [b for b in self.backends if b.healthy and b not in exclude]
+                if not candidates:
+                    # Everything else is down; retrying a failed backend beats failing the scene
+                    candidates = [b for b in self.backends if b.healthy]
+                if candidates:
+                    backend = min(candidates, key=lambda b: (b.outstanding, b.last_key != key, b.last_job != job_id))
+                    backend.outstanding += 1
+                    backend.requests += 1
+                    backend.last_key = key
+                    backend.last_job = job_id
+                    token = object()
+                    backend.inflight[token] = job_id
+                    return backend, token
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise BackendUnavailable(f"No healthy WebUI backend among {[b.base_url for b in self.backends]}")
+                self._cond.wait(min(remaining, 1.0))
+
+    def _release(self, backend, token):
+        with backend.interrupt_lock, self._cond:
+            backend.outstanding -= 1
+            backend.inflight.pop(token, None)
+            self._cond.notify_all()
+
+    def post(self, path, payload, key=None, timeout=600, failover_wait=BACKEND_FAILOVER_WAIT, job=None):
+        """
+        POST to `<api_base>/<path>` on the least-loaded backend
+
+        Connection failures and gateway errors mark the backend down and the
+        request is re-sent to another healthy backend (or the same one once
+        it recovers). With a JobControl the request timeout and the retries
+        are bounded by the job's remaining time instead of a fixed count, and
+        a stopped job raises JobCancelled instead of retrying.
+        
+        The response gets `service_seconds`: its time at the WebUI minus the
+        time it queued there behind other requests.
+        """
+        tried = []
+        attempts = 0
+        while True:
+            if job:
+                job.raise_if_cancelled()
+            attempts += 1
+            backend, token = self._acquire(
+                key, tried, job.budget(failover_wait) if job else failover_wait, job.job_id if job else None
+            )
+            try:
+                sent_at = time.monotonic()
+                response = backend.session.post(
+                    url=f"{backend.api_base}/{path}", json=payload, timeout=job.request_timeout(timeout) if job else timeout
+                )
+                if response.status_code not in (502, 503, 504):
+                    done = time.monotonic()
+                    with self._cond:
+                        response.service_seconds = done - max(sent_at, backend.free_at)
+                        backend.free_at = done
+                    return response
+                failure = f"HTTP {response.status_code}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                failure = str(e)
+            finally:
+                self._release(backend, token)
+
+            backend.errors += 1
+            self.mark_down(backend, failure)
+            tried.append(backend)
+            if job and job.deadline is not None:
+                if job.remaining() <= 0:
+                    raise JobCancelled(f"deadline reached while retrying {path}: {failure}")
+            elif attempts > len(self.backends):
+                raise BackendUnavailable(f"{path} failed on every backend: {failure}")
+            backend.failovers += 1
+            logger.warning(f"Re-dispatching {path} after {backend.base_url} failed ({failure})")
+
+    def interrupt_job(self, job_id):
+        """
+        Interrupt the WebUI generation of `job_id` on backends where it runs now
+
+        Requests queued behind another job are interrupted by a later call.
+        Returns whether anything was interrupted.
+        """
+        interrupted = False
+        for backend in self.backends:
+            # The running request stays the job's until the interrupt is sent
+            with backend.interrupt_lock:
+                with self._cond:
+                    running = bool(backend.inflight) and next(iter(backend.inflight.values())) == job_id
+                if not running:
+                    continue
+                for endpoint in ("skip", "interrupt"):
+                    try:
+                        backend.probe_session.post(url=f"{backend.api_base}/{endpoint}", timeout=5)
+                    except requests.exceptions.RequestException as e:
+                        logger.warning(f"{endpoint} failed on {backend.base_url}: {e}")
+                interrupted = True
+        return interrupted
+
+    def broadcast(self, path, payload=None, timeout=30):
+        """POST to every healthy backend, ignoring failures"""
+        for backend in self.healthy_backends():
+            try:
+                backend.session.post(url=f"{backend.api_base}/{path}", json=payload, timeout=timeout)
+            except requests.exceptions.RequestException as e:
+                logger.warning(f"{path} failed on {backend.base_url}: {e}")
+
+    def stats(self):
+        with self._cond:
+            return {
+                "backends": [backend.stats() for backend in self.backends],
+                "healthy": len(self.healthy_backends()),
+                "health_interval": self.health_interval
+            }
@@ -0,0 +1,56 @@
+from types import MappingProxyType
+
+DEFAULT_BOOK_FORMAT = "square_small"
+
+
+def _format(name, inches, mm, aspect_ratio, scene_size, cover_size, best_for):
+    return MappingProxyType({
+        "name": name,
+        "physical_size_inches": inches,
+        "physical_size_mm": mm,
+        "aspect_ratio": aspect_ratio,  # width/height ratio
+        "scene_gen_size": scene_size,  # High-res maintaining aspect ratio
+        "cover_gen_size": cover_size,
+        "target_dpi": 300,
+        "best_for": best_for
+    })
+
+
+# ---------------------------------------------------------------------------- #
+#                              Lulu Book Formats                               #
+# ---------------------------------------------------------------------------- #
+# Built once at import and read-only, so every scene of every job shares it
+BOOK_FORMATS = MappingProxyType({
+    "pocket_book": _format(
+        "Pocket Book (4.25\" x 6.875\")", (4.25, 6.875), (108, 175), 0.618,
+        (512, 832), (512, 832), "Pocket-sized children's books, travel books"
+    ),
+    "us_trade": _format(
+        "US Trade (6\" x 9\")", (6, 9), (152, 229), 0.667,  # 2:3 ratio
+        (576, 864), (576, 864), "Standard chapter books, novels"
+    ),
+    "royal": _format(
+        "Royal (6.14\" x 9.21\")", (6.14, 9.21), (156, 234), 0.667,  # Close to 2:3
+        (584, 876), (584, 876), "Premium books, literary works"
+    ),
+    "crown_quarto": _format(
+        "Crown Quarto (7.44\" x 9.69\")", (7.44, 9.69), (189, 246), 0.768,
+        (640, 832), (640, 832), "Academic books, textbooks"
+    ),
+    "us_letter": _format(
+        "US Letter (8.5\" x 11\")", (8.5, 11), (216, 279), 0.773,  # Close to 3:4
+        (680, 880), (680, 880), "Activity books, educational books, workbooks"
+    ),
+    "square_small": _format(
+        "Square Small (8.5\" x 8.5\")", (8.5, 8.5), (216, 216), 1.0,  # Perfect square
+        (768, 768), (768, 768), "Picture books, children's books"
+    ),
+    "landscape": _format(
+        "Landscape (11\" x 8.5\")", (11, 8.5), (279, 216), 1.294,  # 4:3 landscape
+        (880, 680), (880, 680), "Panoramic storybooks, coffee table books"
+    ),
+    "square_large": _format(
+        "Square Large (10\" x 10\")", (10, 10), (254, 254), 1.0,  # Perfect square
+        (896, 896), (896, 896), "Premium picture books, art books"
+    ),
+})
@@ -0,0 +1,283 @@
+import os
+import json
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Persistent caches live on the network volume when one is mounted
+CACHE_ROOT = os.getenv(
+    "WORKER_CACHE_DIR",
+    "/runpod-volume/worker-cache" if os.path.isdir("/runpod-volume") else "/tmp/worker-cache"
+)
+
+
+# ---------------------------------------------------------------------------- #
+#                              Disk LRU Cache                                  #
+# ---------------------------------------------------------------------------- #
+class DiskLRUCache:
+    """
+    Size-bounded LRU of JSON documents on local disk or a network volume
+
+    Entries are stored as `<dir>/<key[:2]>/<key>.json` and written atomically
+    (temp file + rename), so several workers can share one directory. Recency
+    survives restarts through file mtimes, which are bumped on every hit.
+    """
+
+    def __init__(self, directory, max_bytes, name="cache"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.name = name
+        self.enabled = max_bytes > 0
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> size in bytes, oldest first
+        self._total_bytes = 0
+
+        if self.enabled:
+            try:
+                os.makedirs(directory, exist_ok=True)
+                self._load_index()
+            except OSError as e:
+                logger.warning(f"Disabling {name} cache, directory {directory} unusable: {e}")
+                self.enabled = False
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+
+    def _load_index(self):
+        """Rebuild the LRU order from what is already on disk"""
+        found = []
+        for root, _, files in os.walk(self.directory):
+            for filename in files:
+                path = os.path.join(root, filename)
+                if filename.endswith(".tmp"):
+                    # Left behind by a writer that died mid-write
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                    continue
+                if not filename.endswith(".json"):
+                    continue
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                found.append((stat.st_mtime, filename[:-5], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+
+        if found:
+            logger.info(f"{self.name} cache: indexed {len(found)} entries ({self._total_bytes / 1e6:.1f} MB) in {self.directory}")
+        self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries until the cache fits its budget (lock held)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def get(self, key):
+        """Return the cached document for key, or None"""
+        if not self.enabled:
+            return None
+
+        path = self._path(key)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            elif not os.path.exists(path):
+                self.misses += 1
+                return None
+
+        try:
+            with open(path, "rb") as f:
+                raw = f.read()
+            value = json.loads(raw)
+            os.utime(path)
+        except (OSError, ValueError) as e:
+            # Evicted by another worker sharing the volume, or truncated
+            with self._lock:
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+                self.misses += 1
+            logger.debug(f"{self.name} cache: dropping unreadable entry {key}: {e}")
+            return None
+
+        with self._lock:
+            if key not in self._entries:
+                # Written by another worker sharing the volume
+                self._entries[key] = len(raw)
+                self._total_bytes += len(raw)
+                self._evict()
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Store a JSON-serialisable document under key"""
+        if not self.enabled:
+            return False
+
+        data = json.dumps(value, separators=(",", ":")).encode()
+        if len(data) > self.max_bytes:
+            return False
+
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+        except OSError as e:
+            logger.warning(f"{self.name} cache: write failed for {key}: {e}")
+            return False
+
+        with self._lock:
+            previous = self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._total_bytes += len(data) - previous
+            self.writes += 1
+            self._evict()
+        return True
+
+    def stats(self):
+        """Counters for the get_info action"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "directory": self.directory,
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# ---------------------------------------------------------------------------- #
+#                            Memory LRU Cache                                  #
+# ---------------------------------------------------------------------------- #
+class MemoryLRUCache:
+    """In-process LRU of string values bounded by their total size in bytes"""
+
+    def __init__(self, max_bytes, name="cache"):
+        self.max_bytes = max_bytes
+        self.name = name
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> value, oldest first
+        self._total_bytes = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = len(value)
+        if size > self.max_bytes:
+            return False
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= len(previous)
+            self._entries[key] = value
+            self._total_bytes += size
+
+            while self._total_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= len(evicted)
+                self.evictions += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# ---------------------------------------------------------------------------- #
+#                              Tiered Cache                                    #
+# ---------------------------------------------------------------------------- #
+class TieredStringCache:
+    """
+    Memory LRU in front of a disk LRU for string values
+
+    Disk hits are promoted to memory; writes go to both tiers so the value
+    survives worker restarts when the disk tier sits on a network volume.
+    """
+
+    def __init__(self, memory, disk):
+        self.memory = memory
+        self.disk = disk
+
+    def get(self, key):
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        document = self.disk.get(key)
+        if document is None:
+            return None
+
+        value = document["value"]
+        self.memory.put(key, value)
+        return value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        self.disk.put(key, {"value": value})
+
+    def stats(self):
+        memory = self.memory.stats()
+        disk = self.disk.stats()
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + disk["hits"]
+        return {
+            "memory": memory,
+            "disk": disk,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0
+        }
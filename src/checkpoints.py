@@ -0,0 +1,86 @@
+import os
+import json
+import time
+import hashlib
+import logging
+
+from cache import CACHE_ROOT, DiskLRUCache
+
+logger = logging.getLogger(__name__)
+
+# Job settings that change how a job runs but not what a scene looks like
+_VOLATILE_KEYS = {"job_id", "stream", "pipeline_depth", "use_cache", "reproducible", "resume", "deadline_seconds"}
+
+
+# ---------------------------------------------------------------------------- #
+#                             Scene Checkpoints                                #
+# ---------------------------------------------------------------------------- #
+class SceneCheckpoints:
+    """
+    Finished story scenes, keyed by story_id and scene index
+
+    Lives on the network volume when one is mounted, so a retried or
+    resubmitted story skips the scenes that already finished. Each checkpoint
+    is tied to a fingerprint of the scene prompt, the story settings and the
+    reference images; changing any of them renders the scene again.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.resumed = 0
+        self.saved = 0
+
+    @staticmethod
+    def story_fingerprint(story_config, processed_references=None):
+        """Hash of everything story-wide that determines a scene's output"""
+        settings = {k: v for k, v in story_config.items() if k not in _VOLATILE_KEYS}
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+        for reference in processed_references or []:
+            digest.update(hashlib.sha256((reference or "").encode()).digest())
+        return digest.hexdigest()
+
+    @staticmethod
+    def _key(story_id, scene_index, scene_prompt, fingerprint):
+        return hashlib.sha256(f"{story_id}|{scene_index}|{fingerprint}|{scene_prompt}".encode()).hexdigest()
+
+    def get(self, story_id, scene_index, scene_prompt, fingerprint):
+        """The checkpointed scene result, or None, without counting a resume"""
+        document = self.store.get(self._key(story_id, scene_index, scene_prompt, fingerprint))
+        return document["scene"] if document else None
+
+    def load(self, story_id, scene_index, scene_prompt, fingerprint):
+        """The checkpointed scene result to resume from, or None"""
+        scene = self.get(story_id, scene_index, scene_prompt, fingerprint)
+        if scene is not None:
+            self.resumed += 1
+        return scene
+
+    def save(self, story_id, scene_index, scene_prompt, fingerprint, scene_result):
+        """Checkpoint a successfully rendered scene"""
+        if "error" in scene_result:
+            return
+        scene = {k: v for k, v in scene_result.items() if not k.startswith("_")}
+        self.store.put(self._key(story_id, scene_index, scene_prompt, fingerprint), {
+            "story_id": story_id,
+            "scene_index": scene_index,
+            "saved_at": time.time(),
+            "scene": scene
+        })
+        self.saved += 1
+
+    def save_preview(self, story_id, document):
+        """Record what a preview run rendered, for finalize to reproduce"""
+        self.store.put(hashlib.sha256(f"preview|{story_id}".encode()).hexdigest(), {**document, "saved_at": time.time()})
+
+    def load_preview(self, story_id):
+        return self.store.get(hashlib.sha256(f"preview|{story_id}".encode()).hexdigest())
+
+    def stats(self):
+        return {"resumed": self.resumed, "saved": self.saved, "store": self.store.stats()}
+
+
+scene_checkpoints = SceneCheckpoints(DiskLRUCache(
+    os.getenv("CHECKPOINT_DIR", os.path.join(CACHE_ROOT, "checkpoints")),
+    int(os.getenv("CHECKPOINT_MAX_BYTES", str(4 * 1024**3))),
+    name="checkpoint"
+))
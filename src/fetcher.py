@@ -0,0 +1,238 @@
+import os
+import time
+import base64
+import socket
+import hashlib
+import logging
+import ipaddress
+import threading
+from urllib.parse import urljoin, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter, Retry
+
+from cache import CACHE_ROOT, DiskLRUCache
+from storage import BUCKET_NAME, get_image_sink
+
+logger = logging.getLogger(__name__)
+
+FETCH_WORKERS = int(os.getenv("FETCH_WORKERS", "8"))
+FETCH_TIMEOUT = int(os.getenv("FETCH_TIMEOUT", "30"))
+FETCH_MAX_BYTES = int(os.getenv("FETCH_MAX_BYTES", str(50 * 1024**2)))
+# Cached copies younger than this are used without asking the origin at all
+FETCH_REVALIDATE_SECONDS = int(os.getenv("FETCH_REVALIDATE_SECONDS", "300"))
+FETCH_MAX_REDIRECTS = int(os.getenv("FETCH_MAX_REDIRECTS", "3"))
+
+# Hosts reference URLs may point at ("images.example.com", ".example.com" for
+# subdomains); empty allows any public host. Private, loopback and link-local
+# addresses are always refused.
+REFERENCE_URL_ALLOWED_HOSTS = [
+    host.strip().lower() for host in os.getenv("REFERENCE_URL_ALLOWED_HOSTS", "").split(",") if host.strip()
+]
+# Buckets reference object keys may be read from (default: BUCKET_NAME only)
+REFERENCE_BUCKETS = [
+    bucket.strip() for bucket in os.getenv("REFERENCE_BUCKETS", BUCKET_NAME or "").split(",") if bucket.strip()
+]
+
+# One pooled session for every reference download
+fetch_session = requests.Session()
+fetch_session.mount("http://", HTTPAdapter(
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+fetch_session.mount("https://", HTTPAdapter(
+    pool_maxsize=FETCH_WORKERS,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+
+fetch_cache = DiskLRUCache(
+    os.getenv("FETCH_CACHE_DIR", os.path.join(CACHE_ROOT, "fetched")),
+    int(os.getenv("FETCH_CACHE_MAX_BYTES", str(2 * 1024**3))),
+    name="fetch"
+)
+
+_stats_lock = threading.Lock()
+fetch_stats = {"downloads": 0, "not_modified": 0, "fresh_hits": 0, "bytes_downloaded": 0}
+
+
+def _count(stat, amount=1):
+    with _stats_lock:
+        fetch_stats[stat] += amount
+
+
+class ReferenceNotAllowed(ValueError):
+    """A reference image URL or bucket is outside the allowed sources"""
+
+
+def check_url_allowed(url):
+    """Raise ReferenceNotAllowed unless url is http(s) on an allowed, public host"""
+    parts = urlsplit(url)
+    host = (parts.hostname or "").lower()
+    if parts.scheme not in ("http", "https") or not host:
+        raise ReferenceNotAllowed(f"Reference URL {url[:80]} is not an http(s) URL")
+    if REFERENCE_URL_ALLOWED_HOSTS and not any(
+        host == allowed or (allowed.startswith(".") and host.endswith(allowed)) for allowed in REFERENCE_URL_ALLOWED_HOSTS
+    ):
+        raise ReferenceNotAllowed(f"Reference host {host} is not in REFERENCE_URL_ALLOWED_HOSTS")
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(host, parts.port or 443, proto=socket.IPPROTO_TCP)}
+    except socket.gaierror as e:
+        raise ReferenceNotAllowed(f"Reference host {host} does not resolve: {e}") from None
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split("%", 1)[0])
+        if not ip.is_global or ip.is_multicast:
+            raise ReferenceNotAllowed(f"Reference host {host} resolves to non-public address {ip}")
+
+
+def check_bucket_allowed(bucket):
+    if bucket not in REFERENCE_BUCKETS:
+        raise ReferenceNotAllowed(f"Reference bucket {bucket} is not in REFERENCE_BUCKETS")
+
+
+# ---------------------------------------------------------------------------- #
+#                           Remote Reference Images                            #
+# ---------------------------------------------------------------------------- #
+def is_remote_reference(entry):
+    """True for reference entries that name an image instead of inlining it"""
+    if isinstance(entry, dict):
+        return "key" in entry or "url" in entry
+    return isinstance(entry, str) and entry.startswith(("http://", "https://", "s3://"))
+
+
+def _cached_copy(cache_key):
+    """Cached document, and whether it is recent enough to skip revalidation"""
+    cached = fetch_cache.get(cache_key)
+    if cached is None:
+        return None, False
+    return cached, time.time() - cached["validated_at"] < FETCH_REVALIDATE_SECONDS
+
+
+def _store(cache_key, data, etag=None, last_modified=None):
+    fetch_cache.put(cache_key, {
+        "etag": etag,
+        "last_modified": last_modified,
+        "validated_at": time.time(),
+        "data": base64.b64encode(data).decode()
+    })
+
+
+def _fetch_http(url):
+    check_url_allowed(url)
+    cache_key = hashlib.sha256(f"http|{url}".encode()).hexdigest()
+    cached, fresh = _cached_copy(cache_key)
+    if fresh:
+        _count("fresh_hits")
+        return base64.b64decode(cached["data"])
+
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    # Redirects are followed by hand so every hop is checked
+    location = url
+    for _ in range(FETCH_MAX_REDIRECTS + 1):
+        response = fetch_session.get(location, headers=headers, timeout=FETCH_TIMEOUT, stream=True, allow_redirects=False)
+        if not response.is_redirect:
+            break
+        response.close()
+        location = urljoin(location, response.headers["Location"])
+        check_url_allowed(location)
+    else:
+        raise ReferenceNotAllowed(f"Reference URL {url[:80]} redirects more than {FETCH_MAX_REDIRECTS} times")
+
+    with response:
+        if response.status_code == 304 and cached:
+            data = base64.b64decode(cached["data"])
+            _store(cache_key, data, cached.get("etag"), cached.get("last_modified"))
+            _count("not_modified")
+            return data
+
+        response.raise_for_status()
+        if int(response.headers.get("Content-Length") or 0) > FETCH_MAX_BYTES:
+            raise ValueError(f"Reference image {url} exceeds {FETCH_MAX_BYTES} bytes")
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(chunk_size=256 * 1024):
+            size += len(chunk)
+            if size > FETCH_MAX_BYTES:
+                raise ValueError(f"Reference image {url} exceeds {FETCH_MAX_BYTES} bytes")
+            chunks.append(chunk)
+        data = b"".join(chunks)
+
+        _store(cache_key, data, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+
+    _count("downloads")
+    _count("bytes_downloaded", len(data))
+    return data
+
+
+def _fetch_s3(bucket, key):
+    check_bucket_allowed(bucket or BUCKET_NAME)
+    sink = get_image_sink(bucket)
+    client = sink.client
+    bucket = sink.bucket
+    cache_key = hashlib.sha256(f"s3|{bucket}|{key}".encode()).hexdigest()
+    cached, fresh = _cached_copy(cache_key)
+    if fresh:
+        _count("fresh_hits")
+        return base64.b64decode(cached["data"])
+
+    if cached and cached.get("etag"):
+        head = client.head_object(Bucket=bucket, Key=key)
+        if head.get("ETag") == cached["etag"]:
+            data = base64.b64decode(cached["data"])
+            _store(cache_key, data, cached["etag"])
+            _count("not_modified")
+            return data
+
+    response = client.get_object(Bucket=bucket, Key=key)
+    if response.get("ContentLength", 0) > FETCH_MAX_BYTES:
+        raise ValueError(f"Reference image s3://{bucket}/{key} exceeds {FETCH_MAX_BYTES} bytes")
+    # ContentLength can be missing; never read more than the cap either way
+    data = response["Body"].read(FETCH_MAX_BYTES + 1)
+    if len(data) > FETCH_MAX_BYTES:
+        raise ValueError(f"Reference image s3://{bucket}/{key} exceeds {FETCH_MAX_BYTES} bytes")
+    _store(cache_key, data, response.get("ETag"))
+
+    _count("downloads")
+    _count("bytes_downloaded", len(data))
+    return data
+
+
+def fetch_reference(entry):
+    """
+    Bytes of a remote reference image
+
+    Accepts an http(s) URL, "s3://bucket/key", or {"key": ..., "bucket": ...}
+    (bucket defaults to BUCKET_NAME) / {"url": ...}. Downloads are cached on
+    disk and revalidated with ETag / Last-Modified. Sources outside
+    REFERENCE_URL_ALLOWED_HOSTS / REFERENCE_BUCKETS raise ReferenceNotAllowed.
+    """
+    start = time.monotonic()
+    if isinstance(entry, dict):
+        if "url" in entry:
+            data = _fetch_http(entry["url"])
+        else:
+            data = _fetch_s3(entry.get("bucket"), entry["key"])
+        source = entry.get("url") or entry.get("key")
+    elif entry.startswith("s3://"):
+        bucket, _, key = entry[len("s3://"):].partition("/")
+        data = _fetch_s3(bucket, key)
+        source = entry
+    else:
+        data = _fetch_http(entry)
+        source = entry
+
+    logger.info(f"Fetched reference image {source[:80]} ({len(data)} bytes) in {time.monotonic() - start:.2f}s")
+    return data
+
+
+def get_fetch_stats():
+    """Counters for the get_info action"""
+    with _stats_lock:
+        stats = dict(fetch_stats)
+    stats["cache"] = fetch_cache.stats()
+    return stats
@@ -1,29 +1,141 @@
 import time
 import runpod
-import requests
 import logging
 import os
 import sys
 import base64
 from io import BytesIO
-from PIL import Image
 import hashlib
-from requests.adapters import HTTPAdapter, Retry
+import inspect
+import functools
+import json
+import uuid
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from PIL import Image
+from cache import CACHE_ROOT, DiskLRUCache, MemoryLRUCache, TieredStringCache
+from storage import CONTENT_TYPES, get_image_sink, is_sink_configured
+from fetcher import fetch_reference, get_fetch_stats, is_remote_reference
+from loras import LORA_DIRS, LoraRegistry
+from scheduler import InferenceScheduler, get_switch_key
+from backends import WEBUI_URLS, BackendPool
+from checkpoints import SceneCheckpoints, scene_checkpoints
+from jobs import JobCancelled, JobWatchdog, cancel_jobs, get_job_control, register_job, unregister_job
+from progress import ProgressReporter
+from metrics import stage_metrics
+from planner import quality_planner
+from book_formats import BOOK_FORMATS
+from logs import bind_log_context, configure_logging, get_logging_stats, iterate_in_context, log_context
+from story_plan import (
+    InvalidJobInput, StoryPlan, apply_quality, build_story_config, check_output_sink, parse_deadline, resolve_book_format
+)
+from imaging import (
+    INIT_IMAGE_FORMAT, OUTPUT_FORMATS, base64_size, compose_character_sheet,
+    decode_image_b64, encode_init_image, encode_output_image,
+    ingest_reference_image, upscale_to_print
+)
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Structured logs written by a background thread (LOG_FORMAT, LOG_LEVEL, LOG_SCENE_SAMPLE_RATE)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-LOCAL_URL = "http://127.0.0.1:3000"
-API_BASE = f"{LOCAL_URL}/sdapi/v1"
+# WebUI instances (one per GPU) with their own sessions and health checks
+backend_pool = BackendPool(WEBUI_URLS)
+
+# Interrupts the GPU work of cancelled and overdue jobs
+job_watchdog = JobWatchdog(backend_pool.interrupt_job)
+
+
+def publish_progress(job, progress):
+    """Send a progress update to RunPod; only deployed workers have somewhere to post it"""
+    logger.debug(f"Job {job.get('id')} progress: {progress}")
+    if os.getenv("RUNPOD_WEBHOOK_POST_OUTPUT"):
+        runpod.serverless.progress_update(job, progress)
+
+
+# Polls the WebUI while jobs run and publishes percent done and ETA
+progress_reporter = ProgressReporter(backend_pool, publish_progress)
+
+# start.sh exports the container start time so time-to-ready covers the whole boot
+WORKER_START_TIME = float(os.getenv("WORKER_START_TIME") or time.time())
+STARTUP_TIMEOUT = int(os.getenv("STARTUP_TIMEOUT", "900"))
+PROVISION_LORAS_AT_STARTUP = os.getenv("PROVISION_LORAS_AT_STARTUP", "true").lower() == "true"
+
+# Warm-up generations run before the first job is accepted
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_BOOK_FORMATS = [f for f in os.getenv("WARMUP_BOOK_FORMATS", "square_small,pocket_book,landscape").split(",") if f]
+WARMUP_LORA = os.getenv("WARMUP_LORA", "picture_book")
+WARMUP_STEPS = int(os.getenv("WARMUP_STEPS", "2"))
+
+# RunPod decides per handler function, not per job, whether results stream. With
+# STREAM_RESULTS the handler is a generator and /run returns a list of partials
+# for every job; without it each job returns one dict and "stream" is ignored.
+STREAM_RESULTS = os.getenv("STREAM_RESULTS", "false").lower() == "true"
+# Collect streamed partials into the /run and /runsync output. Disable when all
+# clients consume /stream so the worker does not keep every image until job end.
+RETURN_AGGREGATE_STREAM = os.getenv("RETURN_AGGREGATE_STREAM", "true").lower() == "true"
+
+# Number of story scenes kept in flight against the WebUI (1 = strictly serial)
+SCENE_PIPELINE_DEPTH = int(os.getenv("SCENE_PIPELINE_DEPTH", "2"))
+
+# How far a finalized scene may move away from its preview when it starts from it
+FINALIZE_DENOISING_STRENGTH = float(os.getenv("FINALIZE_DENOISING_STRENGTH", "0.45"))
+# Job settings finalize takes from its own input instead of the preview's
+FINALIZE_OVERRIDES = (
+    "pipeline_depth", "resume", "use_cache", "print_finalize", "print_upscaler", "output_format",
+    "output_quality", "output_compress_level", "thumbnail_size", "output_sink", "output_bucket",
+    "output_prefix", "presign_urls"
+)
 
-automatic_session = requests.Session()
-retries = Retry(total=10, backoff_factor=0.1, status_forcelist=[502, 503, 504])
-automatic_session.mount('http://', HTTPAdapter(max_retries=retries))
+# Bytes of a failed WebUI response kept for the log and the error's details
+WEBUI_ERROR_DETAIL_BYTES = int(os.getenv("WEBUI_ERROR_DETAIL_BYTES", "500"))
 
-# Cache for processed reference images and style consistency
-reference_image_cache = {}
-story_style_seed = None
+# Generated images keyed by the canonical inference request.
+# Bump RESULT_CACHE_VERSION after changing the base model or LoRA files.
+RESULT_CACHE_VERSION = os.getenv("RESULT_CACHE_VERSION", "1")
+result_cache = DiskLRUCache(
+    os.getenv("RESULT_CACHE_DIR", os.path.join(CACHE_ROOT, "results")),
+    int(os.getenv("RESULT_CACHE_MAX_BYTES", str(2 * 1024**3))),
+    name="result"
+)
+
+# Processed reference images keyed by decoded image content: a byte-budgeted
+# memory LRU in front of a disk tier that survives across jobs
+reference_image_cache = TieredStringCache(
+    MemoryLRUCache(int(os.getenv("REFERENCE_CACHE_MEMORY_BYTES", str(256 * 1024**2))), name="reference"),
+    DiskLRUCache(
+        os.getenv("REFERENCE_CACHE_DIR", os.path.join(CACHE_ROOT, "references")),
+        int(os.getenv("REFERENCE_CACHE_DISK_BYTES", str(1024**3))),
+        name="reference"
+    )
+)
+
+# Threads used to decode and normalize a job's reference images up front
+REFERENCE_PREPROCESS_WORKERS = int(os.getenv("REFERENCE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Shared pool for re-encoding generated images; Pillow releases the GIL while encoding
+OUTPUT_ENCODE_WORKERS = int(os.getenv("OUTPUT_ENCODE_WORKERS", str(min(4, os.cpu_count() or 1))))
+output_encode_pool = ThreadPoolExecutor(max_workers=OUTPUT_ENCODE_WORKERS, thread_name_prefix="encode")
+
+# Jobs RunPod runs at once. Their WebUI requests are ordered by the
+# scheduler, which groups requests that need the same LoRA, size and sampler.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "1"))
+inference_scheduler = InferenceScheduler(
+    slots=int(os.getenv("SCHEDULER_BACKEND_SLOTS", "2")) * len(backend_pool),
+    max_bypass=int(os.getenv("SCHEDULER_MAX_BYPASS", "4"))
+)
+active_jobs = 0
+
+
+def refresh_webui_loras(added, removed):
+    """Let the WebUI pick up LoRAs added to or removed from disk while running"""
+    backend_pool.broadcast("refresh-loras")
+
+
+# Installed LoRAs, scanned once here and refreshed when the directories change
+lora_registry = LoraRegistry(LORA_DIRS, on_change=refresh_webui_loras)
 
 # ---------------------------------------------------------------------------- #
 #                              Dependency Checks                              #
@@ -49,21 +161,10 @@ def check_dependencies():
     
     logger.info(f"Found WebUI at: {webui_path}")
     
-    lora_dirs = [
-        "/workspace/stable-diffusion-webui/models/Lora",
-        "/stable-diffusion-webui/models/Lora"
-    ]
-    
-    lora_dir_found = False
-    for lora_dir in lora_dirs:
-        if os.path.exists(lora_dir):
-            lora_count = len([f for f in os.listdir(lora_dir) if f.endswith('.safetensors')])
-            logger.info(f"Found LoRA directory: {lora_dir} with {lora_count} LoRA files")
-            lora_dir_found = True
-            break
-    
-    if not lora_dir_found:
-        logger.warning("No LoRA directory found, will create when needed")
+    if lora_registry.names():
+        logger.info(f"Found {len(lora_registry.names())} LoRAs: {', '.join(lora_registry.names())}")
+    else:
+        logger.warning(f"No LoRAs installed in any of: {LORA_DIRS}")
     
     logger.info("Dependencies check completed")
     return True
@@ -72,80 +173,270 @@ def check_dependencies():
 # ---------------------------------------------------------------------------- #
 #                              Service Functions                              #
 # ---------------------------------------------------------------------------- #
-def wait_for_service(url, max_retries=300, retry_interval=2):
-    """Check if the service is ready to receive requests."""
-    health_check_url = f"{url}/sdapi/v1/options"
-    logger.info(f"Waiting for WebUI API service at {health_check_url}")
+def wait_for_service(backend, timeout=STARTUP_TIMEOUT, initial_interval=0.25, max_interval=5.0):
+    """
+    Wait until a WebUI backend answers, probing with exponential backoff
+
+    Probes start a quarter second apart, so a fast boot is noticed at once,
+    and back off to max_interval so a slow one is not hammered.
+    """
+    logger.info(f"Waiting for WebUI API service at {backend.api_base}")
     
-    for attempt in range(max_retries):
-        try:
-            response = requests.get(health_check_url, timeout=10)
-            if response.status_code == 200:
-                logger.info("WebUI API service is ready!")
-                return True
-                
-        except requests.exceptions.ConnectionError:
-            if attempt % 15 == 0:
-                logger.info(f"Service not ready yet. Attempt {attempt + 1}/{max_retries}")
-        except requests.exceptions.Timeout:
-            logger.warning(f"Timeout waiting for service. Attempt {attempt + 1}/{max_retries}")
-        except Exception as err:
-            logger.error(f"Unexpected error checking service: {err}")
-        
-        time.sleep(retry_interval)
-    
-    logger.error(f"Service failed to start after {max_retries * retry_interval} seconds")
+    start = time.monotonic()
+    interval = initial_interval
+    attempt = 0
+    while time.monotonic() - start < timeout:
+        attempt += 1
+        if backend.probe(timeout=10):
+            logger.info(f"WebUI API at {backend.base_url} is ready after {time.monotonic() - start:.1f}s ({attempt} probes)")
+            return True
+        
+        if attempt % 10 == 0:
+            logger.info(f"{backend.base_url} not ready yet after {time.monotonic() - start:.0f}s ({attempt} probes)")
+        time.sleep(interval)
+        interval = min(interval * 2, max_interval)
+    
+    logger.error(f"{backend.base_url} failed to start after {timeout} seconds")
     return False
 
 
-def validate_webui_startup():
-    """Validate that WebUI is starting with correct parameters."""
-    logger.info("Validating WebUI startup configuration...")
-    try:
-        response = requests.get(f"{LOCAL_URL}/internal/ping", timeout=5)
-        logger.info("WebUI internal ping successful")
-    except Exception:
-        logger.warning("WebUI internal ping failed, but this might be normal")
+# ---------------------------------------------------------------------------- #
+#                            Startup Orchestration                             #
+# ---------------------------------------------------------------------------- #
+startup_state = {
+    "phase": "starting",
+    "ready": threading.Event(),
+    "lora_provisioning_seconds": None,
+    "webui_ready_seconds": None,
+    "warmup_seconds": None,
+    "time_to_ready_seconds": None,
+    "warmup": [],
+    "error": None
+}
+
+
+def since_worker_start():
+    return round(time.time() - WORKER_START_TIME, 2)
+
+
+def provision_loras_at_startup():
+    """Provision LoRAs while the WebUI boots; returns whether all succeeded"""
+    from provision_loras import provision_loras
+    
+    summary = provision_loras()
+    startup_state["lora_provisioning_seconds"] = since_worker_start()
+    if summary["failed"]:
+        logger.warning("Some LoRAs failed to provision - affected styles fall back to the base model")
+    lora_registry.refresh()
+    return summary["failed"] == 0
+
+
+def get_warmup_sizes():
+    """Distinct generation sizes of the warm-up book formats"""
+    formats = get_lulu_book_formats()
+    sizes = []
+    for book_format in WARMUP_BOOK_FORMATS:
+        if book_format not in formats:
+            logger.warning(f"Unknown warm-up book format: {book_format}")
+            continue
+        for size in (formats[book_format]["scene_gen_size"], formats[book_format]["cover_gen_size"]):
+            if tuple(size) not in sizes:
+                sizes.append(tuple(size))
+    return sizes
+
+
+def run_warmup(backend):
+    """
+    Run tiny generations so the first job on a backend does not pay for cold start
+
+    One txt2img per warm-up resolution with the default LoRA, face restoration
+    and the hires-fix upscaler, plus one img2img, loads the LoRA, the
+    auxiliary models and the CUDA / cuDNN kernels for those shapes.
+    """
+    lora = get_lora_filename(WARMUP_LORA) if WARMUP_LORA else None
+    prompt = "children's book illustration" + (f", <lora:{lora}:1.0>" if lora else "")
+    
+    for index, (width, height) in enumerate(get_warmup_sizes()):
+        request = {
+            "prompt": prompt,
+            "steps": WARMUP_STEPS,
+            "width": width,
+            "height": height,
+            "sampler_name": "DPM++ 2M Karras",
+            "seed": 1,
+            "restore_faces": True,
+            "enable_hr": True,
+            "hr_scale": 1.2,
+            "hr_upscaler": "R-ESRGAN 4x+",
+            "hr_second_pass_steps": 1,
+            "do_not_save_samples": True,
+            "do_not_save_grid": True
+        }
+        methods = ["txt2img"]
+        if index == 0:
+            methods.append("img2img")
+        
+        for method in methods:
+            payload = dict(request)
+            if method == "img2img":
+                payload["init_images"] = [encode_init_image(Image.new("RGB", (width, height), (128, 128, 128)))]
+                payload["denoising_strength"] = 0.5
+                payload.pop("enable_hr")
+            
+            start = time.monotonic()
+            try:
+                response = backend.session.post(url=f"{backend.api_base}/{method}", json=payload, timeout=600)
+                response.raise_for_status()
+                ok = True
+            except Exception as e:
+                logger.warning(f"Warm-up {method} at {width}x{height} on {backend.base_url} failed: {e}")
+                ok = False
+            
+            seconds = round(time.monotonic() - start, 2)
+            startup_state["warmup"].append({
+                "backend": backend.base_url, "method": method, "size": f"{width}x{height}", "seconds": seconds, "ok": ok
+            })
+            logger.info(f"Warm-up {method} at {width}x{height} on {backend.base_url} took {seconds}s")
+
+
+def bring_up_backend(backend, provisioning=None):
+    """Wait for one WebUI, warm it up and put it into rotation"""
+    if not wait_for_service(backend):
+        return False
+    if startup_state["webui_ready_seconds"] is None:
+        startup_state["webui_ready_seconds"] = since_worker_start()
+    
+    if provisioning:
+        provisioning.result()
+        # The WebUI may have listed the Lora directory before the downloads finished
+        try:
+            backend.session.post(url=f"{backend.api_base}/refresh-loras", timeout=30)
+        except Exception as e:
+            logger.warning(f"refresh-loras failed on {backend.base_url}: {e}")
+    
+    if WARMUP_ENABLED:
+        if not startup_state["ready"].is_set():
+            startup_state["phase"] = "warming_up"
+        warmup_start = time.monotonic()
+        run_warmup(backend)
+        if startup_state["warmup_seconds"] is None:
+            startup_state["warmup_seconds"] = round(time.monotonic() - warmup_start, 2)
+    
+    backend.started = True
+    backend_pool.set_health(backend, True)
     return True
 
 
+def orchestrate_startup():
+    """
+    Bring the backends up behind an already registered handler
+    
+    LoRA provisioning and the WebUI boots overlap. Each WebUI rescans its
+    LoRAs and is warmed up before it joins the pool; held jobs are released
+    as soon as the first one has, and the rest join as they come up.
+    """
+    try:
+        provisioning = None
+        if PROVISION_LORAS_AT_STARTUP:
+            startup_state["phase"] = "provisioning_loras"
+            provisioning = ThreadPoolExecutor(max_workers=1, thread_name_prefix="provision").submit(provision_loras_at_startup)
+        
+        startup_state["phase"] = "waiting_for_webui"
+        bring_up = ThreadPoolExecutor(max_workers=len(backend_pool), thread_name_prefix="bring-up")
+        futures = [bring_up.submit(bring_up_backend, backend, provisioning) for backend in backend_pool.backends]
+        if not any(future.result() for future in as_completed(futures)):
+            raise RuntimeError(f"No WebUI API came up within {STARTUP_TIMEOUT}s")
+        backend_pool.start_health_checks()
+        
+        startup_state["phase"] = "ready"
+        startup_state["time_to_ready_seconds"] = since_worker_start()
+        milestones = [
+            f"{label} {startup_state[key]}s" for label, key in (
+                ("WebUI", "webui_ready_seconds"),
+                ("LoRAs", "lora_provisioning_seconds"),
+                ("warm-up", "warmup_seconds")
+            ) if startup_state[key] is not None
+        ]
+        logger.info(f"Worker ready {startup_state['time_to_ready_seconds']}s after start ({', '.join(milestones)})")
+    
+    except Exception as e:
+        logger.error(f"Startup failed: {e}")
+        startup_state["phase"] = "failed"
+        startup_state["error"] = str(e)
+    
+    finally:
+        startup_state["ready"].set()
+
+
+def wait_until_ready():
+    """Hold a job until startup finishes; returns an error message if it failed"""
+    if not startup_state["ready"].wait(STARTUP_TIMEOUT):
+        return f"Worker not ready after {STARTUP_TIMEOUT}s (phase: {startup_state['phase']})"
+    if startup_state["error"]:
+        return f"Worker failed to start: {startup_state['error']}"
+    return None
+
+
+def get_startup_info():
+    """Startup phase and timings for the get_info action"""
+    info = {key: value for key, value in startup_state.items() if key != "ready"}
+    info["seconds_since_start"] = since_worker_start()
+    return info
+
+
 # ---------------------------------------------------------------------------- #
 #                        Story Generation Functions                            #
 # ---------------------------------------------------------------------------- #
-def get_image_hash(image_data):
-    """Generate hash for image data to use as cache key"""
+def decode_image_data(image_data):
+    """
+    Raw bytes of a reference image entry
+    
+    Entries are base64 (with or without data-URI prefix, whitespace or padding),
+    http(s) URLs, "s3://bucket/key" or {"key": ..., "bucket": ...} objects.
+    """
+    if is_remote_reference(image_data):
+        return fetch_reference(image_data)
+    
     if image_data.startswith('data:image'):
-        image_data = image_data.split(',')[1]
-    return hashlib.md5(image_data.encode()).hexdigest()
+        image_data = image_data.split(',', 1)[1]
+    image_data = "".join(image_data.split())
+    image_data += "=" * (-len(image_data) % 4)
+    return base64.b64decode(image_data)
+
+
+def get_image_hash(image_bytes):
+    """Generate hash of decoded image bytes to use as cache key"""
+    return hashlib.sha256(image_bytes).hexdigest()
 
 
-def process_reference_image(image_data, character_index=0):
-    """Process reference image for character consistency"""
+def process_reference_image(image_data, character_index=0, target_size=(768, 768)):
+    """
+    Process reference image for character consistency
+    
+    The photo is cropped and resized straight to the generation size of the
+    scene or cover it feeds, so non-square book formats are not distorted.
+    """
     try:
-        cache_key = f"char_{character_index}_{get_image_hash(image_data)}"
+        start = time.monotonic()
+        image_bytes = decode_image_data(image_data)
+        stage_metrics.observe("reference_decode", time.monotonic() - start)
         
-        if cache_key in reference_image_cache:
-            logger.info(f"Using cached reference image for character {character_index}")
-            return reference_image_cache[cache_key]
-        
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes)).convert('RGB')
+        # Keyed on content only: the same photo is shared by every character
+        # slot and every encoding of it
+        target_width, target_height = target_size
+        cache_key = f"{get_image_hash(image_bytes)}_{target_width}x{target_height}_{INIT_IMAGE_FORMAT}"
         
-        # High resolution sizing for print quality
-        # Use larger dimensions that work well with SDXL/SD models
-        target_size = (768, 768)  # Higher resolution for better print quality
-        image = image.resize(target_size, Image.Resampling.LANCZOS)
+        cached = reference_image_cache.get(cache_key)
+        if cached:
+            logger.info(f"Using cached reference image for character {character_index}")
+            return cached
         
-        buffer = BytesIO()
-        image.save(buffer, format="PNG")
-        processed_b64 = base64.b64encode(buffer.getvalue()).decode()
+        with stage_metrics.timer("reference_ingest"):
+            processed_b64 = ingest_reference_image(image_bytes, target_width, target_height)
         
         # Cache for consistency across scenes
-        reference_image_cache[cache_key] = processed_b64
-        logger.info(f"Cached reference image for character {character_index}")
+        reference_image_cache.put(cache_key, processed_b64)
+        logger.info(f"Cached reference image for character {character_index} at {target_width}x{target_height}")
         
         return processed_b64
         
@@ -154,252 +445,924 @@ def process_reference_image(image_data, character_index=0):
         return None
 
 
-def get_story_seed(story_id=None, reset=False):
+def preprocess_reference_images(reference_images, target_size):
+    """
+    Decode and normalize every reference image of a job in one parallel pass
+    
+    Returns one processed base64 image per input, None where processing failed,
+    so positions keep matching the character indexes used by scenes.
     """
-    Get or generate a consistent seed for the entire story
-    This ensures style consistency across all scenes
+    if not reference_images:
+        return []
+    
+    if len(reference_images) == 1:
+        return [process_reference_image(reference_images[0], 0, target_size)]
+    
+    workers = max(1, min(REFERENCE_PREPROCESS_WORKERS, len(reference_images)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reference") as pool:
+        return list(pool.map(
+            lambda indexed: process_reference_image(indexed[1], indexed[0], target_size),
+            enumerate(reference_images)
+        ))
+
+
+def get_scene_characters(character_map, scene_index, reference_count):
     """
-    global story_style_seed
+    Character indexes appearing in a scene
     
-    if reset or story_style_seed is None:
-        if story_id:
-            # Generate deterministic seed from story_id for reproducibility
-            import hashlib
-            story_style_seed = int(hashlib.md5(story_id.encode()).hexdigest()[:8], 16) % (2**31)
+    character_map holds one entry per scene: an index, a list of indexes, or
+    null for the default. Scenes without an entry use the first reference,
+    matching the behaviour before per-scene mapping existed.
+    """
+    entry = None
+    if character_map and scene_index is not None and scene_index < len(character_map):
+        entry = character_map[scene_index]
+    
+    if entry is None:
+        entry = [0]
+    elif isinstance(entry, int):
+        entry = [entry]
+    
+    characters = []
+    for index in entry:
+        if isinstance(index, int) and 0 <= index < reference_count and index not in characters:
+            characters.append(index)
         else:
-            # Generate random seed but keep it consistent for this story session
-            import random
-            story_style_seed = random.randint(1, 2**31-1)
-        
-        logger.info(f"Generated story seed: {story_style_seed}")
+            logger.warning(f"Ignoring unknown character index {index} for scene {scene_index}")
+    return characters
+
+
+def select_init_image(processed_references, characters, target_size):
+    """Init image for a set of characters: the reference itself, or a character sheet"""
+    images = [processed_references[i] for i in characters if processed_references[i]]
+    if len(images) <= 1:
+        return images[0] if images else None
+    
+    # Sheets are cheap to rebuild but identical for every scene with the same cast
+    sheet_key = "sheet_" + get_image_hash("|".join(get_image_hash(image.encode()) for image in images).encode())
+    sheet_key = f"{sheet_key}_{target_size[0]}x{target_size[1]}_{INIT_IMAGE_FORMAT}"
+    cached = reference_image_cache.get(sheet_key)
+    if cached:
+        return cached
+    
+    sheet = compose_character_sheet([decode_image_b64(image) for image in images], *target_size)
+    sheet_b64 = encode_init_image(sheet)
+    reference_image_cache.put(sheet_key, sheet_b64)
+    logger.info(f"Composed character sheet for characters {characters}")
+    return sheet_b64
+
+
+def get_story_seed(story_id=None):
+    """
+    Generate a consistent seed for the entire story
+    
+    The seed is stored in the job's story_config ("style_seed") so concurrent
+    jobs never share it; the same story_id always gives the same seed.
+    """
+    if story_id:
+        # Generate deterministic seed from story_id for reproducibility
+        story_seed = int(hashlib.md5(story_id.encode()).hexdigest()[:8], 16) % (2**31)
+    else:
+        # Generate random seed, kept in the story config for this job
+        import random
+        story_seed = random.randint(1, 2**31-1)
     
-    return story_style_seed
+    logger.info(f"Generated story seed: {story_seed}")
+    return story_seed
 
 
 def get_available_loras():
-    """Get available LoRA models"""
-    return [
-        "3d_animation",
-        "block_world", 
-        "clay_animation",
-        "geometric",
-        "paper_cutout",
-        "picture_book",
-        "soft_anime",
-        "whimsical_watercolor"
-    ]
+    """Get the LoRA models installed in the WebUI"""
+    return lora_registry.names()
 
 
 def get_lora_filename(lora_name):
-    """Get the actual LoRA filename from available models"""
-    try:
-        lora_dirs = [
-            "/workspace/stable-diffusion-webui/models/Lora",
-            "/stable-diffusion-webui/models/Lora"
-        ]
-        
-        available_loras = get_available_loras()
-        
-        if lora_name in available_loras:
-            lora_filename = f"{lora_name}.safetensors"
-            
-            for lora_dir in lora_dirs:
-                lora_path = os.path.join(lora_dir, lora_filename)
-                if os.path.exists(lora_path):
-                    logger.info(f"Using LoRA: {lora_filename}")
-                    return lora_name
-            
-            logger.warning(f"LoRA file not found: {lora_filename}")
-        
-        return None
-        
-    except Exception as e:
-        logger.error(f"Error getting LoRA filename: {e}")
-        return None
+    """Get the LoRA name to use in the prompt, or None when it is not installed"""
+    if lora_name and lora_name in lora_registry:
+        return lora_name
+
+    logger.warning(f"LoRA not installed: {lora_name}")
+    return None
 
 
 # ---------------------------------------------------------------------------- #
 #                              Inference Functions                            #
 # ---------------------------------------------------------------------------- #
-def run_inference(inference_request, method="img2img"):
-    """Run inference with proper error handling"""
+def get_inference_cache_key(inference_request, method):
+    """
+    Canonical hash of everything that determines the generated image
+    
+    Init images are replaced by their own hashes and handler-only metadata
+    (keys starting with "_") is left out, so identical requests always map to
+    the same key regardless of dict order.
+    """
+    payload = {k: v for k, v in inference_request.items() if not k.startswith("_")}
+    if "init_images" in payload:
+        payload["init_images"] = [get_init_image_digest(image) for image in payload["init_images"]]
+    canonical = json.dumps(
+        {"method": method, "version": RESULT_CACHE_VERSION, "request": payload},
+        sort_keys=True,
+        separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=64)
+def get_init_image_digest(image):
+    """SHA-256 of a base64 init image; a story's scenes share a few init images"""
+    return hashlib.sha256(image.encode()).hexdigest()
+
+
+def run_inference(inference_request, method="img2img", use_cache=False, job_id=None):
+    """
+    Run inference with proper error handling
+    
+    use_cache is for requests whose seed the client chose (see is_cacheable);
+    only those can ever be requested again. The WebUI request waits its turn
+    in the inference scheduler; job_id keeps a job's own requests in order
+    there and bounds the request by the job's deadline. An interrupted
+    generation is reported as an error, not cached.
+    
+    The result carries a "timings" block: scheduler and backend queueing,
+    the WebUI round trip (sampling, hires fix and face restoration) and JSON
+    decoding, plus the request and response sizes.
+    """
+    timings = {}
     try:
-        logger.info(f"Starting {method} inference")
+        # Seed -1 asks for a new image every time
+        cache_key = None
+        if use_cache and inference_request.get("seed", -1) != -1:
+            cache_key = get_inference_cache_key(inference_request, method)
+            with stage_metrics.timer("cache_lookup", timings):
+                cached = result_cache.get(cache_key)
+            if cached:
+                logger.info(f"Result cache hit for {method} request {cache_key[:12]}")
+                return {"images": cached["images"], "cache_hit": True, "timings": timings}
         
-        if method == "img2img":
-            endpoint = f'{API_BASE}/img2img'
-        else:
-            endpoint = f'{API_BASE}/txt2img'
+        logger.debug(f"Starting {method} inference")
         
-        response = automatic_session.post(
-            url=endpoint,
-            json=inference_request, 
-            timeout=600
-        )
+        endpoint = "img2img" if method == "img2img" else "txt2img"
+        
+        # Keys starting with "_" are handler metadata, not WebUI parameters
+        payload = {k: v for k, v in inference_request.items() if not k.startswith("_")}
+        switch_key = get_switch_key(payload, method)
+        job = get_job_control(job_id)
+        queued_at = time.monotonic()
+        
+        def send():
+            sent_at = time.monotonic()
+            stage_metrics.observe("queue", sent_at - queued_at)
+            timings["queue_seconds"] = round(sent_at - queued_at, 3)
+            with stage_metrics.timer("webui", timings):
+                return backend_pool.post(endpoint, payload, switch_key, timeout=600, job=job)
+        
+        response = inference_scheduler.run(job_id or uuid.uuid4().hex, switch_key, send, job)
+        
+        if hasattr(response, "service_seconds"):
+            timings["service_seconds"] = round(response.service_seconds, 3)
+        # requests already serialized the payload; reuse its size
+        timings["request_bytes"] = len(response.request.body or b"")
+        timings["response_bytes"] = len(response.content)
+        stage_metrics.add_bytes("webui_request", timings["request_bytes"])
+        stage_metrics.add_bytes("webui_response", timings["response_bytes"])
+        
+        if job and job.cancelled:
+            logger.warning(f"{method} inference interrupted: {job.reason}")
+            return {"error": f"Inference interrupted: {job.reason}", "interrupted": True}
         
         if response.status_code != 200:
-            logger.error(f"Inference failed with status {response.status_code}: {response.text}")
+            # Error bodies can be whole tracebacks; decode only their start
+            details = response.content[:WEBUI_ERROR_DETAIL_BYTES].decode(errors="replace")
+            if len(response.content) > WEBUI_ERROR_DETAIL_BYTES:
+                details = f"{details}... [{len(response.content) - WEBUI_ERROR_DETAIL_BYTES} more bytes]"
+            logger.error(f"Inference failed with status {response.status_code}: {details}")
             return {
                 "error": f"API request failed with status {response.status_code}",
-                "details": response.text
+                "details": details
             }
         
-        result = response.json()
+        with stage_metrics.timer("decode", timings):
+            result = response.json()
         logger.info(f"{method} inference completed successfully")
-        return {"images": result["images"]}
+        if "service_seconds" in timings:
+            quality_planner.observe(payload, timings["service_seconds"])
+        
+        if cache_key:
+            result_cache.put(cache_key, {"images": result["images"], "created_at": time.time()})
+        
+        return {"images": result["images"], "cache_hit": False, "timings": timings}
+        
+    except JobCancelled as err:
+        logger.warning(f"{method} inference not started: {err}")
+        return {"error": f"Inference cancelled: {err}", "interrupted": True}
         
     except Exception as err:
         logger.error(f"Error in inference: {err}")
         return {"error": f"Inference failed: {str(err)}"}
 
 
-def build_single_scene_request(scene_prompt, reference_images, story_config):
-    """Build inference request for a single scene"""
+def plan_for_deadline(inference_request, job_id, share=1.0):
+    """
+    Fit a request into its share of the job's remaining time
     
-    # Extract configuration
+    Returns the planner's plan, or None when the job has no deadline.
+    """
+    job = get_job_control(job_id)
+    if job is None or job.deadline is None:
+        return None
+    return quality_planner.plan(inference_request, job.remaining() * share)
+
+
+def is_cacheable(story_config):
+    """Whether a story's results may go into the result cache: allowed and seeded by the client"""
+    return bool(story_config.get("use_cache", True) and story_config.get("reproducible"))
+
+
+def compile_story_plan(story_config):
+    """StoryPlan of a story_config, with its seed and LoRA resolved"""
     story_style = story_config.get("story_style", "picture_book")
-    lora_weight = story_config.get("lora_weight", 1.0)
-    character_strength = story_config.get("character_strength", 0.65)
-    story_id = story_config.get("story_id", "default")
+    seed = story_config.get("style_seed") or get_story_seed(story_config.get("story_id", "default"))
+    return StoryPlan(story_config, seed, lora_installed=bool(story_style and get_lora_filename(story_style)))
+
+
+# ---------------------------------------------------------------------------- #
+#                            Print Finalization                                #
+# ---------------------------------------------------------------------------- #
+def get_webui_tile_upscaler(upscaler):
+    """Tile upscaler for upscale_to_print backed by the WebUI extras endpoint"""
+    def upscale_tile(tile, factor):
+        buffer = BytesIO()
+        tile.save(buffer, format="PNG", compress_level=1)
+        response = backend_pool.post(
+            "extra-single-image",
+            {
+                "image": base64.b64encode(buffer.getvalue()).decode(),
+                "resize_mode": 0,
+                "upscaling_resize": factor,
+                "upscaler_1": upscaler
+            },
+            timeout=120
+        )
+        response.raise_for_status()
+        return decode_image_b64(response.json()["image"])
     
-    # Get book format and dimensions
-    book_format = story_config.get("book_format", "square_small")
-    scene_width, scene_height, _, _, format_info = get_book_dimensions(
-        book_format,
-        story_config.get("custom_width"),
-        story_config.get("custom_height")
-    )
+    return upscale_tile
+
+
+def get_print_format(story_config):
+    """Book format whose print size applies, None when custom dimensions are used"""
+    if story_config.get("custom_width") and story_config.get("custom_height"):
+        return None
+    return story_config.get("book_format", "square_small")
+
+
+def finalize_for_print(result, book_format, upscaler="local"):
+    """
+    Upscale every image of an inference result to 300 DPI print size in place
     
-    # Override with explicit dimensions if provided
-    final_width = story_config.get("width", scene_width)
-    final_height = story_config.get("height", scene_height)
-    
-    # Get consistent seed for this story
-    seed = get_story_seed(story_id)
-    
-    # ENHANCED PROMPT for professional children's book scene illustrations
-    full_prompt = f"""
-    {scene_prompt}, professional children's book illustration,
-    storybook scene, highly detailed, consistent style,
-    vibrant colors, child-friendly artwork,
-    clean composition, narrative illustration,
-    appealing to children aged 4-8, magical atmosphere,
-    whimsical art style, storytelling illustration,
-    professional book illustration quality,
-    detailed but clear, perfect for children's book,
-    bright and engaging, fantasy storybook art
-    """.strip().replace('\n', ' ')
+    upscaler is "local" (tiled LANCZOS inside the worker) or the name of a
+    WebUI upscaler such as "R-ESRGAN 4x+", applied tile by tile via the extras
+    endpoint. Custom formats have no print size and are left untouched. A
+    failed upscale turns the result into an error; its images are dropped.
+    """
+    if "error" in result or not result.get("images"):
+        return result
     
-    # OPTIMAL Scene generation settings for children's book illustrations
-    request = {
-        "prompt": full_prompt,
-        "negative_prompt": story_config.get("negative_prompt", 
-            "blurry, low quality, distorted, inconsistent style, ugly, deformed, different art style, pixelated, low resolution, dark themes, scary elements, inappropriate content, crowded composition, too busy, cluttered, unprofessional, poor composition, amateur artwork"),
-        "steps": story_config.get("steps", 45),  # Increased from 35 for higher quality
-        "cfg_scale": story_config.get("cfg_scale", 7.5),
-        "width": final_width,   # Dynamic based on book format
-        "height": final_height, # Dynamic based on book format
-        "sampler_name": story_config.get("sampler_name", "DPM++ 2M Karras"),
-        "seed": seed,  # CRITICAL: Same seed for style consistency
-        "batch_size": 1,
-        
-        # PRINT QUALITY ENHANCEMENTS for scenes
-        "restore_faces": True,  # Better character face quality
-        "tiling": False,
-        "do_not_save_samples": True,
-        "do_not_save_grid": True,
-        "enable_hr": True,              # Enable high-res fix for crisp details
-        "hr_scale": 1.2,               # Moderate upscale for scenes
-        "hr_upscaler": "R-ESRGAN 4x+", # Best upscaler for illustrations
-        "hr_second_pass_steps": 15      # Additional steps for high-res pass
+    print_info = calculate_print_dimensions(book_format) if book_format else None
+    if not print_info:
+        logger.warning(f"No print size for book format {book_format}, skipping print finalization")
+        result["print_finalized"] = False
+        return result
+    
+    start = time.monotonic()
+    upscale_tile = None if upscaler == "local" else get_webui_tile_upscaler(upscaler)
+    try:
+        result["images"] = [
+            upscale_to_print(image, print_info["print_width"], print_info["print_height"], upscale_tile)
+            for image in result["images"]
+        ]
+    except Exception as e:
+        logger.error(f"Print finalization ({upscaler}) failed: {e}")
+        result.pop("images", None)
+        result["error"] = f"Print finalization failed: {str(e)}"
+        return result
+    elapsed = time.monotonic() - start
+    
+    logger.info(f"Print finalization to {print_info['print_width']}x{print_info['print_height']} ({upscaler}) took {elapsed:.2f}s")
+    result["print_info"] = print_info
+    result["print_finalized"] = True
+    result["print_finalize_seconds"] = round(elapsed, 3)
+    return result
+
+
+# ---------------------------------------------------------------------------- #
+#                              Output Encoding                                 #
+# ---------------------------------------------------------------------------- #
+def get_output_options(config):
+    """Output encoding requested by a job (input data or story_config)"""
+    output_format = (config.get("output_format") or "png").lower()
+    if output_format == "jpg":
+        output_format = "jpeg"
+    if output_format not in OUTPUT_FORMATS:
+        logger.warning(f"Unknown output format {output_format}, returning PNG")
+        output_format = "png"
+    
+    return {
+        "output_format": output_format,
+        "quality": int(config.get("output_quality") or 90),
+        "compress_level": config.get("output_compress_level"),
+        "thumbnail_size": config.get("thumbnail_size")
     }
+
+
+def encode_result_images(result, output_options):
+    """
+    Encode every image of an inference result in the requested output format
     
-    # Add metadata about the book format
-    request["_book_format_info"] = {
-        "book_format": book_format,
-        "generation_size": f"{final_width}x{final_height}",
-        "format_name": format_info["name"] if "name" in format_info else "Custom",
-        "aspect_ratio": format_info.get("aspect_ratio", final_width/final_height)
+    Images are encoded in parallel on the shared encode pool. The result gets
+    an "output" block with the encoded and original byte counts.
+    """
+    if "error" in result or not result.get("images"):
+        return result
+    
+    start = time.monotonic()
+    source_bytes = sum(base64_size(image) for image in result["images"])
+    encoded = [
+        future.result() for future in [
+            output_encode_pool.submit(encode_output_image, image, **output_options)
+            for image in result["images"]
+        ]
+    ]
+    
+    result["images"] = [item["image"] for item in encoded]
+    output = {
+        "format": output_options["output_format"],
+        "bytes": sum(base64_size(image) for image in result["images"]),
+        "source_bytes": source_bytes
     }
+    if output_options.get("thumbnail_size"):
+        result["thumbnails"] = [item["thumbnail"] for item in encoded]
+        output["thumbnail_bytes"] = sum(base64_size(thumbnail) for thumbnail in result["thumbnails"])
     
-    # Add LoRA for story style
-    if story_style and get_lora_filename(story_style):
-        lora_trigger = f"<lora:{story_style}:{lora_weight}>"
-        request["prompt"] = f"{request['prompt']}, {lora_trigger}"
-        logger.info(f"Added LoRA for style consistency: {lora_trigger}")
+    result["output"] = output
+    result["encode_seconds"] = round(time.monotonic() - start, 3)
+    return result
+
+
+def upload_result_images(result, config, object_name):
+    """
+    Move a result's images to the S3 output sink when the job asks for it
+    
+    The base64 images are replaced by "image_objects" (bucket, key, size,
+    sha256 and a presigned URL unless presign_urls is false), so the result
+    no longer carries image data. Thumbnails become "thumbnail_objects".
+    A failed upload turns the result into an error instead of raising.
+    """
+    if (config.get("output_sink") or "base64") != "s3":
+        return result
+    if "error" in result or not result.get("images"):
+        return result
+    
+    start = time.monotonic()
+    output_format = get_output_options(config)["output_format"]
+    prefix = (config.get("output_prefix") or "").strip("/")
+    base_key = f"{prefix}/{object_name}" if prefix else object_name
+    presign = config.get("presign_urls", True)
+    
+    def upload(images, suffix):
+        items = [
+            (base64.b64decode(image), f"{base_key}{suffix}{'' if len(images) == 1 else f'_{i}'}.{output_format}")
+            for i, image in enumerate(images)
+        ]
+        return sink.upload_many(items, CONTENT_TYPES[output_format], presign)
+    
+    try:
+        sink = get_image_sink(config.get("output_bucket"))
+        image_objects = upload(result["images"], "")
+        thumbnail_objects = upload(result["thumbnails"], "_thumb") if result.get("thumbnails") else None
+    except Exception as e:
+        logger.error(f"Upload of {base_key} failed: {e}")
+        result.pop("images", None)
+        result.pop("thumbnails", None)
+        result["error"] = f"Upload failed: {str(e)}"
+        return result
+    
+    del result["images"]
+    result["image_objects"] = image_objects
+    if thumbnail_objects is not None:
+        del result["thumbnails"]
+        result["thumbnail_objects"] = thumbnail_objects
+    
+    result["upload_seconds"] = round(time.monotonic() - start, 3)
+    logger.info(f"Uploaded {len(result['image_objects'])} images to s3://{sink.bucket}/{base_key}")
+    return result
+
+
+def build_single_scene_request(scene_prompt, reference_images, story_config, processed_references=None, scene_index=None, preview_image=None, story_plan=None):
+    """
+    Build inference request for a single scene
+    
+    Story batches pass `processed_references` from preprocess_reference_images
+    so reference photos are decoded once per job instead of once per scene,
+    and a `story_plan` from compile_story_plan so the settings every scene
+    shares are resolved once. With a `preview_image` the scene is rendered
+    img2img from its approved preview instead of from the character reference.
+    """
+    if story_plan is None:
+        story_plan = compile_story_plan(story_config)
+    request = story_plan.scene_request(scene_prompt)
     
     # Handle reference images for character consistency
-    if reference_images and len(reference_images) > 0:
-        # For now, use the first reference image
-        # TODO: Could be enhanced to handle multiple characters per scene
-        primary_reference = reference_images[0]
-        processed_image = process_reference_image(primary_reference, 0)
-        
-        if processed_image:
-            request["init_images"] = [processed_image]
-            request["denoising_strength"] = character_strength
+    if processed_references is None:
+        processed_references = preprocess_reference_images(reference_images, story_plan.size)
+    
+    if preview_image:
+        request["init_images"] = [preview_image]
+        request["denoising_strength"] = FINALIZE_DENOISING_STRENGTH
+        request["_characters"] = get_scene_characters(
+            story_plan.scene_characters, scene_index, len(processed_references)
+        ) if processed_references else []
+        return request, "img2img"
+    
+    if processed_references:
+        characters = get_scene_characters(story_plan.scene_characters, scene_index, len(processed_references))
+        cast = tuple(characters)
+        init_image = story_plan.init_images.get(cast)
+        if init_image is None:
+            init_image = story_plan.init_images[cast] = select_init_image(processed_references, characters, story_plan.size)
+        
+        if init_image:
+            request["init_images"] = [init_image]
+            request["denoising_strength"] = story_plan.character_strength
+            request["_characters"] = characters
             return request, "img2img"
     
     return request, "txt2img"
 
 
-def generate_story_batch(scene_prompts, reference_images, story_config):
+def get_scene_object_name(story_config, scene_index):
+    """Object name of a story scene in the output sink"""
+    return f"{story_config.get('story_id')}/scene_{scene_index:03d}"
+
+
+def render_scene(scene_index, scene_prompt, processed_references, story_config, checkpoint_fingerprint=None, preview_image=None, budget_share=1.0, story_plan=None):
     """
-    Generate a complete story batch with consistent style and characters
+    Build, run and annotate a single story scene, checkpointing it when it succeeds
+    
+    Under a job deadline the scene gets `budget_share` of the remaining time;
+    a scene whose settings had to be reduced for it is not checkpointed.
     """
-    try:
-        results = []
-        story_id = story_config.get("story_id", f"story_{int(time.time())}")
+    scene_start = time.monotonic()
+    
+    # Build request for this scene
+    inference_request, method = build_single_scene_request(
+        scene_prompt, 
+        None, 
+        story_config,
+        processed_references,
+        scene_index,
+        preview_image,
+        story_plan
+    )
+    job_id = story_config.get("job_id")
+    plan = plan_for_deadline(inference_request, job_id, budget_share)
+    build_done = time.monotonic()
+    
+    # Generate the scene
+    progress_reporter.scene_started(job_id, scene_index)
+    scene_result = run_inference(inference_request, method, is_cacheable(story_config), job_id)
+    inference_done = time.monotonic()
+    progress_reporter.scene_done(job_id, scene_index, inference_done - build_done)
+    
+    if story_config.get("print_finalize") and story_config.get("quality") != "preview":
+        finalize_for_print(scene_result, get_print_format(story_config), story_config.get("print_upscaler") or "local")
+    encode_result_images(scene_result, get_output_options(story_config))
+    
+    # Add metadata
+    scene_result["scene_index"] = scene_index
+    scene_result["scene_prompt"] = scene_prompt
+    scene_result["method_used"] = method
+    scene_result["characters"] = inference_request.get("_characters", [])
+    timings = {
+        "build_seconds": round(build_done - scene_start, 3),
+        "inference_seconds": round(inference_done - build_done, 3),
+        **scene_result.pop("timings", {})
+    }
+    for stage in ("print_finalize_seconds", "encode_seconds"):
+        if stage in scene_result:
+            timings[stage] = scene_result.pop(stage)
+    scene_result["timings"] = timings
+    if plan:
+        plan["achieved_seconds"] = timings.get("service_seconds", timings["inference_seconds"])
+        scene_result["plan"] = plan
+    # Checkpoint the encoded images, not the uploads: presigned URLs expire, so
+    # resumed scenes are uploaded again. Scenes rendered with reduced settings
+    # are not final; a resumed job renders them again.
+    if checkpoint_fingerprint and not (plan and plan["reduced"]):
+        scene_checkpoints.save(story_config.get("story_id"), scene_index, scene_prompt, checkpoint_fingerprint, scene_result)
+    
+    upload_result_images(scene_result, story_config, get_scene_object_name(story_config, scene_index))
+    if "upload_seconds" in scene_result:
+        timings["upload_seconds"] = scene_result.pop("upload_seconds")
+    timings["total_seconds"] = round(time.monotonic() - scene_start, 3)
+    for stage in ("build", "inference", "print_finalize", "encode", "upload", "scene_total"):
+        seconds = timings.get("total_seconds" if stage == "scene_total" else f"{stage}_seconds")
+        if seconds is not None:
+            stage_metrics.observe(stage, seconds)
+    
+    scene_result["_sent_at"] = build_done
+    scene_result["_completed_at"] = inference_done
+    
+    return scene_result
+
+
+def iter_story_scenes(scene_prompts, reference_images, story_config, pipeline_stats=None, scene_indexes=None, preview_images=None, cover=None):
+    """
+    Generate story scenes through a bounded pipeline, yielding each scene dict
+    in order as soon as it is done so callers never hold more than a few images
+    
+    Up to `pipeline_depth` scenes are in flight at once: while the WebUI renders
+    scene N, scene N+1 is already built and queued behind it and scene N-1 is
+    being decoded, so the backend never waits for the handler. Each scene
+    reports the time the backend sat idle before it (`idle_gap_seconds`); the
+    totals are written into `pipeline_stats` when a dict is passed in.
+    
+    When the job is cancelled or passes its deadline no further scenes are
+    queued; their indexes end up in pipeline_stats["skipped_scenes"].
+    
+    Finished scenes are checkpointed per story_id; unless story_config has
+    resume=False, checkpointed scenes are returned ("resumed": True), after
+    uploading them again for the S3 sink, instead of being rendered again.
+    
+    `scene_indexes` limits the run to some scenes (finalize renders only the
+    approved ones); `preview_images` maps a scene index to the preview image
+    it starts from. A `cover` callable runs first in the same pipeline,
+    given the processed references and their size, and its result is
+    yielded before the scenes.
+    """
+    depth = max(1, int(story_config.get("pipeline_depth") or SCENE_PIPELINE_DEPTH))
+    story_plan = compile_story_plan(story_config)
+    
+    # Decode every reference photo once, in parallel, before the first scene
+    preprocess_start = time.monotonic()
+    processed_references = preprocess_reference_images(reference_images, story_plan.size)
+    preprocess_seconds = time.monotonic() - preprocess_start
+    stage_metrics.observe("reference_preprocess", preprocess_seconds)
+    if reference_images:
+        logger.info(f"Preprocessed {len(reference_images)} reference images in {preprocess_seconds:.2f}s")
+    
+    backend_first_busy = None
+    backend_free_at = None
+    total_idle = 0.0
+    # Per-stage sums over the scenes rendered by this job
+    stage_totals = {}
+    plan_totals = {}
+    
+    def finish(future):
+        nonlocal backend_first_busy, backend_free_at, total_idle
+        scene_result = future.result()
+        # Resumed scenes and the cover were not timed by render_scene
+        if "_sent_at" not in scene_result:
+            return scene_result
+        sent_at = scene_result.pop("_sent_at")
+        completed_at = scene_result.pop("_completed_at")
+        
+        # The WebUI serves requests in arrival order, so the backend was idle
+        # only if this scene arrived after the previous one had finished
+        idle_gap = 0.0 if backend_free_at is None else max(0.0, sent_at - backend_free_at)
+        if backend_first_busy is None:
+            backend_first_busy = sent_at
+        backend_free_at = completed_at
+        total_idle += idle_gap
         
-        # Reset seed for new story to ensure consistency within this story
-        get_story_seed(story_id, reset=True)
+        scene_result["timings"]["idle_gap_seconds"] = round(idle_gap, 3)
+        for stage, value in scene_result["timings"].items():
+            stage_totals[stage] = round(stage_totals.get(stage, 0) + value, 3)
+        plan = scene_result.get("plan")
+        if plan:
+            for key, value in (
+                ("planned_seconds", plan["planned_seconds"]),
+                ("achieved_seconds", plan["achieved_seconds"]),
+                ("reduced_scenes", plan["reduced"]),
+                ("over_budget_scenes", plan["over_budget"])
+            ):
+                plan_totals[key] = round(plan_totals.get(key, 0) + value, 3)
+        return scene_result
+    
+    job = get_job_control(story_config.get("job_id"))
+    skipped_scenes = []
+    indexes = list(range(len(scene_prompts))) if scene_indexes is None else list(scene_indexes)
+    progress_reporter.set_total(story_config.get("job_id"), len(indexes) + (cover is not None))
+    
+    story_id = story_config.get("story_id")
+    fingerprint = SceneCheckpoints.story_fingerprint(story_config, processed_references) if story_id else None
+    resume = fingerprint and story_config.get("resume", True) is not False
+    resumed_count = 0
+    
+    def resume_scene(checkpoint, i):
+        # Checkpoints hold the encoded images; upload them again for this job
+        checkpoint["resumed"] = True
+        return upload_result_images(checkpoint, story_config, get_scene_object_name(story_config, i))
+    
+    def render_cover():
+        # Progress reports the cover as page -1
+        progress_reporter.scene_started(story_config.get("job_id"), -1)
+        try:
+            with log_context(job_id=story_config.get("job_id"), story_id=story_id):
+                return cover(processed_references, story_plan.size)
+        finally:
+            progress_reporter.scene_done(story_config.get("job_id"), -1)
+    
+    with ThreadPoolExecutor(max_workers=depth, thread_name_prefix="scene") as pool:
+        in_flight = deque()
+        if cover is not None:
+            in_flight.append(pool.submit(render_cover))
+        for position, i in enumerate(indexes):
+            scene_prompt = scene_prompts[i]
+            if job and job.cancelled:
+                skipped_scenes = indexes[position:]
+                logger.warning(f"Skipping {len(skipped_scenes)} scenes: {job.reason}")
+                break
+            checkpoint = scene_checkpoints.load(story_id, i, scene_prompt, fingerprint) if resume else None
+            if checkpoint is not None:
+                logger.info(f"Resuming scene {i+1}/{len(scene_prompts)} from checkpoint", extra={"scene_index": i})
+                resumed_count += 1
+                progress_reporter.scene_done(story_config.get("job_id"), i)
+                in_flight.append(pool.submit(
+                    bind_log_context(resume_scene, job_id=story_config.get("job_id"), story_id=story_id, scene_index=i),
+                    checkpoint, i
+                ))
+            else:
+                logger.info(f"Queueing scene {i+1}/{len(scene_prompts)}: {scene_prompt[:50]}...", extra={"scene_index": i})
+                # Under a deadline, unfinished scenes split the remaining time
+                # across the backends they can run on at once
+                unfinished = len(indexes) - position + len(in_flight)
+                parallelism = max(1, min(depth, len(backend_pool.healthy_backends())))
+                scene_task = bind_log_context(render_scene, job_id=story_config.get("job_id"), story_id=story_id, scene_index=i)
+                in_flight.append(pool.submit(
+                    scene_task, i, scene_prompt, processed_references, story_config, fingerprint,
+                    (preview_images or {}).get(i), min(1.0, parallelism / unfinished), story_plan
+                ))
+            
+            if len(in_flight) >= depth:
+                yield finish(in_flight.popleft())
         
+        while in_flight:
+            yield finish(in_flight.popleft())
+    
+    if pipeline_stats is not None:
+        queued = len(indexes) - len(skipped_scenes)
+        pipeline_stats["checkpoint_fingerprint"] = fingerprint
+        pipeline_stats["resumed_scenes"] = resumed_count
+        pipeline_stats["rendered_scenes"] = queued - resumed_count
+        pipeline_stats["timings"] = {
+            "reference_preprocess_seconds": round(preprocess_seconds, 3),
+            "scene_stage_totals": stage_totals
+        }
+    
+    if pipeline_stats is not None and plan_totals:
+        pipeline_stats["plan"] = {"deadline_seconds": round(job.deadline - job.started_at, 3), **plan_totals}
+    
+    if pipeline_stats is not None and job and job.cancelled:
+        pipeline_stats["skipped_scenes"] = skipped_scenes
+        pipeline_stats["stop_reason"] = job.reason
+    
+    if pipeline_stats is not None and backend_free_at is not None:
+        span = backend_free_at - backend_first_busy
+        pipeline_stats.update({
+            "pipeline_depth": depth,
+            "reference_preprocess_seconds": round(preprocess_seconds, 3),
+            "backend_span_seconds": round(span, 3),
+            "total_idle_gap_seconds": round(total_idle, 3),
+            "gpu_duty_cycle": round(1.0 - total_idle / span, 4) if span > 0 else 1.0
+        })
+
+
+def save_preview_record(scene_prompts, reference_images, story_config, fingerprint):
+    """Remember what a preview run rendered so finalize can reproduce it at print quality"""
+    if story_config.get("quality") != "preview" or not fingerprint:
+        return
+    scene_checkpoints.save_preview(story_config["story_id"], {
+        "story_config": {k: v for k, v in story_config.items() if k != "job_id"},
+        "scene_prompts": scene_prompts,
+        "reference_images": reference_images,
+        "fingerprint": fingerprint
+    })
+
+
+def assign_story_seed(story_config):
+    """Set the story_id and its style seed on story_config; returns the story_id"""
+    # Derived from the RunPod job id, which survives retries, so a retried
+    # job finds its own checkpoints
+    story_id = story_config.get("story_id") or f"story_{story_config.get('job_id') or int(time.time())}"
+    story_config["story_id"] = story_id
+    
+    # One seed for every scene of this story
+    story_config["style_seed"] = get_story_seed(story_id)
+    return story_id
+
+
+def build_story_summary(scene_prompts, story_config, pipeline_stats, job_start, scene_indexes=None):
+    """Fields shared by a batch result and a stream summary, taken out of pipeline_stats"""
+    summary = {
+        "story_id": story_config["story_id"],
+        "total_scenes": len(scene_prompts),
+        "story_config": story_config,
+        "style_seed_used": story_config["style_seed"],
+        "resumed_scenes": pipeline_stats.pop("resumed_scenes"),
+        "rendered_scenes": pipeline_stats.pop("rendered_scenes"),
+        "timings": {**pipeline_stats.pop("timings"), "total_seconds": round(time.monotonic() - job_start, 3)},
+        "pipeline": pipeline_stats
+    }
+    if scene_indexes is not None:
+        summary["scene_indexes"] = list(scene_indexes)
+    if "plan" in pipeline_stats:
+        summary["plan"] = pipeline_stats.pop("plan")
+    if "stop_reason" in pipeline_stats:
+        # Partial result: whatever finished before the job was stopped
+        summary["stopped"] = True
+        summary["stop_reason"] = pipeline_stats.pop("stop_reason")
+        summary["skipped_scenes"] = pipeline_stats.pop("skipped_scenes")
+    return summary
+
+
+def generate_story_batch(scene_prompts, reference_images, story_config, scene_indexes=None, preview_images=None, cover=None):
+    """
+    Generate a complete story batch with consistent style and characters
+    
+    scene_indexes, preview_images and cover are passed to iter_story_scenes;
+    the cover's result is returned under "cover".
+    """
+    job_start = time.monotonic()
+    try:
+        assign_story_seed(story_config)
         logger.info(f"Starting story generation: {len(scene_prompts)} scenes")
         
-        for i, scene_prompt in enumerate(scene_prompts):
-            logger.info(f"Generating scene {i+1}/{len(scene_prompts)}: {scene_prompt[:50]}...")
-            
-            # Build request for this scene
-            inference_request, method = build_single_scene_request(
-                scene_prompt, 
-                reference_images, 
-                story_config
-            )
-            
-            # Generate the scene
-            scene_result = run_inference(inference_request, method)
-            
-            # Add metadata
-            scene_result["scene_index"] = i
-            scene_result["scene_prompt"] = scene_prompt
-            scene_result["method_used"] = method
-            
-            results.append(scene_result)
-            
-            # Small delay between scenes to avoid overwhelming the API
-            if i < len(scene_prompts) - 1:
-                time.sleep(1)
+        pipeline_stats = {}
+        results = list(iter_story_scenes(
+            scene_prompts, reference_images, story_config, pipeline_stats, scene_indexes, preview_images, cover
+        ))
+        cover_result = results.pop(0) if cover is not None else None
+        save_preview_record(scene_prompts, reference_images, story_config, pipeline_stats.pop("checkpoint_fingerprint"))
         
         logger.info(f"Story generation completed: {len(results)} scenes")
         
-        return {
-            "story_id": story_id,
-            "total_scenes": len(scene_prompts),
-            "scenes": results,
-            "story_config": story_config,
-            "style_seed_used": story_style_seed
-        }
+        result = build_story_summary(scene_prompts, story_config, pipeline_stats, job_start, scene_indexes)
+        result["scenes"] = results
+        if cover_result is not None:
+            result["cover"] = cover_result
+        if result.get("stopped"):
+            result["completed_scenes"] = [scene["scene_index"] for scene in results if "error" not in scene]
+        return result
         
     except Exception as e:
         logger.error(f"Error in batch story generation: {e}")
         return {"error": f"Batch generation failed: {str(e)}"}
 
 
+def stream_story_batch(scene_prompts, reference_images, story_config, scene_indexes=None, preview_images=None, cover=None):
+    """
+    Streaming variant of generate_story_batch: yields every scene as it
+    finishes, followed by a summary without image data
+    
+    Failed scenes carry their message under "scene_error" because RunPod
+    aborts a streaming job on the first partial that contains "error".
+    """
+    job_start = time.monotonic()
+    try:
+        story_id = assign_story_seed(story_config)
+        logger.info(f"Starting streamed story generation: {len(scene_prompts)} scenes")
+        
+        completed_scenes = []
+        failed_scenes = []
+        pipeline_stats = {}
+        cover_completed = None
+        for position, scene_result in enumerate(iter_story_scenes(
+            scene_prompts, reference_images, story_config, pipeline_stats, scene_indexes, preview_images, cover
+        )):
+            scene_result["story_id"] = story_id
+            # The cover is always the first page out of the pipeline
+            if cover is not None and position == 0:
+                cover_completed = "error" not in scene_result
+                if not cover_completed:
+                    scene_result["cover_error"] = scene_result.pop("error")
+                yield scene_result
+                continue
+            if "error" in scene_result:
+                scene_result["scene_error"] = scene_result.pop("error")
+                failed_scenes.append(scene_result["scene_index"])
+            else:
+                completed_scenes.append(scene_result["scene_index"])
+            yield scene_result
+        
+        save_preview_record(scene_prompts, reference_images, story_config, pipeline_stats.pop("checkpoint_fingerprint"))
+        logger.info(f"Streamed story generation completed: {len(completed_scenes)} scenes")
+        
+        summary = build_story_summary(scene_prompts, story_config, pipeline_stats, job_start, scene_indexes)
+        summary["completed_scenes"] = completed_scenes
+        summary["failed_scenes"] = failed_scenes
+        summary["stream_complete"] = True
+        if cover_completed is not None:
+            summary["cover_completed"] = cover_completed
+        yield summary
+        
+    except Exception as e:
+        logger.error(f"Error in streamed story generation: {e}")
+        yield {"error": f"Batch generation failed: {str(e)}"}
+
+
+def finalize_story(story_id, scene_indexes, input_data, job_id=None):
+    """
+    Render approved scenes of a preview at print quality
+    
+    Prompts, references, seed and every generation setting come from the
+    preview record, so only steps, hires fix and face restoration change.
+    With from_preview the scene starts img2img from its preview image.
+    Output settings (FINALIZE_OVERRIDES) come from this job's input.
+    """
+    record = scene_checkpoints.load_preview(story_id)
+    if record is None:
+        return {"error": f"No preview found for story {story_id}"}
+    
+    scene_prompts = record["scene_prompts"]
+    indexes = list(range(len(scene_prompts))) if scene_indexes is None else scene_indexes
+    invalid = [i for i in indexes if not isinstance(i, int) or not 0 <= i < len(scene_prompts)]
+    if invalid:
+        return {"error": f"Unknown scene indexes {invalid}; the preview has {len(scene_prompts)} scenes"}
+    
+    story_config = {**record["story_config"], "job_id": job_id, "quality": "final"}
+    story_config["from_preview"] = bool(input_data.get("from_preview", False))
+    for key in FINALIZE_OVERRIDES:
+        if key in input_data:
+            story_config[key] = input_data[key]
+    check_output_sink(story_config)
+    
+    preview_images = {}
+    if story_config["from_preview"]:
+        for i in indexes:
+            preview = scene_checkpoints.get(story_id, i, scene_prompts[i], record["fingerprint"])
+            if preview and preview.get("images"):
+                preview_images[i] = preview["images"][0]
+            else:
+                logger.warning(f"No preview image for scene {i} of {story_id}, rendering it from the seed")
+    
+    logger.info(f"Finalizing {len(indexes)} of {len(scene_prompts)} scenes of {story_id}")
+    if input_data.get("stream"):
+        return stream_story_batch(scene_prompts, record["reference_images"], story_config, indexes, preview_images)
+    return generate_story_batch(scene_prompts, record["reference_images"], story_config, indexes, preview_images)
+
+
+def generate_book(scene_prompts, reference_images, story_config, input_data):
+    """
+    Generate a whole book, cover and scenes, in one job
+    
+    The cover is the first page of the scene pipeline: it shares the job's
+    story_id, seed, LoRA and reference photos, and runs back to back with
+    the scenes on the same backend. Pages are streamed as they finish when
+    the input sets stream.
+    """
+    def render_cover(processed_references, processed_size):
+        parallelism = max(1, len(backend_pool.healthy_backends()))
+        return generate_book_cover(
+            input_data.get("title", "Untitled Book"),
+            input_data.get("subtitle") or input_data.get("author", ""),
+            story_config["story_style"],
+            input_data.get("theme", "magical adventure"),
+            reference_images=reference_images,
+            book_format=story_config["book_format"],
+            custom_width=story_config["custom_width"],
+            custom_height=story_config["custom_height"],
+            cover_characters=input_data.get("cover_characters"),
+            print_finalize=story_config["print_finalize"],
+            print_upscaler=story_config["print_upscaler"],
+            output_options=get_output_options(story_config),
+            storage_config=story_config,
+            job_id=story_config["job_id"],
+            quality=story_config["quality"],
+            seed=story_config["style_seed"],
+            budget_share=min(1.0, parallelism / (len(scene_prompts) + 1)),
+            use_cache=is_cacheable(story_config),
+            processed_references=processed_references,
+            processed_size=processed_size
+        )
+    
+    logger.info(f"Generating book: cover and {len(scene_prompts)} scenes")
+    if input_data.get("stream"):
+        return stream_story_batch(scene_prompts, reference_images, story_config, cover=render_cover)
+    return generate_story_batch(scene_prompts, reference_images, story_config, cover=render_cover)
+
+
 # ---------------------------------------------------------------------------- #
 #                         Book Cover Generation Functions                      #
 # ---------------------------------------------------------------------------- #
-def build_book_cover_request(title, subtitle, style, theme, reference_images=None, book_format="square_small", custom_width=None, custom_height=None):
-    """Build inference request specifically for book covers"""
+def build_book_cover_request(title, subtitle, style, theme, reference_images=None, book_format="square_small", custom_width=None, custom_height=None, cover_characters=None, seed=None, quality="final", processed_references=None, processed_size=None):
+    """
+    Build inference request specifically for book covers
+    
+    cover_characters lists the reference indexes shown on the cover
+    (default: the first reference only). A seed from a preview reproduces
+    its composition at print quality.
+    """
     
     # Get book format and dimensions
     _, _, cover_width, cover_height, format_info = get_book_dimensions(
@@ -444,7 +1407,7 @@ def build_book_cover_request(title, subtitle, style, theme, reference_images=Non
         "width": cover_width,   # Dynamic based on book format
         "height": cover_height, # Dynamic based on book format
         "sampler_name": "DPM++ 2M Karras",  # Excellent choice for illustrations
-        "seed": -1,  # Random for variety unless specified
+        "seed": seed if seed is not None else -1,  # Random for variety unless specified
         "batch_size": 1,
         "restore_faces": True,
         "tiling": False,
@@ -457,6 +1420,7 @@ def build_book_cover_request(title, subtitle, style, theme, reference_images=Non
         "hr_upscaler": "R-ESRGAN 4x+",  # Best upscaler for illustrations
         "hr_second_pass_steps": 20  # Additional steps for high-res pass
     }
+    apply_quality(request, quality)
     
     # Add metadata about the book format
     request["_book_format_info"] = {
@@ -475,33 +1439,66 @@ def build_book_cover_request(title, subtitle, style, theme, reference_images=Non
     
     # Handle reference images for character consistency
     if reference_images and len(reference_images) > 0:
-        primary_reference = reference_images[0]
-        processed_image = process_reference_image(primary_reference, 0)
+        # A book's scenes already processed the photos; reuse them when they are at the cover size
+        if processed_references is None or tuple(processed_size) != (cover_width, cover_height):
+            processed_references = preprocess_reference_images(reference_images, (cover_width, cover_height))
+        characters = get_scene_characters([cover_characters], 0, len(processed_references))
+        init_image = select_init_image(processed_references, characters, (cover_width, cover_height))
         
-        if processed_image:
-            request["init_images"] = [processed_image]
+        if init_image:
+            request["init_images"] = [init_image]
             request["denoising_strength"] = 0.55  # Optimized for covers with character consistency
+            request["_characters"] = characters
             return request, "img2img"
     
     return request, "txt2img"
 
 
-def generate_book_cover(title, subtitle, style, theme, reference_images=None, book_format="square_small", custom_width=None, custom_height=None):
-    """Generate a book cover with specific optimizations"""
+def generate_book_cover(title, subtitle, style, theme, reference_images=None, book_format="square_small", custom_width=None, custom_height=None, cover_characters=None, print_finalize=False, print_upscaler="local", output_options=None, storage_config=None, job_id=None, quality="final", seed=None, budget_share=1.0, use_cache=True, processed_references=None, processed_size=None):
+    """
+    Generate a book cover with specific optimizations
+    
+    storage_config holds the job's output sink settings (see upload_result_images).
+    processed_references, processed at processed_size, are reused when that
+    is the cover size.
+    A preview draws a concrete seed and returns it as seed_used, so the
+    final cover can be requested with the same seed. Only covers with a
+    given seed are cached.
+    """
     try:
         logger.info(f"Generating book cover: {title}")
+        use_cache = use_cache and seed is not None
+        if quality == "preview" and seed is None:
+            seed = get_story_seed()
         
         # Build the cover-specific request
         inference_request, method = build_book_cover_request(
-            title, subtitle, style, theme, reference_images, book_format, custom_width, custom_height
+            title, subtitle, style, theme,
+            reference_images=reference_images,
+            book_format=book_format,
+            custom_width=custom_width,
+            custom_height=custom_height,
+            cover_characters=cover_characters,
+            seed=seed,
+            quality=quality,
+            processed_references=processed_references,
+            processed_size=processed_size
         )
+        plan = plan_for_deadline(inference_request, job_id, budget_share)
         
         # Generate the cover
-        result = run_inference(inference_request, method)
+        result = run_inference(inference_request, method, use_cache, job_id)
+        if plan:
+            plan["achieved_seconds"] = result.get("timings", {}).get("service_seconds")
+            result["plan"] = plan
         
         # Add metadata specific to book covers
         result["generation_type"] = "book_cover"
+        result["quality"] = quality
+        if inference_request["seed"] != -1:
+            result["seed_used"] = inference_request["seed"]
         result["method_used"] = method
+        result["characters"] = inference_request.get("_characters", [])
         result["cover_config"] = {
             "title": title,
             "subtitle": subtitle,
@@ -512,18 +1509,51 @@ def generate_book_cover(title, subtitle, style, theme, reference_images=None, bo
             "book_format_info": inference_request.get("_book_format_info", {})
         }
         
-        # Add print dimension information
-        if book_format:
+        # Upscale to 300 DPI, or just add print dimension information
+        if print_finalize and quality != "preview":
+            finalize_for_print(
+                result, None if custom_width and custom_height else book_format, print_upscaler or "local"
+            )
+        elif book_format:
             print_info = calculate_print_dimensions(book_format)
             if print_info:
                 result["print_info"] = print_info
         
+        encode_result_images(result, output_options or get_output_options({}))
+        if storage_config:
+            story_id = storage_config.get("story_id")
+            upload_result_images(result, storage_config, f"{story_id}/cover" if story_id else f"covers/{uuid.uuid4().hex}")
+        
         logger.info("Book cover generation completed")
         return result
         
     except Exception as e:
         logger.error(f"Error in book cover generation: {e}")
-        return {"error": f"Book cover generation failed: {str(e)}"}
+        return {"error": f"Book cover generation failed: {str(e)}", "generation_type": "book_cover"}
+
+
+def generate_cover_from_input(input_data, job_id, subtitle, default_title, default_theme):
+    """A standalone cover job; the two cover request shapes differ only in their defaults"""
+    check_output_sink(input_data)
+    return generate_book_cover(
+        input_data.get("title", default_title),
+        subtitle,
+        input_data.get("story_style", "picture_book"),
+        input_data.get("theme", default_theme),
+        reference_images=input_data.get("reference_images", []),
+        book_format=input_data.get("book_format", "square_small"),
+        custom_width=input_data.get("custom_width"),
+        custom_height=input_data.get("custom_height"),
+        cover_characters=input_data.get("cover_characters"),
+        print_finalize=input_data.get("print_finalize", False),
+        print_upscaler=input_data.get("print_upscaler", "local"),
+        output_options=get_output_options(input_data),
+        storage_config=input_data,
+        job_id=job_id,
+        quality=input_data.get("quality", "final"),
+        seed=input_data.get("seed"),
+        use_cache=input_data.get("use_cache", True)
+    )
 
 
 # ---------------------------------------------------------------------------- #
@@ -545,89 +1575,8 @@ def get_available_book_formats():
 
 
 def get_lulu_book_formats():
-    """Get available Lulu book formats with their aspect ratios and recommended generation sizes"""
-    return {
-        "pocket_book": {
-            "name": "Pocket Book (4.25\" x 6.875\")",
-            "physical_size_inches": (4.25, 6.875),
-            "physical_size_mm": (108, 175),
-            "aspect_ratio": 0.618,  # width/height ratio
-            "scene_gen_size": (512, 832),     # High-res maintaining aspect ratio
-            "cover_gen_size": (512, 832),     # Same for covers
-            "target_dpi": 300,
-            "best_for": "Pocket-sized children's books, travel books"
-        },
-        "us_trade": {
-            "name": "US Trade (6\" x 9\")", 
-            "physical_size_inches": (6, 9),
-            "physical_size_mm": (152, 229),
-            "aspect_ratio": 0.667,  # 2:3 ratio
-            "scene_gen_size": (576, 864),     # High-res maintaining aspect ratio
-            "cover_gen_size": (576, 864),
-            "target_dpi": 300,
-            "best_for": "Standard chapter books, novels"
-        },
-        "royal": {
-            "name": "Royal (6.14\" x 9.21\")",
-            "physical_size_inches": (6.14, 9.21),
-            "physical_size_mm": (156, 234),
-            "aspect_ratio": 0.667,  # Close to 2:3
-            "scene_gen_size": (584, 876),     # High-res maintaining aspect ratio
-            "cover_gen_size": (584, 876),
-            "target_dpi": 300,
-            "best_for": "Premium books, literary works"
-        },
-        "crown_quarto": {
-            "name": "Crown Quarto (7.44\" x 9.69\")",
-            "physical_size_inches": (7.44, 9.69),
-            "physical_size_mm": (189, 246),
-            "aspect_ratio": 0.768,
-            "scene_gen_size": (640, 832),     # High-res maintaining aspect ratio
-            "cover_gen_size": (640, 832),
-            "target_dpi": 300,
-            "best_for": "Academic books, textbooks"
-        },
-        "us_letter": {
-            "name": "US Letter (8.5\" x 11\")",
-            "physical_size_inches": (8.5, 11),
-            "physical_size_mm": (216, 279),
-            "aspect_ratio": 0.773,  # Close to 3:4
-            "scene_gen_size": (680, 880),     # High-res maintaining aspect ratio
-            "cover_gen_size": (680, 880),
-            "target_dpi": 300,
-            "best_for": "Activity books, educational books, workbooks"
-        },
-        "square_small": {
-            "name": "Square Small (8.5\" x 8.5\")",
-            "physical_size_inches": (8.5, 8.5),
-            "physical_size_mm": (216, 216),
-            "aspect_ratio": 1.0,  # Perfect square
-            "scene_gen_size": (768, 768),     # High-res square
-            "cover_gen_size": (768, 768),
-            "target_dpi": 300,
-            "best_for": "Picture books, children's books"
-        },
-        "landscape": {
-            "name": "Landscape (11\" x 8.5\")",
-            "physical_size_inches": (11, 8.5),
-            "physical_size_mm": (279, 216),
-            "aspect_ratio": 1.294,  # 4:3 landscape
-            "scene_gen_size": (880, 680),     # High-res landscape
-            "cover_gen_size": (880, 680),
-            "target_dpi": 300,
-            "best_for": "Panoramic storybooks, coffee table books"
-        },
-        "square_large": {
-            "name": "Square Large (10\" x 10\")",
-            "physical_size_inches": (10, 10),
-            "physical_size_mm": (254, 254),
-            "aspect_ratio": 1.0,  # Perfect square
-            "scene_gen_size": (896, 896),     # High-res large square
-            "cover_gen_size": (896, 896),
-            "target_dpi": 300,
-            "best_for": "Premium picture books, art books"
-        }
-    }
+    """Available Lulu book formats with their aspect ratios and recommended generation sizes (read-only)"""
+    return BOOK_FORMATS
 
 
 def get_book_dimensions(book_format="square_small", custom_width=None, custom_height=None):
@@ -647,20 +1596,14 @@ def get_book_dimensions(book_format="square_small", custom_width=None, custom_he
         }
         return (custom_width, custom_height, custom_width, custom_height, format_info)
     
-    formats = get_lulu_book_formats()
-    
-    if book_format not in formats:
-        logger.warning(f"Unknown book format: {book_format}, defaulting to square_small")
-        book_format = "square_small"
-    
-    format_spec = formats[book_format]
+    book_format, format_spec = resolve_book_format(book_format)
     scene_dims = format_spec["scene_gen_size"]
     cover_dims = format_spec["cover_gen_size"]
     
-    logger.info(f"Using book format: {format_spec['name']}")
-    logger.info(f"Physical size: {format_spec['physical_size_inches'][0]}\" x {format_spec['physical_size_inches'][1]}\"")
-    logger.info(f"Generation size: {scene_dims[0]}x{scene_dims[1]} (aspect ratio: {format_spec['aspect_ratio']:.3f})")
-    logger.info(f"Target 300 DPI size: {format_spec['physical_size_inches'][0] * 300:.0f} x {format_spec['physical_size_inches'][1] * 300:.0f}")
+    logger.debug(
+        f"Using book format: {format_spec['name']}, generation size {scene_dims[0]}x{scene_dims[1]}, "
+        f"300 DPI size {format_spec['physical_size_inches'][0] * 300:.0f} x {format_spec['physical_size_inches'][1] * 300:.0f}"
+    )
     
     return (scene_dims[0], scene_dims[1], cover_dims[0], cover_dims[1], format_spec)
 
@@ -670,11 +1613,10 @@ def calculate_print_dimensions(book_format):
     Calculate the final print dimensions at 300 DPI for a given book format
     This is what the images will be upscaled to during final processing
     """
-    formats = get_lulu_book_formats()
-    if book_format not in formats:
+    if book_format not in BOOK_FORMATS:
         return None
     
-    format_spec = formats[book_format]
+    format_spec = BOOK_FORMATS[book_format]
     width_inches, height_inches = format_spec["physical_size_inches"]
     
     # Calculate 300 DPI dimensions
@@ -690,11 +1632,27 @@ def calculate_print_dimensions(book_format):
     }
 
 
+def get_metrics_text():
+    """Prometheus text exposition of the stage metrics and cache counters"""
+    reference_cache = reference_image_cache.stats()
+    return stage_metrics.render({
+        "result": result_cache.stats(),
+        "reference_memory": reference_cache["memory"],
+        "reference_disk": reference_cache["disk"],
+        "checkpoint": scene_checkpoints.store.stats()
+    })
+
+
 # ---------------------------------------------------------------------------- #
 #                                RunPod Handler                                #
 # ---------------------------------------------------------------------------- #
-def handler(event):
-    """Main handler for story batch generation"""
+def process_job(event):
+    """
+    Route a job to the matching generation function
+    
+    Returns a result dict, or a generator of partial results for streamed
+    story batches.
+    """
     try:
         # Handle debug environment requests
         if event.get("input", {}).get("action") == "debug_env":
@@ -714,15 +1672,40 @@ def handler(event):
                 env_info["environment_variables"]["HUGGINGFACE_TOKEN_preview"] = os.getenv("HUGGINGFACE_TOKEN")[:10] + "..."
             return env_info
 
+        # Stage latency histograms, byte and cache counters for Prometheus
+        if event.get("input", {}).get("action") == "get_metrics":
+            return {
+                "content_type": "text/plain; version=0.0.4",
+                "metrics": get_metrics_text(),
+                "stages": stage_metrics.summary()
+            }
+
         # Handle info/status requests
         if event.get("input", {}).get("action") == "get_info":
             return {
-                "status": "ready",
+                "status": startup_state["phase"],
                 "service_type": "story_batch_generation",
                 "available_loras": get_available_loras(),
+                "installed_loras": lora_registry.describe(),
+                "lora_registry": lora_registry.stats(),
                 "available_book_formats": get_available_book_formats(),
-                "api_endpoint": API_BASE,
-                "supported_methods": ["single_scene", "story_batch", "book_cover"],
+                "api_endpoint": backend_pool.backends[0].api_base,
+                "backend_pool": backend_pool.stats(),
+                "result_cache": result_cache.stats(),
+                "reference_image_cache": reference_image_cache.stats(),
+                "scene_checkpoints": scene_checkpoints.stats(),
+                "s3_output_sink_configured": is_sink_configured(),
+                "reference_fetch": get_fetch_stats(),
+                "startup": get_startup_info(),
+                "job_concurrency": JOB_CONCURRENCY,
+                "stream_results": STREAM_RESULTS,
+                "active_jobs": active_jobs,
+                "scheduler": inference_scheduler.stats(),
+                "job_watchdog": {"interrupts": job_watchdog.interrupts},
+                "progress": progress_reporter.stats(),
+                "logging": get_logging_stats(),
+                "quality_planner": quality_planner.stats(),
+                "supported_methods": ["single_scene", "story_batch", "story_stream", "book_cover", "book", "finalize"],
                 "features": [
                     "batch_story_generation",
                     "book_cover_generation",
@@ -731,11 +1714,22 @@ def handler(event):
                     "multiple_scene_prompts",
                     "lora_style_control",
                     "dynamic_lulu_book_formats",
-                    "print_quality_optimization"
+                    "print_quality_optimization",
+                    "streamed_story_scenes",
+                    "generated_image_result_cache",
+                    "multi_character_scenes",
+                    "tiled_print_finalization",
+                    "configurable_output_encoding",
+                    "s3_output_sink",
+                    "remote_reference_images",
+                    "preview_and_finalize",
+                    "whole_book_jobs"
                 ],
                 "input_format": {
                     "scene_prompts": "array of strings - descriptions for each scene",
-                    "reference_images": "array of base64 images - character references",
+                    "reference_images": "array - character references as base64 images, http(s) URLs, 's3://bucket/key' or {key, bucket} objects",
+                    "scene_characters": "array - per scene, the reference image index (or list of indexes) of the characters in it; default [0]",
+                    "cover_characters": "array of numbers - reference image indexes shown on the cover; default [0]",
                     "story_style": "string - LoRA name for artistic style",
                     "story_id": "string - unique identifier for reproducibility",
                     "book_format": "string - Lulu book format ID (pocket_book, us_trade, square_small, etc.)",
@@ -746,7 +1740,27 @@ def handler(event):
                     "subtitle": "string - book subtitle (for covers)",
                     "theme": "string - story theme (for covers)",
                     "print_optimized": "bool - optimized for high-quality print output",
-                    "note": "Generates highest resolution for selected format, upscale to 300 DPI during post-processing"
+                    "print_finalize": "bool - upscale every image to its 300 DPI print size inside the worker",
+                    "print_upscaler": "string - 'local' (tiled LANCZOS) or a WebUI upscaler name such as 'R-ESRGAN 4x+'",
+                    "output_format": "string - 'png' (default), 'webp' or 'jpeg'",
+                    "output_quality": "number - WebP/JPEG quality 1-100 (default 90)",
+                    "output_compress_level": "number - PNG compression level 0-9 (default: WebUI output as-is)",
+                    "thumbnail_size": "number - also return thumbnails with this longest edge",
+                    "output_sink": "string - 'base64' (default) or 's3' to upload images and return object keys/URLs",
+                    "output_bucket": "string - bucket for the s3 sink (default BUCKET_NAME)",
+                    "output_prefix": "string - key prefix for uploaded objects",
+                    "presign_urls": "bool - return presigned GET URLs for uploaded objects (default true)",
+                    "stream": "bool - yield each story scene as soon as it is rendered (workers with STREAM_RESULTS=true)",
+                    "pipeline_depth": "number - story scenes kept in flight against the WebUI (default 2)",
+                    "use_cache": "bool - reuse previously generated images for identical requests seeded by story_id or seed (default true)",
+                    "resume": "bool - skip story scenes already checkpointed for this story_id (default true)",
+                    "deadline_seconds": "number - fit steps and hires settings to finish within this many seconds; stop the job after it and return the scenes finished so far",
+                    "quality": "string - 'final' (default, print settings) or 'preview' (fast drafts without hires fix or face restoration)",
+                    "action": "string - 'generate_book' renders the cover and all scene_prompts in one job; 'finalize' renders scenes of a preview story_id at print quality",
+                    "scene_indexes": "array of numbers - approved scenes to finalize (default: all)",
+                    "from_preview": "bool - finalize img2img from each scene's preview image (default false)",
+                    "seed": "number - cover seed; pass a preview's seed_used to finalize that cover",
+                    "note": "Generates highest resolution for selected format; set print_finalize to return 300 DPI images"
                 }
             }
         
@@ -755,56 +1769,50 @@ def handler(event):
             return {"error": "No input provided"}
         
         input_data = event["input"]
+        job_id = event.get("id") or uuid.uuid4().hex
+        
+        # Stop other running jobs (needs JOB_CONCURRENCY > 1 to arrive while they run)
+        if input_data.get("action") == "cancel_job":
+            if not input_data.get("job_id") and not input_data.get("story_id"):
+                return {"error": "cancel_job needs 'job_id' or 'story_id'"}
+            return {"cancelled_jobs": cancel_jobs(input_data.get("job_id"), input_data.get("story_id"))}
+        
+        # Print-quality versions of approved preview scenes
+        if input_data.get("action") == "finalize":
+            if not input_data.get("story_id"):
+                return {"error": "finalize needs the 'story_id' of a preview"}
+            return finalize_story(input_data["story_id"], input_data.get("scene_indexes"), input_data, job_id)
         
         # Check if this is a book cover generation request
         if input_data.get("action") == "generate_book_cover":
-            # BOOK COVER GENERATION
-            title = input_data.get("title", "Untitled Book")
-            author = input_data.get("author", "Unknown Author")
-            style = input_data.get("story_style", "picture_book")
-            theme = input_data.get("theme", "Adventure")
-            reference_images = input_data.get("reference_images", [])
-            
-            result = generate_book_cover(title, author, style, theme, reference_images)
-            return result
+            return generate_cover_from_input(
+                input_data, job_id, input_data.get("author", "Unknown Author"), "Untitled Book", "Adventure"
+            )
         
         # Check if this is a batch story request
         scene_prompts = input_data.get("scene_prompts", [])
+        if input_data.get("action") == "generate_book" and not scene_prompts:
+            return {"error": "generate_book needs 'scene_prompts'"}
         
         # Check if this is a book cover request
         if input_data.get("generation_type") == "book_cover":
-            # BOOK COVER GENERATION
-            title = input_data.get("title", "Untitled Story")
-            subtitle = input_data.get("subtitle", "")
-            theme = input_data.get("theme", "magical adventure")
-            style = input_data.get("story_style", "picture_book")
-            reference_images = input_data.get("reference_images", [])
-            book_format = input_data.get("book_format", "square_small")
-            custom_width = input_data.get("custom_width")
-            custom_height = input_data.get("custom_height")
-            
-            result = generate_book_cover(title, subtitle, style, theme, reference_images, book_format, custom_width, custom_height)
-            return result
+            return generate_cover_from_input(
+                input_data, job_id, input_data.get("subtitle", ""), "Untitled Story", "magical adventure"
+            )
             
         elif scene_prompts and len(scene_prompts) > 0:
             # BATCH STORY GENERATION
             reference_images = input_data.get("reference_images", [])
             
-            story_config = {
-                "story_style": input_data.get("story_style", "picture_book"),
-                "story_id": input_data.get("story_id"),
-                "book_format": input_data.get("book_format", "square_small"),
-                "custom_width": input_data.get("custom_width"),
-                "custom_height": input_data.get("custom_height"),
-                "lora_weight": input_data.get("lora_weight", 1.0),
-                "character_strength": input_data.get("character_strength", 0.65),
-                "steps": input_data.get("steps", 45),  # Increased for print quality scenes
-                "cfg_scale": input_data.get("cfg_scale", 7.5),
-                "width": input_data.get("width"),   # Optional override
-                "height": input_data.get("height"), # Optional override
-                "negative_prompt": input_data.get("negative_prompt"),
-                "sampler_name": input_data.get("sampler_name", "DPM++ 2M Karras")
-            }
+            story_config = build_story_config(input_data, job_id)
+            
+            # Cover and scenes as one job
+            if input_data.get("action") == "generate_book":
+                return generate_book(scene_prompts, reference_images, story_config, input_data)
+            
+            # Stream scenes back one by one when requested
+            if input_data.get("stream"):
+                return stream_story_batch(scene_prompts, reference_images, story_config)
             
             # Generate the complete story
             result = generate_story_batch(scene_prompts, reference_images, story_config)
@@ -817,37 +1825,127 @@ def handler(event):
                 return {"error": "Either 'scene_prompts' array or single 'prompt' is required"}
             
             reference_images = input_data.get("reference_images", [])
-            story_config = {
-                "story_style": input_data.get("story_style", "picture_book"),
-                "story_id": input_data.get("story_id"),
-                "book_format": input_data.get("book_format", "square_small"),
-                "custom_width": input_data.get("custom_width"),
-                "custom_height": input_data.get("custom_height"),
-                "lora_weight": input_data.get("lora_weight", 1.0),
-                "character_strength": input_data.get("character_strength", 0.65),
-                "steps": input_data.get("steps", 45),  # Increased for print quality scenes
-                "cfg_scale": input_data.get("cfg_scale", 7.5),
-                "width": input_data.get("width"),   # Optional override
-                "height": input_data.get("height"), # Optional override
-                "negative_prompt": input_data.get("negative_prompt"),
-                "sampler_name": input_data.get("sampler_name", "DPM++ 2M Karras")
-            }
+            story_config = build_story_config(input_data, job_id)
             
             inference_request, method = build_single_scene_request(
                 scene_prompt, reference_images, story_config
             )
+            plan = plan_for_deadline(inference_request, job_id)
             
-            result = run_inference(inference_request, method)
+            result = run_inference(inference_request, method, is_cacheable(story_config), job_id)
+            if plan:
+                plan["achieved_seconds"] = result.get("timings", {}).get("service_seconds")
+                result["plan"] = plan
+            if story_config["print_finalize"] and story_config["quality"] != "preview":
+                finalize_for_print(result, get_print_format(story_config), story_config["print_upscaler"])
+            encode_result_images(result, get_output_options(story_config))
+            story_id = story_config["story_id"]
+            upload_result_images(result, story_config, f"{story_id}/scene" if story_id else f"scenes/{uuid.uuid4().hex}")
             result["method_used"] = method
             result["story_config"] = story_config
             
             return result
         
+    except InvalidJobInput as err:
+        logger.warning(f"Invalid job input: {err}")
+        return {"error": f"Invalid input: {err}"}
+        
     except Exception as err:
         logger.error(f"Handler error: {err}")
         return {"error": f"Handler failed: {str(err)}"}
 
 
+def stream_handler(event):
+    """
+    Streaming handler for story batch generation (STREAM_RESULTS)
+    
+    Streamed story batches yield one dict per scene, every other job yields
+    its single result.
+    """
+    # Control actions answer at once, even during startup
+    if event.get("input", {}).get("action") in ("get_info", "get_metrics", "debug_env", "cancel_job"):
+        yield process_job(event)
+        return
+    
+    not_ready = wait_until_ready()
+    if not_ready:
+        yield {"error": not_ready}
+        return
+    
+    # Deadline and cancellation state for every thread working on this job
+    job_id = event.setdefault("id", uuid.uuid4().hex)
+    input_data = event.get("input") or {}
+    try:
+        deadline_seconds = parse_deadline(input_data)
+    except InvalidJobInput as err:
+        logger.warning(f"Invalid job input: {err}")
+        yield {"error": f"Invalid input: {err}"}
+        return
+    register_job(job_id, deadline_seconds, input_data.get("story_id"))
+    progress_reporter.start_job(job_id, event)
+    job_start = time.monotonic()
+    stage_metrics.add_bytes("job_input", len(json.dumps(input_data, default=str)))
+    # Every log line of the job carries its job_id and story_id
+    context = {"job_id": job_id, "story_id": input_data.get("story_id")}
+    try:
+        with log_context(**context):
+            result = process_job(event)
+        for partial in iterate_in_context(result if inspect.isgenerator(result) else [result], **context):
+            with stage_metrics.timer("serialize"):
+                stage_metrics.add_bytes("job_output", len(json.dumps(partial, default=str)))
+            yield partial
+    finally:
+        quality_planner.save(force=True)
+        stage_metrics.observe("job", time.monotonic() - job_start)
+        progress_reporter.finish_job(job_id)
+        unregister_job(job_id)
+
+
+def handler(event):
+    """Main handler for story batch generation: one result dict per job"""
+    input_data = event.get("input") or {}
+    if input_data.get("stream"):
+        logger.warning("Streaming is off on this worker (STREAM_RESULTS=false), returning the whole result")
+        event["input"] = {**input_data, "stream": False}
+    # Without "stream" every job yields exactly one result
+    return list(stream_handler(event))[0]
+
+
+async def async_handler(event):
+    """
+    Concurrent entry point: runs `handler` in a worker thread
+    
+    RunPod runs plain handlers on its event loop, which would serialize
+    jobs; running them in a thread lets JOB_CONCURRENCY jobs overlap.
+    """
+    global active_jobs
+    active_jobs += 1
+    try:
+        return await asyncio.to_thread(handler, event)
+    finally:
+        active_jobs -= 1
+
+
+async def async_stream_handler(event):
+    """Concurrent entry point of stream_handler, stepping the generator in a worker thread"""
+    global active_jobs
+    active_jobs += 1
+    try:
+        results = stream_handler(event)
+        done = object()
+        while True:
+            partial = await asyncio.to_thread(next, results, done)
+            if partial is done:
+                break
+            yield partial
+    finally:
+        active_jobs -= 1
+
+
+def concurrency_modifier(current_concurrency):
+    return JOB_CONCURRENCY
+
+
 if __name__ == "__main__":
     logger.info("Starting Story Batch Generation Worker...")
     
@@ -855,13 +1953,15 @@ if __name__ == "__main__":
         logger.error("Dependency check failed. Exiting.")
         sys.exit(1)
     
-    if not validate_webui_startup():
-        logger.error("WebUI startup validation failed. Exiting.")
-        sys.exit(1)
-    
-    if not wait_for_service(url=LOCAL_URL):
-        logger.error("WebUI API service failed to start. Exiting.")
-        sys.exit(1)
+    # Register with RunPod straight away; jobs are held until the backend is warm
+    threading.Thread(target=orchestrate_startup, name="startup", daemon=True).start()
+    job_watchdog.start()
+    progress_reporter.start()
     
-    logger.info("Story Batch Generation Service is ready. Starting RunPod Serverless...")
-    runpod.serverless.start({"handler": handler})
\ No newline at end of file
+    logger.info("Starting RunPod Serverless while the WebUI boots...")
+    runpod.serverless.start({
+        "handler": (async_stream_handler if JOB_CONCURRENCY > 1 else stream_handler) if STREAM_RESULTS
+                   else (async_handler if JOB_CONCURRENCY > 1 else handler),
+        "concurrency_modifier": concurrency_modifier,
+        "return_aggregate_stream": RETURN_AGGREGATE_STREAM
+    })
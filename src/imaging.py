@@ -0,0 +1,300 @@
+import os
+import math
+import zlib
+import struct
+import base64
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageOps
+
+# Init images only feed img2img, so favour encode speed over file size:
+# PNG at compression level 1 is lossless and several times faster than the default
+INIT_IMAGE_FORMAT = os.getenv("INIT_IMAGE_FORMAT", "png").lower()
+INIT_IMAGE_PNG_COMPRESS_LEVEL = int(os.getenv("INIT_IMAGE_PNG_COMPRESS_LEVEL", "1"))
+INIT_IMAGE_JPEG_QUALITY = int(os.getenv("INIT_IMAGE_JPEG_QUALITY", "95"))
+
+# Output tile edge for print upscaling; peak memory is one row of tiles
+PRINT_TILE_SIZE = int(os.getenv("PRINT_TILE_SIZE", "512"))
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+# ---------------------------------------------------------------------------- #
+#                           Reference Image Ingest                             #
+# ---------------------------------------------------------------------------- #
+def _cover_box(width, height, target_width, target_height):
+    """Centred crop box with the target aspect ratio"""
+    target_ratio = target_width / target_height
+    if width / height > target_ratio:
+        crop_width = height * target_ratio
+        left = (width - crop_width) / 2
+        return (left, 0, left + crop_width, height)
+
+    crop_height = width / target_ratio
+    top = (height - crop_height) / 2
+    return (0, top, width, top + crop_height)
+
+
+def load_reference_image(image_bytes, target_width, target_height):
+    """
+    Decode an uploaded photo straight to target_width x target_height RGB
+
+    Large JPEGs are decoded at a reduced DCT scale (draft mode) that is still
+    at least as large as the target, EXIF orientation is applied, and the
+    image is centre-cropped to the target aspect ratio instead of stretched.
+    """
+    image = Image.open(BytesIO(image_bytes))
+
+    orientation = image.getexif().get(0x0112, 1)
+    if image.format == "JPEG":
+        # Draft sizes are in stored (pre-rotation) orientation
+        draft_size = (target_width, target_height)
+        if orientation in _TRANSPOSED_ORIENTATIONS:
+            draft_size = (target_height, target_width)
+        # Request the size the crop will need, not just the target, so the
+        # draft never undershoots the short side
+        scale = max(draft_size[0] / image.width, draft_size[1] / image.height)
+        image.draft("RGB", (int(image.width * scale) + 1, int(image.height * scale) + 1))
+
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+
+    box = _cover_box(image.width, image.height, target_width, target_height)
+    # reducing_gap lets Pillow shrink by integer factors before the LANCZOS pass
+    return image.resize((target_width, target_height), Image.Resampling.LANCZOS, box=box, reducing_gap=3.0)
+
+
+def encode_init_image(image):
+    """Encode an init image as base64 using the configured fast codec"""
+    buffer = BytesIO()
+    if INIT_IMAGE_FORMAT == "jpeg":
+        image.save(buffer, format="JPEG", quality=INIT_IMAGE_JPEG_QUALITY)
+    else:
+        image.save(buffer, format="PNG", compress_level=INIT_IMAGE_PNG_COMPRESS_LEVEL)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def ingest_reference_image(image_bytes, target_width, target_height):
+    """Decode, orient, crop and resize a reference photo and return it as base64"""
+    return encode_init_image(load_reference_image(image_bytes, target_width, target_height))
+
+
+def decode_image_b64(image_b64):
+    """Decode a base64 image (init image or WebUI output) to RGB"""
+    return Image.open(BytesIO(base64.b64decode(image_b64))).convert("RGB")
+
+
+def compose_character_sheet(images, target_width, target_height):
+    """
+    Place several character references side by side in one init image
+
+    img2img takes a single init image per generation, so a scene with more
+    than one character gets every reference in its own vertical slot.
+    """
+    sheet = Image.new("RGB", (target_width, target_height))
+    slot_edges = [round(i * target_width / len(images)) for i in range(len(images) + 1)]
+
+    for image, left, right in zip(images, slot_edges, slot_edges[1:]):
+        slot_width = right - left
+        box = _cover_box(image.width, image.height, slot_width, target_height)
+        sheet.paste(image.resize((slot_width, target_height), Image.Resampling.LANCZOS, box=box), (left, 0))
+
+    return sheet
+
+
+# ---------------------------------------------------------------------------- #
+#                           Tiled Print Upscaling                              #
+# ---------------------------------------------------------------------------- #
+def _filter_scanlines(rows, previous):
+    """
+    PNG scanlines of `rows` (uint8, rows x stride, 3 bytes per pixel), each
+    with the filter type giving the smallest sum of absolute residuals
+    """
+    x = rows.astype(np.int16)
+    up = np.vstack((previous[None, :], rows[:-1])).astype(np.int16)
+    left = np.zeros_like(x)
+    left[:, 3:] = x[:, :-3]
+    up_left = np.zeros_like(up)
+    up_left[:, 3:] = up[:, :-3]
+
+    # Paeth predictor: whichever of left, up and up-left is closest to left + up - up-left
+    distance_left = np.abs(up - up_left)
+    distance_up = np.abs(left - up_left)
+    distance_up_left = np.abs(left + up - 2 * up_left)
+    paeth = np.where(
+        (distance_left <= distance_up) & (distance_left <= distance_up_left), left,
+        np.where(distance_up <= distance_up_left, up, up_left)
+    )
+
+    # None, Sub, Up, Average, Paeth
+    residuals = np.stack((x, x - left, x - up, x - (left + up) // 2, x - paeth)).astype(np.uint8)
+    scores = np.abs(residuals.view(np.int8).astype(np.int32)).sum(axis=2)
+    choice = scores.argmin(axis=0)
+
+    scanlines = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+    scanlines[:, 0] = choice
+    scanlines[:, 1:] = residuals[choice, np.arange(rows.shape[0])]
+    return scanlines.tobytes()
+
+
+class StreamingPNGWriter:
+    """
+    Minimal RGB PNG encoder fed one band of rows at a time
+
+    Only the compressed output and the current band are ever in memory, so
+    arbitrarily large images can be written without holding their pixels.
+    """
+
+    # Scanlines filtered per pass, bounding the filter's scratch memory
+    FILTER_ROWS = 64
+
+    def __init__(self, width, height, compress_level=6):
+        self.width = width
+        self.height = height
+        self._out = BytesIO()
+        self._compressor = zlib.compressobj(compress_level)
+        self._rows_written = 0
+        # The row above the next one; the first row is filtered against zeros
+        self._previous = np.zeros(width * 3, dtype=np.uint8)
+
+        self._out.write(b"\x89PNG\r\n\x1a\n")
+        # 8-bit RGB, deflate, standard filter set chosen per scanline, no interlace
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+
+    def _chunk(self, kind, data):
+        self._out.write(struct.pack(">I", len(data)))
+        self._out.write(kind)
+        self._out.write(data)
+        self._out.write(struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+    def write_rows(self, band):
+        """Append an RGB image exactly `width` pixels wide"""
+        rows = np.asarray(band, dtype=np.uint8).reshape(band.height, self.width * 3)
+        for start in range(0, band.height, self.FILTER_ROWS):
+            chunk = rows[start:start + self.FILTER_ROWS]
+            compressed = self._compressor.compress(_filter_scanlines(chunk, self._previous))
+            if compressed:
+                self._chunk(b"IDAT", compressed)
+            self._previous = chunk[-1].copy()
+        self._rows_written += band.height
+
+    def finish(self):
+        """Return the complete PNG file"""
+        if self._rows_written != self.height:
+            raise ValueError(f"PNG expects {self.height} rows, got {self._rows_written}")
+        self._chunk(b"IDAT", self._compressor.flush())
+        self._chunk(b"IEND", b"")
+        return self._out.getvalue()
+
+
+def _upscale_tile_with_model(source, box, size, upscale_tile, overlap):
+    """
+    Upscale one output tile through an external upscaler
+
+    The source crop is padded by `overlap` pixels so the model sees context
+    across tile seams; the padding is cropped away after upscaling.
+    """
+    left = max(0, math.floor(box[0]) - overlap)
+    top = max(0, math.floor(box[1]) - overlap)
+    right = min(source.width, math.ceil(box[2]) + overlap)
+    bottom = min(source.height, math.ceil(box[3]) + overlap)
+    crop = source.crop((left, top, right, bottom))
+
+    factor = max(size[0] / (box[2] - box[0]), size[1] / (box[3] - box[1]))
+    upscaled = upscale_tile(crop, factor)
+
+    scale_x = upscaled.width / crop.width
+    scale_y = upscaled.height / crop.height
+    inner = (
+        (box[0] - left) * scale_x, (box[1] - top) * scale_y,
+        (box[2] - left) * scale_x, (box[3] - top) * scale_y
+    )
+    return upscaled.resize(size, Image.Resampling.LANCZOS, box=inner)
+
+
+def upscale_to_print(image_b64, target_width, target_height, upscale_tile=None, tile_size=PRINT_TILE_SIZE, overlap=16):
+    """
+    Upscale a generated image to its print size, one tile at a time
+
+    The image is centre-cropped to the print aspect ratio. Each output tile
+    is rendered from its own source box, either locally with LANCZOS or
+    through `upscale_tile(image, factor)` (e.g. an ESRGAN model behind the
+    WebUI), and written out band by band as PNG. Peak memory is one row of
+    tiles regardless of the print size. Returns the PNG as base64.
+    """
+    source = decode_image_b64(image_b64)
+    box_left, box_top, box_right, box_bottom = _cover_box(source.width, source.height, target_width, target_height)
+    scale_x = (box_right - box_left) / target_width
+    scale_y = (box_bottom - box_top) / target_height
+
+    writer = StreamingPNGWriter(target_width, target_height)
+    for out_top in range(0, target_height, tile_size):
+        out_bottom = min(out_top + tile_size, target_height)
+        band = Image.new("RGB", (target_width, out_bottom - out_top))
+
+        for out_left in range(0, target_width, tile_size):
+            out_right = min(out_left + tile_size, target_width)
+            size = (out_right - out_left, out_bottom - out_top)
+            box = (
+                box_left + out_left * scale_x, box_top + out_top * scale_y,
+                box_left + out_right * scale_x, box_top + out_bottom * scale_y
+            )
+            if upscale_tile is None:
+                # Resampling reads outside the box where needed, so tiles are seamless
+                tile = source.resize(size, Image.Resampling.LANCZOS, box=box)
+            else:
+                tile = _upscale_tile_with_model(source, box, size, upscale_tile, overlap)
+            band.paste(tile, (out_left, 0))
+
+        writer.write_rows(band)
+
+    return base64.b64encode(writer.finish()).decode()
+
+
+# ---------------------------------------------------------------------------- #
+#                              Output Encoding                                 #
+# ---------------------------------------------------------------------------- #
+OUTPUT_FORMATS = ("png", "webp", "jpeg")
+
+
+def base64_size(image_b64):
+    """Decoded size in bytes of a base64 string, without decoding it"""
+    return len(image_b64) * 3 // 4 - image_b64[-2:].count("=")
+
+
+def _encode(image, output_format, quality, compress_level):
+    buffer = BytesIO()
+    if output_format == "jpeg":
+        image.save(buffer, format="JPEG", quality=quality, optimize=True)
+    elif output_format == "webp":
+        image.save(buffer, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(buffer, format="PNG", compress_level=compress_level)
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def encode_output_image(image_b64, output_format="png", quality=90, compress_level=None, thumbnail_size=None):
+    """
+    Re-encode a generated PNG for the response, decoding it only once
+
+    PNG output without a compression level or thumbnail is passed through
+    untouched. Returns {"image", "thumbnail"} with the thumbnail (longest edge
+    thumbnail_size) in the same format, or None.
+    """
+    if output_format == "png" and compress_level is None and not thumbnail_size:
+        return {"image": image_b64, "thumbnail": None}
+
+    image = decode_image_b64(image_b64)
+    if output_format == "png" and compress_level is None:
+        encoded = image_b64
+    else:
+        encoded = _encode(image, output_format, quality, 6 if compress_level is None else compress_level)
+
+    thumbnail = None
+    if thumbnail_size:
+        image.thumbnail((thumbnail_size, thumbnail_size), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        thumbnail = _encode(image, output_format, quality, 6 if compress_level is None else compress_level)
+
+    return {"image": encoded, "thumbnail": thumbnail}
@@ -0,0 +1,179 @@
+import os
+import time
+import logging
+import threading
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Deadline for jobs that do not set deadline_seconds; 0 means none
+DEFAULT_JOB_DEADLINE = float(os.getenv("DEFAULT_JOB_DEADLINE", "0"))
+WATCHDOG_INTERVAL = float(os.getenv("WATCHDOG_INTERVAL", "0.5"))
+# Time an interrupted WebUI request gets to return after the deadline
+INTERRUPT_GRACE_SECONDS = float(os.getenv("INTERRUPT_GRACE_SECONDS", "10"))
+
+# With an API key the watchdog also notices jobs cancelled through RunPod's /cancel
+RUNPOD_API_KEY = os.getenv("RUNPOD_API_KEY")
+RUNPOD_ENDPOINT_ID = os.getenv("RUNPOD_ENDPOINT_ID")
+CANCEL_POLL_SECONDS = float(os.getenv("CANCEL_POLL_SECONDS", "5"))
+
+
+class JobCancelled(Exception):
+    """The job was cancelled or ran past its deadline"""
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Job Control                                  #
+# ---------------------------------------------------------------------------- #
+class JobControl:
+    """Deadline and cancellation state shared by every thread of one job"""
+
+    def __init__(self, job_id, deadline_seconds=None, story_id=None):
+        self.job_id = job_id
+        self.story_id = story_id
+        self.started_at = time.monotonic()
+        self.deadline = self.started_at + deadline_seconds if deadline_seconds else None
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason="cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+            logger.warning(f"Stopping job {self.job_id}: {reason}")
+
+    @property
+    def cancelled(self):
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel(f"deadline of {self.deadline - self.started_at:.0f}s exceeded")
+        return self._event.is_set()
+
+    def remaining(self):
+        """Seconds left before the deadline, None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def budget(self, timeout):
+        """`timeout` capped by the time left before the deadline"""
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining)
+
+    def request_timeout(self, timeout):
+        """
+        HTTP timeout for a WebUI request of this job
+
+        Runs past the deadline by a grace period: the watchdog interrupts the
+        generation at the deadline and the request should then return.
+        """
+        remaining = self.remaining()
+        return timeout if remaining is None else min(timeout, remaining + INTERRUPT_GRACE_SECONDS)
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise JobCancelled(self.reason)
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def register_job(job_id, deadline_seconds=None, story_id=None):
+    control = JobControl(job_id, deadline_seconds or DEFAULT_JOB_DEADLINE or None, story_id)
+    with _jobs_lock:
+        _jobs[job_id] = control
+    return control
+
+
+def unregister_job(job_id):
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+
+
+def get_job_control(job_id):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def cancel_jobs(job_id=None, story_id=None, reason="cancelled by request"):
+    """Cancel running jobs by RunPod job id or story id; returns their ids"""
+    with _jobs_lock:
+        matches = [
+            control for control in _jobs.values()
+            if (job_id and control.job_id == job_id) or (story_id and control.story_id == story_id)
+        ]
+    for control in matches:
+        control.cancel(reason)
+    return [control.job_id for control in matches]
+
+
+def active_job_controls():
+    with _jobs_lock:
+        return list(_jobs.values())
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Watchdog                                    #
+# ---------------------------------------------------------------------------- #
+def _runpod_status(job_id):
+    response = requests.get(
+        f"https://api.runpod.ai/v2/{RUNPOD_ENDPOINT_ID}/status/{job_id}",
+        headers={"Authorization": f"Bearer {RUNPOD_API_KEY}"},
+        timeout=5
+    )
+    response.raise_for_status()
+    return response.json().get("status")
+
+
+class JobWatchdog:
+    """
+    Enforces deadlines and cancellations on in-flight GPU work
+
+    Every interval it expires overdue jobs and calls `interrupt(job_id)` for
+    stopped jobs, which should interrupt the job's running WebUI request and
+    return whether the job still has requests at a backend. With
+    RUNPOD_API_KEY set it also polls RunPod for jobs cancelled by the client.
+    """
+
+    def __init__(self, interrupt, interval=WATCHDOG_INTERVAL):
+        self.interrupt = interrupt
+        self.interval = interval
+        self.interrupts = 0
+        self._last_poll = 0.0
+        self._thread = None
+
+    def _poll_runpod(self, controls):
+        self._last_poll = time.monotonic()
+        for control in controls:
+            if control.cancelled:
+                continue
+            try:
+                status = _runpod_status(control.job_id)
+            except Exception as e:
+                logger.debug(f"Status check for job {control.job_id} failed: {e}")
+                continue
+            if status in ("CANCELLED", "TIMED_OUT"):
+                control.cancel(f"job {status.lower()} on RunPod")
+
+    def tick(self):
+        controls = active_job_controls()
+        if RUNPOD_API_KEY and RUNPOD_ENDPOINT_ID and time.monotonic() - self._last_poll >= CANCEL_POLL_SECONDS:
+            self._poll_runpod(controls)
+
+        for control in controls:
+            if control.cancelled and self.interrupt(control.job_id):
+                self.interrupts += 1
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.tick()
+            except Exception as e:
+                logger.error(f"Job watchdog failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="job-watchdog", daemon=True)
+            self._thread.start()
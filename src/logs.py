@@ -0,0 +1,232 @@
+import os
+import sys
+import json
+import time
+import zlib
+import queue
+import atexit
+import logging
+import logging.handlers
+import contextvars
+from contextlib import contextmanager
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "json" (one object per line) or "text"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+# Share of scenes whose info and debug lines are written; warnings and errors always are
+LOG_SCENE_SAMPLE_RATE = float(os.getenv("LOG_SCENE_SAMPLE_RATE", "1.0"))
+# Messages and tracebacks longer than this are cut
+LOG_MAX_MESSAGE_CHARS = int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000"))
+# Records waiting for the writer thread; when full, new records are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+CONTEXT_FIELDS = ("job_id", "story_id", "scene_index")
+_context = {field: contextvars.ContextVar(f"log_{field}", default=None) for field in CONTEXT_FIELDS}
+
+
+def truncate(text, limit=LOG_MAX_MESSAGE_CHARS):
+    if text is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more chars]"
+
+
+@contextmanager
+def log_context(**fields):
+    """Attach job_id, story_id and/or scene_index to every record logged in this block"""
+    tokens = [(_context[field], _context[field].set(value)) for field, value in fields.items()]
+    try:
+        yield
+    finally:
+        for variable, token in reversed(tokens):
+            variable.reset(token)
+
+
+def bind_log_context(function, **fields):
+    """`function` wrapped to run inside log_context(**fields), for thread pools"""
+    def run(*args, **kwargs):
+        with log_context(**fields):
+            return function(*args, **kwargs)
+    return run
+
+
+def iterate_in_context(iterable, **fields):
+    """
+    Iterate with log_context(**fields) around every step
+
+    Context variables set inside a generator do not survive a step that runs
+    in another thread or context (async_stream_handler steps
+    `stream_handler` with asyncio.to_thread), so the fields are set again
+    for each step.
+    """
+    iterator = iter(iterable)
+    while True:
+        with log_context(**fields):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+
+# ---------------------------------------------------------------------------- #
+#                                 Log Records                                  #
+# ---------------------------------------------------------------------------- #
+class ContextFilter(logging.Filter):
+    """
+    Adds the correlation fields to records and samples per-scene lines
+
+    Fields passed with `extra` win over the context. A scene is either kept
+    or dropped as a whole, decided by a hash of job_id and scene_index, so
+    sampled scenes keep all their lines.
+    """
+
+    def __init__(self, sample_rate=LOG_SCENE_SAMPLE_RATE):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def filter(self, record):
+        for field, variable in _context.items():
+            if getattr(record, field, None) is None:
+                setattr(record, field, variable.get())
+        if record.scene_index is not None and record.levelno < logging.WARNING and self.sample_rate < 1.0:
+            key = f"{record.job_id}:{record.scene_index}".encode()
+            if zlib.crc32(key) % 10000 >= self.sample_rate * 10000:
+                self.sampled_out += 1
+                return False
+        return True
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that drops (and counts) records beyond max_size instead of blocking
+
+    The queue is a SimpleQueue, which is thread-safe on its own, so records
+    skip the handler lock every other handler takes.
+    """
+
+    def __init__(self, log_queue, max_size=LOG_QUEUE_SIZE):
+        super().__init__(log_queue)
+        self.max_size = max_size
+        self.dropped = 0
+
+    def handle(self, record):
+        if not self.filter(record):
+            return False
+        self.emit(record)
+        return True
+
+    def prepare(self, record):
+        # Only merge the arguments here; formatting happens on the writer thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        if self.queue.qsize() >= self.max_size:
+            self.dropped += 1
+            return
+        self.queue.put(record)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record with time, level, source, message and correlation fields"""
+
+    def format(self, record):
+        document = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "source": f"{record.filename}:{record.lineno}",
+            "message": truncate(record.getMessage())
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                document[field] = value
+        if record.exc_text:
+            document["exception"] = truncate(record.exc_text)
+        return json.dumps(document, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """The classic "time - level - message" format plus the correlation fields that are set"""
+
+    def format(self, record):
+        record.message = truncate(record.getMessage())
+        line = f"{self.formatTime(record)} - {record.levelname} - {record.message}"
+        fields = " ".join(
+            f"{field}={getattr(record, field)}" for field in CONTEXT_FIELDS if getattr(record, field, None) is not None
+        )
+        if fields:
+            line = f"{line} [{fields}]"
+        if record.exc_text:
+            line = f"{line}\n{truncate(record.exc_text)}"
+        return line
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Log Setup                                   #
+# ---------------------------------------------------------------------------- #
+_queue_handler = None
+_context_filter = None
+_listener = None
+
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT, stream=None):
+    """
+    Route every log record through a queue to a writer thread
+
+    Replaces the root handlers (the RunPod SDK installs a synchronous
+    stderr handler), so callers only pay for the filter and a queue put.
+    Safe to call more than once; later calls keep the first setup.
+    """
+    global _queue_handler, _context_filter, _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(JsonFormatter() if log_format == "json" else TextFormatter())
+
+    log_queue = queue.SimpleQueue()
+    _context_filter = ContextFilter()
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(_context_filter)
+
+    root = logging.getLogger()
+    root.handlers = [_queue_handler]
+    root.setLevel(level)
+
+    # Neither formatter writes thread or process names; skip looking them up per record
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    _listener = logging.handlers.QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Write out the queued records and stop the writer thread"""
+    global _listener
+    listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logging_stats():
+    if _queue_handler is None:
+        return {"configured": False}
+    return {
+        "configured": True,
+        "format": LOG_FORMAT,
+        "level": logging.getLevelName(logging.getLogger().level),
+        "scene_sample_rate": _context_filter.sample_rate,
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "sampled_out": _context_filter.sampled_out
+    }
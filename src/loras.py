@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import struct
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Searched in order; the first directory holding a name wins. LoRAs are provisioned into the first.
+LORA_DIRS = [
+    path for path in os.getenv(
+        "LORA_DIRS",
+        "/stable-diffusion-webui/models/Lora:/workspace/stable-diffusion-webui/models/Lora"
+    ).split(":") if path
+]
+# How often lookups may look for added / removed files
+LORA_RESCAN_SECONDS = float(os.getenv("LORA_RESCAN_SECONDS", "30"))
+
+LORA_EXTENSIONS = (".safetensors", ".pt", ".ckpt")
+
+# Training metadata worth reporting; the rest of __metadata__ can be very large
+_METADATA_KEYS = (
+    "ss_output_name",
+    "ss_base_model_version",
+    "ss_sd_model_name",
+    "ss_network_module",
+    "ss_network_dim",
+    "ss_network_alpha",
+    "ss_resolution",
+    "ss_num_train_images",
+    "ss_training_finished_at",
+    "modelspec.title",
+    "modelspec.architecture",
+)
+
+
+def read_safetensors_metadata(path, max_header_bytes=64 * 1024**2):
+    """
+    Summary of a .safetensors header without loading any tensors
+
+    The file starts with a little-endian u64 header length followed by a JSON
+    header, so only those bytes are read.
+    """
+    with open(path, "rb") as f:
+        header_length = struct.unpack("<Q", f.read(8))[0]
+        if header_length > max_header_bytes:
+            raise ValueError(f"header of {header_length} bytes")
+        header = json.loads(f.read(header_length))
+
+    metadata = header.pop("__metadata__", None) or {}
+    return {
+        "tensors": len(header),
+        **{key: metadata[key] for key in _METADATA_KEYS if key in metadata}
+    }
+
+
+# ---------------------------------------------------------------------------- #
+#                               LoRA Registry                                  #
+# ---------------------------------------------------------------------------- #
+class LoraRegistry:
+    """
+    In-memory index of the LoRAs installed in the WebUI Lora directories
+
+    Built by one scan at startup. Lookups are dictionary hits; at most every
+    rescan_seconds a lookup also compares the directory mtimes and, when a
+    directory changed, re-reads only files whose size or mtime changed. New
+    styles can therefore be dropped onto the volume without a redeploy.
+    """
+
+    def __init__(self, directories=LORA_DIRS, rescan_seconds=LORA_RESCAN_SECONDS, on_change=None):
+        self.directories = list(directories)
+        self.rescan_seconds = rescan_seconds
+        self.on_change = on_change
+
+        self.scans = 0
+        self.last_scan_seconds = 0.0
+
+        self._lock = threading.Lock()
+        self._entries = {}  # name -> entry
+        self._dir_mtimes = {}
+        self._next_check = 0.0
+
+        self.refresh()
+
+    def _dir_mtime(self, directory):
+        try:
+            return os.stat(directory).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan(self):
+        """Rebuild the index, reusing entries whose files did not change"""
+        start = time.monotonic()
+        entries = {}
+        for directory in self.directories:
+            try:
+                filenames = sorted(os.listdir(directory))
+            except OSError:
+                continue
+
+            for filename in filenames:
+                name, extension = os.path.splitext(filename)
+                if extension.lower() not in LORA_EXTENSIONS or name in entries:
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    # Follows symlinks into the volume cache
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                previous = self._entries.get(name)
+                if previous and previous["path"] == path and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                    entries[name] = previous
+                    continue
+
+                entry = {"name": name, "path": path, "size": stat.st_size, "mtime": stat.st_mtime, "metadata": {}}
+                if extension.lower() == ".safetensors":
+                    try:
+                        entry["metadata"] = read_safetensors_metadata(path)
+                    except Exception as e:
+                        logger.warning(f"Unreadable safetensors header in {path}: {e}")
+                        entry["metadata"] = {"error": str(e)}
+                entries[name] = entry
+
+        added = sorted(set(entries) - set(self._entries))
+        removed = sorted(set(self._entries) - set(entries))
+        self._entries = entries
+        self.scans += 1
+        self.last_scan_seconds = round(time.monotonic() - start, 4)
+        return added, removed
+
+    def refresh(self, force=True):
+        """
+        Rescan if forced or any directory changed; returns (added, removed)
+        """
+        with self._lock:
+            dir_mtimes = {directory: self._dir_mtime(directory) for directory in self.directories}
+            self._next_check = time.monotonic() + self.rescan_seconds
+            if not force and dir_mtimes == self._dir_mtimes:
+                return [], []
+            self._dir_mtimes = dir_mtimes
+            added, removed = self._scan()
+
+        if added or removed:
+            logger.info(
+                f"LoRA registry: {len(self._entries)} installed"
+                + (f", added {', '.join(added)}" if added else "")
+                + (f", removed {', '.join(removed)}" if removed else "")
+            )
+            if self.on_change and self.scans > 1:
+                try:
+                    self.on_change(added, removed)
+                except Exception as e:
+                    logger.warning(f"LoRA change callback failed: {e}")
+        return added, removed
+
+    def _maybe_refresh(self):
+        if time.monotonic() >= self._next_check:
+            self.refresh(force=False)
+
+    def get(self, name):
+        """Registry entry for a LoRA name, or None when it is not installed"""
+        self._maybe_refresh()
+        return self._entries.get(name)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def names(self):
+        self._maybe_refresh()
+        return sorted(self._entries)
+
+    def describe(self):
+        """Installed LoRAs for the get_info action"""
+        self._maybe_refresh()
+        return [
+            {
+                "name": entry["name"],
+                "size_mb": round(entry["size"] / 1024**2, 1),
+                "modified": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(entry["mtime"])),
+                "metadata": entry["metadata"],
+            }
+            for entry in sorted(self._entries.values(), key=lambda entry: entry["name"])
+        ]
+
+    def stats(self):
+        return {
+            "directories": self.directories,
+            "installed": len(self._entries),
+            "scans": self.scans,
+            "last_scan_seconds": self.last_scan_seconds,
+            "rescan_seconds": self.rescan_seconds,
+        }
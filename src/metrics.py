@@ -0,0 +1,152 @@
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds, from JSON decoding up to a full hires story scene
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 60, 120, 300, 600)
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class StageHistogram:
+    """Cumulative latency histogram of one stage"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.counts):
+            if seen + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(self.max, lower + (upper - lower) * (rank - seen) / bucket_count)
+            seen += bucket_count
+        return self.max
+
+
+# ---------------------------------------------------------------------------- #
+#                                Stage Metrics                                 #
+# ---------------------------------------------------------------------------- #
+class StageMetrics:
+    """
+    Worker-lifetime latency histograms per stage plus byte counters
+
+    Stages are free-form names ("build", "webui", "decode", ...). Observing
+    is a lock, a bisect and a few additions, cheap enough for every request.
+    `render` produces the Prometheus text exposition format.
+    """
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._bytes = {}
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = StageHistogram(self.buckets)
+            histogram.observe(seconds)
+
+    def add_bytes(self, direction, count):
+        with self._lock:
+            self._bytes[direction] = self._bytes.get(direction, 0) + count
+
+    @contextmanager
+    def timer(self, stage, timings=None):
+        """Time a block into `stage`, also adding `<stage>_seconds` to a timings dict"""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - start
+            self.observe(stage, elapsed)
+            if timings is not None:
+                key = f"{stage}_seconds"
+                timings[key] = round(timings.get(key, 0.0) + elapsed, 3)
+
+    def summary(self):
+        """Count, mean and quantiles per stage, for JSON responses"""
+        with self._lock:
+            return {
+                stage: {
+                    "count": histogram.count,
+                    "mean": round(histogram.sum / histogram.count, 4),
+                    **{f"p{int(q * 100)}": round(histogram.quantile(q), 4) for q in QUANTILES}
+                }
+                for stage, histogram in sorted(self._stages.items())
+            }
+
+    def byte_totals(self):
+        with self._lock:
+            return dict(self._bytes)
+
+    def render(self, caches=None):
+        """
+        Prometheus text format of every stage, byte counter and cache counter
+
+        `caches` maps a cache name to its stats() dict; hits, misses, writes
+        and evictions are exported when present.
+        """
+        lines = [
+            "# HELP worker_stage_seconds Time spent in each handler stage",
+            "# TYPE worker_stage_seconds histogram"
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for stage, histogram in stages:
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    lines.append(f'worker_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'worker_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'worker_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'worker_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            lines += [
+                "# HELP worker_stage_quantile_seconds Stage latency quantiles estimated from the histogram",
+                "# TYPE worker_stage_quantile_seconds gauge"
+            ]
+            for stage, histogram in stages:
+                for q in QUANTILES:
+                    lines.append(f'worker_stage_quantile_seconds{{stage="{stage}",quantile="{q}"}} {histogram.quantile(q):.6f}')
+
+            lines += [
+                "# HELP worker_bytes_total Bytes sent and received per direction",
+                "# TYPE worker_bytes_total counter"
+            ]
+            for direction, count in sorted(self._bytes.items()):
+                lines.append(f'worker_bytes_total{{direction="{direction}"}} {count}')
+
+        lines += [
+            "# HELP worker_cache_events_total Cache hits, misses, writes and evictions",
+            "# TYPE worker_cache_events_total counter"
+        ]
+        for cache, stats in sorted((caches or {}).items()):
+            for event in ("hits", "misses", "writes", "evictions"):
+                if event in stats:
+                    lines.append(f'worker_cache_events_total{{cache="{cache}",event="{event}"}} {stats[event]}')
+
+        return "\n".join(lines) + "\n"
+
+
+stage_metrics = StageMetrics()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import logging
+import threading
+
+from cache import CACHE_ROOT
+
+logger = logging.getLogger(__name__)
+
+PLANNER_STATE_PATH = os.getenv("PLANNER_STATE_PATH", os.path.join(CACHE_ROOT, "planner_costs.json"))
+# Seconds per sampler step per megapixel before anything has been measured
+PLANNER_DEFAULT_STEP_SECONDS = float(os.getenv("PLANNER_DEFAULT_STEP_SECONDS", "0.15"))
+# Share of the deadline planned for generation; the rest covers encoding, uploads and misestimates
+PLANNER_SAFETY = float(os.getenv("PLANNER_SAFETY", "0.85"))
+PLANNER_MIN_STEPS = int(os.getenv("PLANNER_MIN_STEPS", "20"))
+PLANNER_SAVE_INTERVAL = float(os.getenv("PLANNER_SAVE_INTERVAL", "30"))
+
+# VAE decode, face restoration and request handling, in sampler steps
+_OVERHEAD_STEPS = 3
+_SMOOTHING = 0.3
+
+
+def _megapixels(width, height):
+    return (width or 512) * (height or 512) / 1e6
+
+
+def effective_steps(request):
+    """Sampler steps of a request weighted by cost relative to a base step"""
+    steps = request.get("steps", 20)
+    if request.get("init_images"):
+        # img2img runs only the denoised share of the steps
+        steps = max(1, int(steps * request.get("denoising_strength", 0.75)))
+    elif request.get("enable_hr"):
+        scale = request.get("hr_scale", 2.0)
+        steps += (request.get("hr_second_pass_steps") or request.get("steps", 20)) * scale * scale
+    return steps + _OVERHEAD_STEPS
+
+
+# ---------------------------------------------------------------------------- #
+#                               Quality Planner                                #
+# ---------------------------------------------------------------------------- #
+class QualityPlanner:
+    """
+    Fits generation settings into a latency budget
+
+    Learns the cost of a sampler step per resolution and sampler from
+    measured WebUI service times and keeps it in a JSON file on the volume.
+    `plan` walks a ladder of settings from the requested ones down, trimming
+    hires steps before base steps and dropping hires fix last, and keeps the
+    first rung whose estimate fits the budget.
+    """
+
+    def __init__(self, path=PLANNER_STATE_PATH, default_step_seconds=PLANNER_DEFAULT_STEP_SECONDS, min_steps=PLANNER_MIN_STEPS):
+        self.path = path
+        self.default_step_seconds = default_step_seconds
+        self.min_steps = min_steps
+
+        self._lock = threading.Lock()
+        self._costs = {}  # "WxH|sampler" -> {"step_seconds", "samples"}
+        self._per_megapixel = None
+        self._last_save = 0.0
+        self._dirty = False
+
+        self.planned = 0
+        self.reduced = 0
+        self._load()
+
+    @staticmethod
+    def _key(request):
+        return f"{request.get('width')}x{request.get('height')}|{request.get('sampler_name')}"
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+            self._costs = state.get("costs", {})
+            self._per_megapixel = state.get("step_seconds_per_megapixel")
+            logger.info(f"Quality planner: loaded step costs for {len(self._costs)} resolutions")
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Quality planner: ignoring unreadable {self.path}: {e}")
+
+    def save(self, force=False):
+        with self._lock:
+            if not self._dirty or (not force and time.monotonic() - self._last_save < PLANNER_SAVE_INTERVAL):
+                return
+            state = {"costs": dict(self._costs), "step_seconds_per_megapixel": self._per_megapixel}
+            self._dirty = False
+            self._last_save = time.monotonic()
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            temporary = f"{self.path}.tmp"
+            with open(temporary, "w") as f:
+                json.dump(state, f)
+            os.replace(temporary, self.path)
+        except OSError as e:
+            logger.warning(f"Quality planner: could not save {self.path}: {e}")
+
+    def step_seconds(self, request):
+        """Measured (or extrapolated) seconds per base step at the request's size"""
+        with self._lock:
+            cost = self._costs.get(self._key(request))
+            if cost:
+                return cost["step_seconds"]
+            per_megapixel = self._per_megapixel or self.default_step_seconds
+        return per_megapixel * _megapixels(request.get("width"), request.get("height"))
+
+    def estimate(self, request):
+        return effective_steps(request) * self.step_seconds(request)
+
+    def observe(self, request, seconds):
+        """Learn from the WebUI service time of a finished request"""
+        if seconds <= 0:
+            return
+        measured = seconds / effective_steps(request)
+        with self._lock:
+            key = self._key(request)
+            cost = self._costs.get(key)
+            if cost is None:
+                self._costs[key] = {"step_seconds": measured, "samples": 1}
+            else:
+                cost["step_seconds"] += _SMOOTHING * (measured - cost["step_seconds"])
+                cost["samples"] += 1
+            per_megapixel = measured / _megapixels(request.get("width"), request.get("height"))
+            self._per_megapixel = per_megapixel if self._per_megapixel is None else \
+                self._per_megapixel + _SMOOTHING * (per_megapixel - self._per_megapixel)
+            self._dirty = True
+        self.save()
+
+    def _ladder(self, request):
+        """Settings to try, from the requested ones to the cheapest acceptable"""
+        steps = request.get("steps", 20)
+        floor = min(steps, self.min_steps)
+        reduced_steps = max(floor, round(steps * 0.8))
+        rungs = [{}]
+        if request.get("enable_hr") and not request.get("init_images"):
+            hr_steps = request.get("hr_second_pass_steps") or steps
+            hr_scale = request.get("hr_scale", 2.0)
+            rungs += [
+                {"hr_second_pass_steps": max(8, round(hr_steps * 0.66))},
+                {"hr_second_pass_steps": max(8, round(hr_steps * 0.66)), "steps": reduced_steps},
+                {"hr_second_pass_steps": max(6, round(hr_steps * 0.5)), "steps": reduced_steps, "hr_scale": min(hr_scale, 1.1)},
+                {"enable_hr": False, "steps": reduced_steps},
+                {"enable_hr": False, "steps": floor},
+            ]
+        else:
+            rungs += [{"steps": reduced_steps}, {"steps": max(floor, round(steps * 0.6))}, {"steps": floor}]
+        return rungs
+
+    def plan(self, request, budget_seconds):
+        """
+        Fit `request` into budget_seconds in place
+
+        Returns the plan: rung taken, estimate, budget, and whether quality
+        was reduced or the budget cannot be met even at the cheapest rung.
+        """
+        budget = max(0.0, budget_seconds) * PLANNER_SAFETY
+        requested = self.estimate(request)
+        chosen, estimate, rung = {}, requested, 0
+        for rung, overrides in enumerate(self._ladder(request)):
+            estimate = self.estimate({**request, **overrides})
+            chosen = overrides
+            if estimate <= budget:
+                break
+
+        request.update(chosen)
+        if chosen.get("enable_hr") is False:
+            for key in ("hr_scale", "hr_upscaler", "hr_second_pass_steps"):
+                request.pop(key, None)
+
+        with self._lock:
+            self.planned += 1
+            self.reduced += bool(chosen)
+        return {
+            "budget_seconds": round(budget, 2),
+            "requested_estimate_seconds": round(requested, 2),
+            "planned_seconds": round(estimate, 2),
+            "rung": rung,
+            "reduced": bool(chosen),
+            "over_budget": estimate > budget,
+            "steps": request.get("steps"),
+            "enable_hr": request.get("enable_hr", False),
+            "hr_scale": request.get("hr_scale"),
+            "hr_second_pass_steps": request.get("hr_second_pass_steps")
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "state_path": self.path,
+                "resolutions_learned": len(self._costs),
+                "step_seconds_per_megapixel": round(self._per_megapixel, 4) if self._per_megapixel else None,
+                "costs": {key: {"step_seconds": round(c["step_seconds"], 4), "samples": c["samples"]} for key, c in self._costs.items()},
+                "plans": self.planned,
+                "reduced_plans": self.reduced
+            }
+
+
+quality_planner = QualityPlanner()
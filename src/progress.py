@@ -0,0 +1,210 @@
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# One /progress request per busy backend per interval, none while idle
+PROGRESS_POLL_INTERVAL = float(os.getenv("PROGRESS_POLL_INTERVAL", "1.0"))
+# Minimum time between two progress updates of the same job
+PROGRESS_PUBLISH_INTERVAL = float(os.getenv("PROGRESS_PUBLISH_INTERVAL", "2.0"))
+
+
+class JobProgress:
+    """Scene bookkeeping and step timing of one job"""
+
+    def __init__(self, job):
+        self.job = job
+        self.total_scenes = 1
+        self.started = set()
+        self.done = set()
+        self.scene_seconds = []
+        self.seconds_per_step = None
+        self.sampling_step = None
+        self.sampling_steps = None
+        self.fraction = 0.0
+        self._last_sample = None  # (step, monotonic time) of the last poll
+        self.last_published = 0.0
+        self.last_payload = None
+
+    def observe(self, state, fraction, now):
+        """Fold one /progress answer into the step-time estimate"""
+        step = state.get("sampling_step")
+        steps = state.get("sampling_steps")
+        if self._last_sample and step is not None and step > self._last_sample[0]:
+            measured = (now - self._last_sample[1]) / (step - self._last_sample[0])
+            # Smooth over polls; the first hires steps are slower than the rest
+            self.seconds_per_step = measured if self.seconds_per_step is None else 0.7 * self.seconds_per_step + 0.3 * measured
+        if step is not None:
+            self._last_sample = (step, now)
+        self.sampling_step = step
+        self.sampling_steps = steps
+        self.fraction = max(0.0, min(1.0, fraction or 0.0))
+
+    def snapshot(self, parallelism=1):
+        """Progress payload for RunPod's progress_update"""
+        pending = sorted(self.started - self.done)
+        current_scene = pending[0] if pending else None
+        # Jobs without scenes (single images, covers) are one running unit
+        running = bool(pending) or not self.started
+        completed = len(self.done)
+        percent = 100.0 * min(1.0, (completed + (self.fraction if running else 0.0)) / max(1, self.total_scenes))
+
+        eta = None
+        per_scene = None
+        if self.scene_seconds:
+            per_scene = sum(self.scene_seconds) / len(self.scene_seconds)
+        elif self.seconds_per_step and self.sampling_steps:
+            per_scene = self.seconds_per_step * self.sampling_steps
+        if per_scene is not None:
+            current_left = 0.0
+            if running and self.seconds_per_step and self.sampling_steps is not None and self.sampling_step is not None:
+                current_left = max(0, self.sampling_steps - self.sampling_step) * self.seconds_per_step
+            scenes_left = max(0, self.total_scenes - completed - (1 if running else 0))
+            eta = current_left + scenes_left * per_scene / max(1, parallelism)
+
+        return {
+            "percent": round(percent, 1),
+            "current_scene": current_scene,
+            "completed_scenes": completed,
+            "total_scenes": self.total_scenes,
+            "sampling_step": self.sampling_step,
+            "sampling_steps": self.sampling_steps,
+            "seconds_per_step": round(self.seconds_per_step, 3) if self.seconds_per_step else None,
+            "eta_seconds": round(eta) if eta is not None else None
+        }
+
+
+# ---------------------------------------------------------------------------- #
+#                              Progress Reporter                               #
+# ---------------------------------------------------------------------------- #
+class ProgressReporter:
+    """
+    Publishes live progress and ETA for running jobs
+
+    A single background thread polls `/sdapi/v1/progress` (without the live
+    preview image) on every backend that has requests outstanding, credits
+    the answer to the job whose request the backend is running, and passes
+    percent done, current scene, sampler step and an ETA from measured step
+    and scene times to `publish(job, payload)` at most every
+    PROGRESS_PUBLISH_INTERVAL. Idle backends are never polled.
+    """
+
+    def __init__(self, backend_pool, publish, poll_interval=PROGRESS_POLL_INTERVAL, publish_interval=PROGRESS_PUBLISH_INTERVAL):
+        self.backend_pool = backend_pool
+        self.publish = publish
+        self.poll_interval = poll_interval
+        self.publish_interval = publish_interval
+
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._thread = None
+
+        self.polls = 0
+        self.poll_seconds = 0.0
+        self.published = 0
+
+    # Job bookkeeping, called from the job's own threads
+    def start_job(self, job_id, job):
+        with self._lock:
+            self._jobs[job_id] = JobProgress(job)
+
+    def finish_job(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def set_total(self, job_id, total_scenes):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].total_scenes = max(1, total_scenes)
+
+    def scene_started(self, job_id, scene_index):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].started.add(scene_index)
+
+    def scene_done(self, job_id, scene_index, inference_seconds=None):
+        with self._lock:
+            progress = self._jobs.get(job_id)
+            if progress is None:
+                return
+            progress.started.add(scene_index)
+            progress.done.add(scene_index)
+            progress.fraction = 0.0
+            progress._last_sample = None
+            if inference_seconds:
+                progress.scene_seconds.append(inference_seconds)
+
+    # Polling thread
+    def _running_jobs(self):
+        """(backend, job_id) for every backend that is running a tracked job"""
+        with self.backend_pool._cond:
+            running = [
+                (backend, next(iter(backend.inflight.values())))
+                for backend in self.backend_pool.backends if backend.inflight
+            ]
+        with self._lock:
+            return [(backend, job_id) for backend, job_id in running if job_id in self._jobs]
+
+    def poll(self):
+        running = self._running_jobs()
+        for backend, job_id in running:
+            start = time.monotonic()
+            try:
+                response = backend.probe_session.get(
+                    f"{backend.api_base}/progress", params={"skip_current_image": "true"}, timeout=2
+                )
+                answer = response.json()
+            except Exception as e:
+                logger.debug(f"Progress poll of {backend.base_url} failed: {e}")
+                continue
+            finally:
+                self.polls += 1
+                self.poll_seconds += time.monotonic() - start
+
+            with self._lock:
+                progress = self._jobs.get(job_id)
+                if progress is not None:
+                    progress.observe(answer.get("state") or {}, answer.get("progress"), time.monotonic())
+
+        now = time.monotonic()
+        parallelism = max(1, len(self.backend_pool.healthy_backends()))
+        with self._lock:
+            due = [
+                (progress.job, progress.snapshot(parallelism), progress)
+                for job_id, progress in self._jobs.items()
+                if job_id in {job for _, job in running} and now - progress.last_published >= self.publish_interval
+            ]
+        for job, payload, progress in due:
+            if payload == progress.last_payload:
+                continue
+            progress.last_published = now
+            progress.last_payload = payload
+            try:
+                self.publish(job, payload)
+                self.published += 1
+            except Exception as e:
+                logger.warning(f"Progress update for job {job.get('id')} failed: {e}")
+
+    def _loop(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.poll()
+            except Exception as e:
+                logger.error(f"Progress reporter failed: {e}")
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="progress", daemon=True)
+            self._thread.start()
+
+    def stats(self):
+        return {
+            "poll_interval": self.poll_interval,
+            "polls": self.polls,
+            "avg_poll_ms": round(1000 * self.poll_seconds / self.polls, 2) if self.polls else 0.0,
+            "updates_published": self.published,
+            "tracked_jobs": len(self._jobs)
+        }
@@ -0,0 +1,247 @@
+"""
+Provision the story style LoRAs before (and while) the WebUI boots
+
+Downloads every LoRA in lora_manifest.json from Hugging Face in parallel,
+resuming partial downloads, verifies size and SHA-256 against the manifest
+(or the Hub's LFS metadata where the manifest has no pin), and skips files
+already present. Verified sizes and hashes are recorded next to the files,
+so a LoRA verified on an earlier boot is still used when the Hub cannot be
+reached; a LoRA with no pin, no Hub metadata and no earlier verification is
+not provisioned. When a network volume is mounted the files live there and
+are symlinked into the WebUI Lora directory, so later cold starts download
+nothing.
+
+Usage:
+    python provision_loras.py [--lora-dir DIR] [--cache-dir DIR] [--workers N] [--pin]
+
+The Lora directory defaults to the first of LORA_DIRS.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from huggingface_hub import HfApi, hf_hub_download
+
+from loras import LORA_DIRS
+
+logger = logging.getLogger("provision_loras")
+
+MANIFEST_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lora_manifest.json")
+LORA_CACHE_DIR = os.getenv(
+    "LORA_CACHE_DIR",
+    "/runpod-volume/loras" if os.path.isdir("/runpod-volume") else ""
+)
+LORA_DOWNLOAD_WORKERS = int(os.getenv("LORA_DOWNLOAD_WORKERS", "8"))
+# Hash files that are already present instead of trusting their size
+LORA_VERIFY_EXISTING = os.getenv("LORA_VERIFY_EXISTING", "false").lower() == "true"
+# Sizes and hashes of the stored files that passed verification, kept next to them
+VERIFIED_RECORD = ".verified.json"
+
+
+def get_hf_token():
+    """Token from any of the variable names the worker has historically used"""
+    for name in ("HUGGINGFACE_TOKEN", "HF_TOKEN", "HUGGING_FACE_API_TOKEN"):
+        if os.getenv(name):
+            return os.getenv(name)
+    return None
+
+
+def load_manifest(path=MANIFEST_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_verified(store_dir):
+    """Sizes and hashes recorded for earlier verified files, by LoRA name"""
+    try:
+        with open(os.path.join(store_dir, VERIFIED_RECORD)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_verified(store_dir, verified):
+    path = os.path.join(store_dir, VERIFIED_RECORD)
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(verified, f, indent=2)
+    os.replace(f"{path}.tmp", path)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fill_expected_from_hub(manifest, token):
+    """Take size / SHA-256 for unpinned entries from the Hub's LFS metadata"""
+    unpinned = [entry for entry in manifest["loras"] if not entry.get("sha256")]
+    if not unpinned:
+        return
+
+    try:
+        info = HfApi().model_info(manifest["repo_id"], revision=manifest.get("revision"), files_metadata=True, token=token)
+    except Exception as e:
+        logger.error(f"Could not read Hub metadata, unpinned LoRAs cannot be verified and are skipped: {e}")
+        return
+
+    siblings = {sibling.rfilename: sibling for sibling in info.siblings}
+    for entry in unpinned:
+        sibling = siblings.get(f"{manifest['subfolder']}/{entry['name']}.safetensors")
+        if sibling is None:
+            continue
+        lfs = sibling.lfs or {}
+        entry["sha256"] = lfs.get("sha256") if isinstance(lfs, dict) else getattr(lfs, "sha256", None)
+        entry["size"] = entry.get("size") or sibling.size
+
+
+def is_valid(path, entry, full_check):
+    """Whether a file on disk matches its manifest entry"""
+    if not os.path.isfile(path) or os.path.getsize(path) != entry["size"]:
+        return False
+    return not full_check or file_sha256(path) == entry["sha256"]
+
+
+def link_into(lora_dir, source_path, filename):
+    """Expose a cached LoRA in the WebUI directory without copying it"""
+    target = os.path.join(lora_dir, filename)
+    if os.path.realpath(target) == os.path.realpath(source_path):
+        return
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.symlink(source_path, target)
+    except OSError:
+        shutil.copyfile(source_path, target)
+
+
+def provision_lora(manifest, entry, lora_dir, cache_dir, token, verified=None):
+    """Make one LoRA available in lora_dir; returns a status record"""
+    start = time.monotonic()
+    filename = f"{entry['name']}.safetensors"
+    store_dir = cache_dir or lora_dir
+    store_path = os.path.join(store_dir, filename)
+    status = {"name": entry["name"], "action": "present", "bytes": 0}
+
+    try:
+        pinned = bool(entry.get("sha256") and entry.get("size"))
+        # Without a pin or Hub metadata, only a file verified on an earlier boot is trusted
+        expected = entry if pinned else (verified or {}).get(entry["name"])
+        if not expected:
+            raise ValueError("no pinned, Hub or earlier verified size and SHA-256 to verify against; pin them with --pin")
+        if not is_valid(store_path, expected, LORA_VERIFY_EXISTING):
+            if not pinned:
+                raise ValueError("stored file no longer matches its earlier verification and the Hub has no metadata to download it again")
+            status["action"] = "downloaded"
+            # Partial downloads are kept under the staging dir and resumed; from
+            # huggingface-hub 0.23 local_dir holds real files, never cache symlinks
+            staging_dir = os.path.join(store_dir, ".hf-staging")
+            for attempt in range(2):
+                downloaded = hf_hub_download(
+                    repo_id=manifest["repo_id"],
+                    filename=f"{manifest['subfolder']}/{filename}",
+                    revision=manifest.get("revision"),
+                    local_dir=staging_dir,
+                    token=token
+                )
+                if is_valid(downloaded, entry, full_check=True):
+                    os.replace(downloaded, store_path)
+                    break
+                logger.warning(f"{filename}: checksum mismatch on attempt {attempt + 1}, downloading again")
+                os.remove(downloaded)
+            else:
+                raise ValueError("checksum mismatch after retry")
+            status["bytes"] = os.path.getsize(store_path)
+
+        if cache_dir:
+            link_into(lora_dir, store_path, filename)
+        status["ok"] = True
+        status["verified"] = {"size": expected["size"], "sha256": expected["sha256"]}
+
+    except Exception as e:
+        logger.error(f"{filename}: provisioning failed: {e}")
+        status["ok"] = False
+        status["error"] = str(e)
+
+    status["seconds"] = round(time.monotonic() - start, 2)
+    logger.info(f"{filename}: {status['action']} in {status['seconds']}s ({status['bytes'] / 1e6:.1f} MB)")
+    return status
+
+
+def provision_loras(lora_dir=LORA_DIRS[0], cache_dir=LORA_CACHE_DIR, workers=LORA_DOWNLOAD_WORKERS, manifest_path=MANIFEST_PATH, pin=False):
+    """Provision every LoRA in the manifest in parallel and log a summary"""
+    start = time.monotonic()
+    manifest = load_manifest(manifest_path)
+    token = get_hf_token()
+    if not token:
+        logger.warning("No Hugging Face token set (HUGGINGFACE_TOKEN / HF_TOKEN / HUGGING_FACE_API_TOKEN)")
+
+    os.makedirs(lora_dir, exist_ok=True)
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        logger.info(f"Using LoRA cache on volume: {cache_dir}")
+
+    fill_expected_from_hub(manifest, token)
+    store_dir = cache_dir or lora_dir
+    verified = load_verified(store_dir)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="lora") as pool:
+        results = list(pool.map(
+            lambda entry: provision_lora(manifest, entry, lora_dir, cache_dir, token, verified),
+            manifest["loras"]
+        ))
+    for result in results:
+        if result["ok"]:
+            verified[result["name"]] = result.pop("verified")
+    save_verified(store_dir, verified)
+
+    wall = time.monotonic() - start
+    downloaded = [r for r in results if r["action"] == "downloaded" and r["ok"]]
+    present = [r for r in results if r["action"] == "present" and r["ok"]]
+    failed = [r for r in results if not r["ok"]]
+    serial_estimate = sum(r["seconds"] for r in downloaded)
+    logger.info(
+        f"LoRA provisioning finished in {wall:.1f}s: {len(downloaded)} downloaded, "
+        f"{len(present)} already present, {len(failed)} failed"
+    )
+    if downloaded:
+        logger.info(f"Parallel download saved {max(0.0, serial_estimate - wall):.1f}s versus one-by-one ({serial_estimate:.1f}s)")
+
+    if pin and not failed:
+        # Record verified sizes and hashes so later boots can skip the Hub lookup
+        for entry in manifest["loras"]:
+            path = os.path.join(cache_dir or lora_dir, f"{entry['name']}.safetensors")
+            entry["size"] = os.path.getsize(path)
+            entry["sha256"] = file_sha256(path)
+        with open(manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+        logger.info(f"Pinned sizes and hashes in {manifest_path}")
+
+    return {"seconds": round(wall, 2), "results": results, "failed": len(failed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lora-dir", default=LORA_DIRS[0], help="WebUI Lora directory")
+    parser.add_argument("--cache-dir", default=LORA_CACHE_DIR, help="persistent store on a network volume ('' to disable)")
+    parser.add_argument("--workers", type=int, default=LORA_DOWNLOAD_WORKERS, help="parallel downloads")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="LoRA manifest JSON")
+    parser.add_argument("--pin", action="store_true", help="write verified sizes and hashes back into the manifest")
+    args = parser.parse_args()
+
+    summary = provision_loras(args.lora_dir, args.cache_dir, args.workers, args.manifest, args.pin)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
@@ -0,0 +1,155 @@
+import re
+import time
+import logging
+import itertools
+import threading
+
+from jobs import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+_LORA_PATTERN = re.compile(r"<lora:([^:>]+)")
+
+
+def get_switch_key(inference_request, method):
+    """
+    What the WebUI has to (re)load to serve a request
+
+    Requests with equal keys run back to back without LoRA, resolution or
+    sampler changes.
+    """
+    return (
+        method,
+        tuple(sorted(set(_LORA_PATTERN.findall(inference_request.get("prompt", ""))))),
+        inference_request.get("width"),
+        inference_request.get("height"),
+        inference_request.get("sampler_name"),
+        inference_request.get("hr_upscaler") if inference_request.get("enable_hr") else None,
+    )
+
+
+# ---------------------------------------------------------------------------- #
+#                            Inference Scheduler                               #
+# ---------------------------------------------------------------------------- #
+class InferenceScheduler:
+    """
+    Orders backend requests from concurrent jobs to avoid model switches
+
+    At most `slots` requests are outstanding at the WebUI. When a slot frees
+    up, the next request is taken from the heads of the per-job queues (so a
+    job's own scenes keep their order), preferring one whose switch key
+    matches the request sent last. A head that has been passed over
+    `max_bypass` times is sent next regardless, so no job starves.
+    """
+
+    def __init__(self, slots=2, max_bypass=4):
+        self.slots = max(1, slots)
+        self.max_bypass = max(0, max_bypass)
+
+        self._cond = threading.Condition()
+        self._pending = []  # tickets in arrival order
+        self._active = 0
+        self._last_key = None
+        self._sequence = itertools.count()
+
+        self.dispatched = 0
+        self.switches = 0
+        self.coalesced = 0
+        self.forced = 0
+        self.max_pending = 0
+        self.total_wait_seconds = 0.0
+
+    def _heads(self):
+        """Oldest pending ticket of every job, oldest first"""
+        heads = {}
+        for ticket in self._pending:
+            heads.setdefault(ticket["job_id"], ticket)
+        return list(heads.values())
+
+    def _pick(self):
+        """Next ticket to send, with the reason (fifo / coalesced / fairness)"""
+        heads = self._heads()
+        if not heads:
+            return None, None
+        if self.max_bypass == 0:
+            return heads[0], "fifo"
+
+        preferred = next((ticket for ticket in heads if ticket["key"] == self._last_key), heads[0])
+        starved = next((ticket for ticket in heads if ticket["bypassed"] >= self.max_bypass), None)
+        if starved is not None and starved is not preferred:
+            return starved, "fairness"
+        if preferred is not heads[0]:
+            return preferred, "coalesced"
+        return preferred, "fifo"
+
+    def _dispatch(self, ticket, reason):
+        if reason == "coalesced":
+            self.coalesced += 1
+        elif reason == "fairness":
+            self.forced += 1
+
+        for other in self._heads():
+            if other["seq"] < ticket["seq"]:
+                other["bypassed"] += 1
+
+        if self._last_key is not None and ticket["key"] != self._last_key:
+            self.switches += 1
+        self._last_key = ticket["key"]
+
+        self._pending.remove(ticket)
+        self._active += 1
+        self.dispatched += 1
+        self.total_wait_seconds += time.monotonic() - ticket["queued_at"]
+
+    def run(self, job_id, key, send, job=None):
+        """
+        Block until the request may go to the backend, then call send()
+
+        A request whose JobControl is stopped while queued leaves the queue
+        and raises JobCancelled without reaching the backend.
+        """
+        ticket = {
+            "job_id": job_id,
+            "key": key,
+            "seq": next(self._sequence),
+            "bypassed": 0,
+            "queued_at": time.monotonic()
+        }
+        with self._cond:
+            self._pending.append(ticket)
+            self.max_pending = max(self.max_pending, len(self._pending))
+            while True:
+                if job is not None and job.cancelled:
+                    self._pending.remove(ticket)
+                    self._cond.notify_all()
+                    raise JobCancelled(job.reason)
+                if self._active < self.slots:
+                    chosen, reason = self._pick()
+                    if chosen is ticket:
+                        break
+                self._cond.wait(0.5 if job is not None else None)
+            self._dispatch(ticket, reason)
+            # Another slot may be free for the next ticket
+            self._cond.notify_all()
+
+        try:
+            return send()
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "max_bypass": self.max_bypass,
+                "pending": len(self._pending),
+                "active": self._active,
+                "dispatched": self.dispatched,
+                "model_switches": self.switches,
+                "coalesced": self.coalesced,
+                "forced_by_fairness": self.forced,
+                "max_pending": self.max_pending,
+                "avg_wait_seconds": round(self.total_wait_seconds / self.dispatched, 3) if self.dispatched else 0.0
+            }
@@ -0,0 +1,124 @@
+import os
+import hashlib
+import logging
+import threading
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+
+logger = logging.getLogger(__name__)
+
+# Same variables as RunPod's rp_upload helper, plus the bucket name
+BUCKET_ENDPOINT_URL = os.getenv("BUCKET_ENDPOINT_URL")
+BUCKET_ACCESS_KEY_ID = os.getenv("BUCKET_ACCESS_KEY_ID")
+BUCKET_SECRET_ACCESS_KEY = os.getenv("BUCKET_SECRET_ACCESS_KEY")
+BUCKET_REGION = os.getenv("BUCKET_REGION", "us-east-1")
+BUCKET_NAME = os.getenv("BUCKET_NAME")
+
+PRESIGNED_URL_EXPIRY = int(os.getenv("PRESIGNED_URL_EXPIRY", str(7 * 24 * 3600)))
+UPLOAD_WORKERS = int(os.getenv("UPLOAD_WORKERS", "8"))
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+}
+
+
+# ---------------------------------------------------------------------------- #
+#                              S3 Output Sink                                  #
+# ---------------------------------------------------------------------------- #
+class S3ImageSink:
+    """
+    Uploads finished images to an S3-compatible bucket (AWS, R2, MinIO, ...)
+
+    One client with a connection pool sized for the upload pool is shared by
+    every job; large objects go up as concurrent multipart uploads.
+    """
+
+    def __init__(self, bucket, endpoint_url=None, access_key_id=None, secret_access_key=None, region=BUCKET_REGION):
+        self.bucket = bucket
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key_id,
+            aws_secret_access_key=secret_access_key,
+            region_name=region,
+            config=Config(
+                max_pool_connections=UPLOAD_WORKERS * 4,
+                retries={"max_attempts": 3, "mode": "standard"},
+                signature_version="s3v4",
+                # MinIO-style stand-ins rarely have wildcard DNS
+                s3={"addressing_style": "path" if endpoint_url else "auto"}
+            )
+        )
+        self.transfer_config = TransferConfig(
+            multipart_threshold=8 * 1024**2,
+            multipart_chunksize=8 * 1024**2,
+            max_concurrency=4,
+            use_threads=True
+        )
+        self._pool = ThreadPoolExecutor(max_workers=UPLOAD_WORKERS, thread_name_prefix="upload")
+
+    def upload(self, data, key, content_type, presign=True):
+        """Upload one object and describe where it went"""
+        checksum = hashlib.sha256(data).hexdigest()
+        self.client.upload_fileobj(
+            BytesIO(data),
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": content_type, "Metadata": {"sha256": checksum}},
+            Config=self.transfer_config
+        )
+
+        uploaded = {
+            "bucket": self.bucket,
+            "key": key,
+            "bytes": len(data),
+            "sha256": checksum,
+            "content_type": content_type
+        }
+        if presign:
+            uploaded["url"] = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": key},
+                ExpiresIn=PRESIGNED_URL_EXPIRY
+            )
+        return uploaded
+
+    def upload_many(self, items, content_type, presign=True):
+        """Upload (data, key) pairs concurrently, preserving order"""
+        futures = [self._pool.submit(self.upload, data, key, content_type, presign) for data, key in items]
+        return [future.result() for future in futures]
+
+
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def resolve_bucket(bucket=None):
+    """bucket, or BUCKET_NAME when it is not given; raises ValueError if neither is set"""
+    bucket = bucket or BUCKET_NAME
+    if not bucket:
+        raise ValueError("No output bucket configured: set BUCKET_NAME or pass output_bucket")
+    return bucket
+
+
+def get_image_sink(bucket=None):
+    """Shared sink for a bucket (default BUCKET_NAME), created on first use"""
+    bucket = resolve_bucket(bucket)
+
+    with _sinks_lock:
+        if bucket not in _sinks:
+            logger.info(f"Creating S3 output sink for bucket {bucket} at {BUCKET_ENDPOINT_URL or 'AWS'}")
+            _sinks[bucket] = S3ImageSink(
+                bucket, BUCKET_ENDPOINT_URL, BUCKET_ACCESS_KEY_ID, BUCKET_SECRET_ACCESS_KEY
+            )
+        return _sinks[bucket]
+
+
+def is_sink_configured():
+    return bool(BUCKET_NAME)
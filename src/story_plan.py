@@ -0,0 +1,249 @@
+import os
+import logging
+from types import MappingProxyType
+
+from book_formats import BOOK_FORMATS, DEFAULT_BOOK_FORMAT
+from storage import resolve_bucket
+
+logger = logging.getLogger(__name__)
+
+# Sampler steps of a preview draft; finalize renders the print-quality version
+PREVIEW_STEPS = int(os.getenv("PREVIEW_STEPS", "16"))
+
+QUALITIES = ("final", "preview")
+
+# Appended to every scene prompt for professional children's book illustrations
+SCENE_PROMPT_SUFFIX = ", " + " ".join((
+    "professional children's book illustration,",
+    "storybook scene, highly detailed, consistent style,",
+    "vibrant colors, child-friendly artwork,",
+    "clean composition, narrative illustration,",
+    "appealing to children aged 4-8, magical atmosphere,",
+    "whimsical art style, storytelling illustration,",
+    "professional book illustration quality,",
+    "detailed but clear, perfect for children's book,",
+    "bright and engaging, fantasy storybook art"
+))
+
+DEFAULT_SCENE_NEGATIVE_PROMPT = (
+    "blurry, low quality, distorted, inconsistent style, ugly, deformed, different art style, "
+    "pixelated, low resolution, dark themes, scary elements, inappropriate content, crowded composition, "
+    "too busy, cluttered, unprofessional, poor composition, amateur artwork"
+)
+
+
+class InvalidJobInput(ValueError):
+    """A job input field has the wrong type or is out of range"""
+
+
+def resolve_book_format(book_format):
+    """(format id, frozen format spec), falling back to square_small for unknown formats"""
+    if book_format not in BOOK_FORMATS:
+        logger.warning(f"Unknown book format: {book_format}, defaulting to {DEFAULT_BOOK_FORMAT}")
+        book_format = DEFAULT_BOOK_FORMAT
+    return book_format, BOOK_FORMATS[book_format]
+
+
+def apply_quality(request, quality):
+    """
+    Turn a print-quality request into a draft when quality is "preview"
+
+    Only steps, hires fix and face restoration change; prompt, size, sampler
+    and seed stay, so the final render keeps the draft's composition.
+    """
+    if quality != "preview":
+        return request
+    request["steps"] = min(request["steps"], PREVIEW_STEPS)
+    request["enable_hr"] = False
+    request["restore_faces"] = False
+    for key in ("hr_scale", "hr_upscaler", "hr_second_pass_steps"):
+        request.pop(key, None)
+    return request
+
+
+# ---------------------------------------------------------------------------- #
+#                               Input Validation                               #
+# ---------------------------------------------------------------------------- #
+def _number(input_data, key, default, kind=float, minimum=None, maximum=None):
+    """input_data[key] as int or float within bounds; numeric strings are accepted"""
+    value = input_data.get(key)
+    if value is None:
+        return default
+    if isinstance(value, bool):
+        raise InvalidJobInput(f"'{key}' must be a number, got {value!r}")
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise InvalidJobInput(f"'{key}' must be a number, got {value!r}") from None
+    if kind is int:
+        if not number.is_integer():
+            raise InvalidJobInput(f"'{key}' must be a whole number, got {value!r}")
+        number = int(number)
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise InvalidJobInput(f"'{key}' must be between {minimum} and {maximum}, got {value!r}")
+    return number
+
+
+def check_output_sink(config):
+    """Fail a job that asks for the S3 sink without a bucket before anything renders"""
+    if (config.get("output_sink") or "base64") != "s3":
+        return
+    try:
+        resolve_bucket(config.get("output_bucket"))
+    except ValueError as err:
+        raise InvalidJobInput(str(err)) from None
+
+
+def parse_deadline(input_data):
+    """deadline_seconds of any job, or None; it must be a positive number"""
+    deadline_seconds = _number(input_data, "deadline_seconds", None, float)
+    if deadline_seconds is not None and deadline_seconds <= 0:
+        raise InvalidJobInput(f"'deadline_seconds' must be greater than 0, got {input_data['deadline_seconds']!r}")
+    return deadline_seconds
+
+
+def build_story_config(input_data, job_id):
+    """
+    Validated story_config of a story or single-scene job
+
+    Type and range errors raise InvalidJobInput; an unknown book format or
+    output format still falls back to the default with a warning.
+    """
+    quality = input_data.get("quality", "final")
+    if quality not in QUALITIES:
+        raise InvalidJobInput(f"'quality' must be one of {', '.join(QUALITIES)}, got {quality!r}")
+    for key in ("negative_prompt", "story_id", "story_style", "sampler_name"):
+        if input_data.get(key) is not None and not isinstance(input_data[key], str):
+            raise InvalidJobInput(f"'{key}' must be a string")
+    if input_data.get("scene_characters") is not None and not isinstance(input_data["scene_characters"], list):
+        raise InvalidJobInput("'scene_characters' must be an array")
+    # Empty or missing scene_prompts make a single-scene job
+    scene_prompts = input_data.get("scene_prompts")
+    if scene_prompts is not None and not isinstance(scene_prompts, list):
+        raise InvalidJobInput("'scene_prompts' must be an array of strings")
+    if scene_prompts:
+        invalid = [i for i, prompt in enumerate(scene_prompts) if not isinstance(prompt, str) or not prompt.strip()]
+        if invalid:
+            raise InvalidJobInput(f"'scene_prompts' entries must be non-empty strings, scenes {invalid} are not")
+        scene_characters = input_data.get("scene_characters")
+        if scene_characters is not None and len(scene_characters) != len(scene_prompts):
+            raise InvalidJobInput(
+                f"'scene_characters' needs one entry per scene, got {len(scene_characters)} for {len(scene_prompts)} scenes"
+            )
+    check_output_sink(input_data)
+
+    return {
+        "story_style": input_data.get("story_style", "picture_book"),
+        "story_id": input_data.get("story_id"),
+        "job_id": job_id,
+        "quality": quality,
+        "book_format": input_data.get("book_format", DEFAULT_BOOK_FORMAT),
+        "custom_width": _number(input_data, "custom_width", None, int, 64, 4096),
+        "custom_height": _number(input_data, "custom_height", None, int, 64, 4096),
+        "lora_weight": _number(input_data, "lora_weight", 1.0, float, -2, 2),
+        "character_strength": _number(input_data, "character_strength", 0.65, float, 0, 1),
+        "steps": _number(input_data, "steps", 45, int, 1, 150),  # Increased for print quality scenes
+        "cfg_scale": _number(input_data, "cfg_scale", 7.5, float, 1, 30),
+        "width": _number(input_data, "width", None, int, 64, 4096),    # Optional override
+        "height": _number(input_data, "height", None, int, 64, 4096),  # Optional override
+        "negative_prompt": input_data.get("negative_prompt"),
+        "sampler_name": input_data.get("sampler_name", "DPM++ 2M Karras"),
+        "pipeline_depth": _number(input_data, "pipeline_depth", None, int, 1, 16),
+        "resume": input_data.get("resume", True),
+        "use_cache": input_data.get("use_cache", True),
+        # A client story_id fixes the seed, so the story's images can be requested again
+        "reproducible": input_data.get("story_id") is not None,
+        "scene_characters": input_data.get("scene_characters"),
+        "print_finalize": input_data.get("print_finalize", False),
+        "print_upscaler": input_data.get("print_upscaler", "local"),
+        "output_format": input_data.get("output_format", "png"),
+        "output_quality": _number(input_data, "output_quality", 90, int, 1, 100),
+        "output_compress_level": _number(input_data, "output_compress_level", None, int, 0, 9),
+        "thumbnail_size": _number(input_data, "thumbnail_size", None, int, 16, 4096),
+        "output_sink": input_data.get("output_sink", "base64"),
+        "output_bucket": input_data.get("output_bucket"),
+        "output_prefix": input_data.get("output_prefix"),
+        "presign_urls": input_data.get("presign_urls", True)
+    }
+
+
+# ---------------------------------------------------------------------------- #
+#                                  Story Plan                                  #
+# ---------------------------------------------------------------------------- #
+class StoryPlan:
+    """
+    Scene request settings shared by every scene of a story, compiled once
+
+    Resolves the book format, generation size, seed, quality and LoRA trigger
+    of a story_config up front. `scene_request` copies the shared request and
+    adds the only per-scene part, the prompt. The book format info is one
+    read-only mapping shared by all scenes, and `init_images` keeps the init
+    image of each cast (tuple of character indexes) once it is selected.
+    """
+
+    def __init__(self, story_config, seed, lora_installed=False):
+        book_format = story_config.get("book_format") or DEFAULT_BOOK_FORMAT
+        custom_width, custom_height = story_config.get("custom_width"), story_config.get("custom_height")
+        if custom_width and custom_height:
+            scene_width, scene_height = custom_width, custom_height
+            format_name, aspect_ratio = "Custom Format", custom_width / custom_height
+        else:
+            book_format, format_spec = resolve_book_format(book_format)
+            scene_width, scene_height = format_spec["scene_gen_size"]
+            format_name, aspect_ratio = format_spec["name"], format_spec["aspect_ratio"]
+
+        # Explicit dimensions override the book format's
+        self.width = story_config.get("width") or scene_width
+        self.height = story_config.get("height") or scene_height
+        self.size = (self.width, self.height)
+        self.seed = seed
+        self.character_strength = story_config.get("character_strength", 0.65)
+        self.scene_characters = story_config.get("scene_characters")
+        self.init_images = {}
+
+        lora_trigger = None
+        story_style = story_config.get("story_style", "picture_book")
+        if story_style and lora_installed:
+            lora_trigger = f"<lora:{story_style}:{story_config.get('lora_weight', 1.0)}>"
+        self.prompt_suffix = SCENE_PROMPT_SUFFIX + (f", {lora_trigger}" if lora_trigger else "")
+
+        # OPTIMAL Scene generation settings for children's book illustrations
+        request = {
+            "negative_prompt": story_config.get("negative_prompt") or DEFAULT_SCENE_NEGATIVE_PROMPT,
+            "steps": story_config.get("steps", 45),
+            "cfg_scale": story_config.get("cfg_scale", 7.5),
+            "width": self.width,
+            "height": self.height,
+            "sampler_name": story_config.get("sampler_name") or "DPM++ 2M Karras",
+            "seed": seed,  # CRITICAL: Same seed for style consistency
+            "batch_size": 1,
+
+            # PRINT QUALITY ENHANCEMENTS for scenes
+            "restore_faces": True,
+            "tiling": False,
+            "do_not_save_samples": True,
+            "do_not_save_grid": True,
+            "enable_hr": True,
+            "hr_scale": 1.2,
+            "hr_upscaler": "R-ESRGAN 4x+",
+            "hr_second_pass_steps": 15
+        }
+        apply_quality(request, story_config.get("quality"))
+        request["_book_format_info"] = MappingProxyType({
+            "book_format": book_format,
+            "generation_size": f"{self.width}x{self.height}",
+            "format_name": format_name,
+            "aspect_ratio": aspect_ratio
+        })
+        self.request = MappingProxyType(request)
+
+        logger.info(
+            f"Story plan: {format_name} at {self.width}x{self.height}, seed {seed}, "
+            f"{request['steps']} steps, LoRA {lora_trigger or 'none'}"
+        )
+
+    def scene_request(self, scene_prompt):
+        """Inference request of one scene: the shared settings plus its prompt"""
+        request = dict(self.request)
+        request["prompt"] = f"{scene_prompt.strip()}{self.prompt_suffix}"
+        return request
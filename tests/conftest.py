@@ -0,0 +1,39 @@
+import os
+import sys
+import base64
+import tempfile
+from io import BytesIO
+
+import pytest
+from PIL import Image
+
+# The handler reads its cache and LoRA locations at import; keep them out of the real volume
+_scratch = tempfile.mkdtemp(prefix="handler-tests-")
+os.environ.setdefault("WORKER_CACHE_DIR", os.path.join(_scratch, "cache"))
+os.environ.setdefault("LORA_DIRS", os.path.join(_scratch, "loras"))
+os.environ.setdefault("PROVISION_LORAS_AT_STARTUP", "false")
+os.environ.setdefault("WARMUP_ENABLED", "false")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+
+def png_b64(size=(8, 8)):
+    buffer = BytesIO()
+    Image.new("RGB", size, "white").save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+@pytest.fixture
+def fake_webui(monkeypatch):
+    """Every inference returns one small PNG without a WebUI; yields the (request, method) pairs sent"""
+    import handler
+
+    image = png_b64()
+    sent = []
+
+    def run_inference(inference_request, method="img2img", use_cache=False, job_id=None):
+        sent.append((inference_request, method))
+        return {"images": [image], "cache_hit": False, "timings": {"service_seconds": 1.0}}
+
+    monkeypatch.setattr(handler, "run_inference", run_inference)
+    return sent
@@ -0,0 +1,94 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backends import BackendPool
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from stub_webui import start_stub
+
+SCENE = {"steps": 5, "width": 64, "height": 64}
+
+
+def pool_with_requests(*job_ids):
+    pool = BackendPool(["http://webui.test"])
+    backend = pool.backends[0]
+    backend.healthy = True
+    tokens = [pool._acquire(None, [], 0, job_id)[1] for job_id in job_ids]
+    return pool, backend, tokens
+
+
+@pytest.fixture
+def stub_pool():
+    """A pool of two healthy stub WebUIs; yields (pool, [(server, state), ...])"""
+    stubs = [start_stub(step_seconds=0.01) for _ in range(2)]
+    pool = BackendPool([f"http://127.0.0.1:{server.server_address[1]}" for server, _ in stubs])
+    for backend in pool.backends:
+        backend.started = backend.healthy = True
+    yield pool, stubs
+    for server, _ in stubs:
+        server.shutdown()
+        server.server_close()
+
+
+def test_concurrent_requests_are_spread_over_both_backends(stub_pool):
+    pool, stubs = stub_pool
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        responses = list(executor.map(lambda _: pool.post("txt2img", SCENE, key="same-lora"), range(8)))
+
+    assert all(response.status_code == 200 for response in responses)
+    generations = [state.generations for _, state in stubs]
+    # Least-outstanding routing keeps the two within a request or so of each other
+    assert sum(generations) == 8 and min(generations) >= 3
+    assert [backend.requests for backend in pool.backends] == generations
+
+
+def test_request_fails_over_when_a_backend_dies(stub_pool):
+    pool, stubs = stub_pool
+    dead, alive = pool.backends
+    server, _ = stubs[0]
+    server.shutdown()
+    server.server_close()
+
+    # Both look healthy and idle, so the first backend is tried first
+    response = pool.post("txt2img", SCENE, failover_wait=1)
+
+    assert response.status_code == 200
+    assert dead.healthy is False and dead.errors == 1 and dead.failovers == 1
+    assert alive.requests == 1 and stubs[1][1].generations == 1
+
+
+def test_interrupt_only_hits_the_running_job():
+    pool, backend, _ = pool_with_requests("job-a", "job-b")
+    sent = []
+    backend.probe_session.post = lambda url, timeout: sent.append(url)
+
+    assert pool.interrupt_job("job-b") is False
+    assert sent == []
+    assert pool.interrupt_job("job-a") is True
+    assert [url.rsplit("/", 1)[1] for url in sent] == ["skip", "interrupt"]
+
+
+def test_running_request_cannot_finish_while_it_is_interrupted():
+    pool, backend, tokens = pool_with_requests("job-a", "job-b")
+    events = []
+
+    def post(url, timeout):
+        time.sleep(0.05)
+        events.append(url.rsplit("/", 1)[1])
+
+    backend.probe_session.post = post
+    interrupter = threading.Thread(target=pool.interrupt_job, args=("job-a",))
+    interrupter.start()
+    time.sleep(0.01)
+    pool._release(backend, tokens[0])
+    events.append("released")
+    interrupter.join()
+
+    assert events == ["skip", "interrupt", "released"]
@@ -0,0 +1,32 @@
+import pytest
+
+import fetcher
+from fetcher import ReferenceNotAllowed, fetch_reference
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:3000/sdapi/v1/options",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/photo.png",
+    "http://[::1]/photo.png",
+    "file:///etc/passwd",
+])
+def test_private_and_non_http_urls_are_refused(url):
+    with pytest.raises(ReferenceNotAllowed):
+        fetch_reference(url)
+
+
+def test_hosts_outside_the_allowlist_are_refused(monkeypatch):
+    monkeypatch.setattr(fetcher, "REFERENCE_URL_ALLOWED_HOSTS", [".images.example.com"])
+
+    with pytest.raises(ReferenceNotAllowed, match="REFERENCE_URL_ALLOWED_HOSTS"):
+        fetch_reference("https://attacker.test/photo.png")
+
+
+def test_buckets_outside_the_allowlist_are_refused(monkeypatch):
+    monkeypatch.setattr(fetcher, "REFERENCE_BUCKETS", ["books"])
+
+    with pytest.raises(ReferenceNotAllowed, match="REFERENCE_BUCKETS"):
+        fetch_reference("s3://someone-elses-bucket/private.png")
+    with pytest.raises(ReferenceNotAllowed):
+        fetch_reference({"bucket": "someone-elses-bucket", "key": "private.png"})
@@ -0,0 +1,73 @@
+import pytest
+
+import handler
+from conftest import png_b64
+
+
+@pytest.fixture
+def failing_cover(fake_webui, monkeypatch):
+    """Scenes render; building the cover request fails"""
+    def build_book_cover_request(*args, **kwargs):
+        raise RuntimeError("cover backend down")
+
+    monkeypatch.setattr(handler, "build_book_cover_request", build_book_cover_request)
+
+
+def book_job(job_id, **input_data):
+    return {"id": job_id, "input": {
+        "action": "generate_book", "scene_prompts": ["a fox in the snow", "a fox at home"], "resume": False,
+        **input_data
+    }}
+
+
+def test_streamed_book_with_failing_cover_still_streams_scenes(failing_cover):
+    partials = list(handler.process_job(book_job("book-stream-cover-fails", stream=True)))
+
+    cover, scenes, summary = partials[0], partials[1:-1], partials[-1]
+    assert cover["generation_type"] == "book_cover"
+    assert "Book cover generation failed" in cover["cover_error"]
+    assert [scene["scene_index"] for scene in scenes] == [0, 1]
+    assert summary["cover_completed"] is False
+    assert summary["completed_scenes"] == [0, 1]
+    assert summary["failed_scenes"] == []
+    # RunPod aborts a stream on the first partial carrying "error"
+    assert not any("error" in partial for partial in partials)
+
+
+def test_batched_book_with_failing_cover_returns_scenes(failing_cover):
+    result = handler.process_job(book_job("book-batch-cover-fails"))
+
+    assert "Book cover generation failed" in result["cover"]["error"]
+    assert [scene["scene_index"] for scene in result["scenes"]] == [0, 1]
+    assert all("error" not in scene for scene in result["scenes"])
+
+
+@pytest.mark.parametrize("cover_input", [
+    {"action": "generate_book_cover", "title": "Fox"},
+    {"generation_type": "book_cover", "title": "Fox"}
+])
+def test_standalone_cover_honours_book_format_and_custom_size(fake_webui, cover_input):
+    large = handler.process_job({"id": "cover-large", "input": {**cover_input, "book_format": "square_large"}})
+    custom = handler.process_job({"id": "cover-custom", "input": {**cover_input, "custom_width": 640, "custom_height": 896}})
+
+    assert large["generation_type"] == "book_cover" and "error" not in large
+    assert "error" not in custom
+    (large_request, _), (custom_request, _) = fake_webui
+    assert (large_request["width"], large_request["height"]) == handler.BOOK_FORMATS["square_large"]["cover_gen_size"]
+    assert (custom_request["width"], custom_request["height"]) == (640, 896)
+
+
+def test_book_cover_reuses_the_story_reference_images(fake_webui, monkeypatch):
+    sizes = []
+    preprocess = handler.preprocess_reference_images
+
+    def counting_preprocess(reference_images, target_size):
+        sizes.append(target_size)
+        return preprocess(reference_images, target_size)
+
+    monkeypatch.setattr(handler, "preprocess_reference_images", counting_preprocess)
+    result = handler.process_job(book_job("book-shared-references", reference_images=[png_b64((64, 64))]))
+
+    assert "error" not in result["cover"]
+    assert result["cover"]["method_used"] == "img2img"
+    assert sizes == [(768, 768)]
@@ -0,0 +1,68 @@
+import inspect
+
+import pytest
+
+import handler
+
+
+@pytest.fixture
+def ready_worker(fake_webui, monkeypatch):
+    monkeypatch.setattr(handler, "wait_until_ready", lambda: None)
+
+
+def story_job(job_id, **input_data):
+    return {"id": job_id, "input": {"scene_prompts": ["a fox in the snow", "a fox at home"], "resume": False, **input_data}}
+
+
+def test_handler_returns_one_dict_per_job(ready_worker):
+    assert not inspect.isgeneratorfunction(handler.handler)
+
+    result = handler.handler(story_job("plain-story"))
+
+    assert [scene["scene_index"] for scene in result["scenes"]] == [0, 1]
+
+
+def test_handler_ignores_stream_without_streaming(ready_worker):
+    result = handler.handler(story_job("plain-stream-story", stream=True))
+
+    assert [scene["scene_index"] for scene in result["scenes"]] == [0, 1]
+
+
+def test_stream_handler_yields_scenes_then_summary(ready_worker):
+    partials = list(handler.stream_handler(story_job("streamed-story", stream=True)))
+
+    assert [partial.get("scene_index") for partial in partials[:-1]] == [0, 1]
+    assert partials[-1]["stream_complete"] is True
+
+
+@pytest.mark.parametrize("deadline_seconds", ["soon", -5, 0, True])
+def test_handler_rejects_invalid_deadline(ready_worker, deadline_seconds):
+    result = handler.handler(story_job("bad-deadline", deadline_seconds=deadline_seconds))
+
+    assert "'deadline_seconds'" in result["error"]
+
+
+def test_handler_accepts_numeric_string_deadline(ready_worker):
+    result = handler.handler(story_job("string-deadline", deadline_seconds="30"))
+
+    assert [scene["scene_index"] for scene in result["scenes"]] == [0, 1]
+    assert result["plan"]["deadline_seconds"] == pytest.approx(30, abs=1)
+
+
+def test_failed_webui_body_is_cut_where_it_is_read(monkeypatch, caplog):
+    class ErrorResponse:
+        status_code = 500
+        content = b"x" * 200_000
+
+        class request:
+            body = b"{}"
+
+    monkeypatch.setattr(handler.backend_pool, "post", lambda *args, **kwargs: ErrorResponse())
+
+    with caplog.at_level("ERROR"):
+        result = handler.run_inference({"prompt": "a fox", "seed": 1}, "txt2img", job_id="webui-500")
+
+    limit = handler.WEBUI_ERROR_DETAIL_BYTES
+    assert result["details"] == "x" * limit + f"... [{200_000 - limit} more bytes]"
+    logged = [record.getMessage() for record in caplog.records if "status 500" in record.getMessage()]
+    assert logged and all(len(message) < limit + 100 for message in logged)
@@ -0,0 +1,69 @@
+import hashlib
+import json
+
+import pytest
+
+import provision_loras
+
+CONTENT = b"lora weights"
+
+
+@pytest.fixture
+def lora_dir(tmp_path):
+    directory = tmp_path / "Lora"
+    directory.mkdir()
+    (directory / "picture_book.safetensors").write_bytes(CONTENT)
+    return directory
+
+
+@pytest.fixture
+def hub_unreachable(monkeypatch):
+    class UnreachableHub:
+        def model_info(self, *args, **kwargs):
+            raise ConnectionError("Name or service not known")
+
+    monkeypatch.setattr(provision_loras, "HfApi", UnreachableHub)
+
+
+def write_manifest(tmp_path, entry):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps({"repo_id": "test/loras", "subfolder": "Lora", "loras": [entry]}))
+    return str(path)
+
+
+def test_unpinned_lora_is_not_accepted_without_hub_metadata(tmp_path, lora_dir, hub_unreachable):
+    manifest = write_manifest(tmp_path, {"name": "picture_book", "size": None, "sha256": None})
+
+    summary = provision_loras.provision_loras(str(lora_dir), "", 1, manifest)
+
+    assert summary["failed"] == 1
+    assert summary["results"][0]["ok"] is False
+
+
+def test_pinned_lora_already_present_is_verified(tmp_path, lora_dir, hub_unreachable, monkeypatch):
+    monkeypatch.setattr(provision_loras, "LORA_VERIFY_EXISTING", True)
+    manifest = write_manifest(tmp_path, {
+        "name": "picture_book", "size": len(CONTENT), "sha256": hashlib.sha256(CONTENT).hexdigest()
+    })
+
+    summary = provision_loras.provision_loras(str(lora_dir), "", 1, manifest)
+
+    assert summary["failed"] == 0
+    assert summary["results"][0]["action"] == "present"
+
+
+def test_lora_verified_earlier_is_used_while_the_hub_is_unreachable(tmp_path, lora_dir, monkeypatch):
+    pinned = {"name": "picture_book", "size": len(CONTENT), "sha256": hashlib.sha256(CONTENT).hexdigest()}
+    assert provision_loras.provision_loras(str(lora_dir), "", 1, write_manifest(tmp_path, pinned))["failed"] == 0
+
+    class UnreachableHub:
+        def model_info(self, *args, **kwargs):
+            raise ConnectionError("Name or service not known")
+
+    monkeypatch.setattr(provision_loras, "HfApi", UnreachableHub)
+    unpinned = write_manifest(tmp_path, {"name": "picture_book", "size": None, "sha256": None})
+    assert provision_loras.provision_loras(str(lora_dir), "", 1, unpinned)["failed"] == 0
+
+    # A file that changed since it was verified is refused
+    (lora_dir / "picture_book.safetensors").write_bytes(b"other weights")
+    assert provision_loras.provision_loras(str(lora_dir), "", 1, unpinned)["failed"] == 1
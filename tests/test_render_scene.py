@@ -0,0 +1,95 @@
+import handler
+
+
+def story_config(story_id, **overrides):
+    config = handler.build_story_config({"story_id": story_id, **overrides}, f"job-{story_id}")
+    config["style_seed"] = handler.get_story_seed(story_id)
+    return config
+
+
+def render(config, scene_index=0, prompt="a fox in the snow"):
+    fingerprint = handler.SceneCheckpoints.story_fingerprint(config)
+    result = handler.render_scene(scene_index, prompt, [], config, fingerprint)
+    return result, handler.scene_checkpoints.get(config["story_id"], scene_index, prompt, fingerprint)
+
+
+def test_scene_is_checkpointed(fake_webui):
+    result, checkpoint = render(story_config("checkpointed"))
+
+    assert "error" not in result
+    assert checkpoint is not None
+
+
+def test_scene_reduced_for_a_deadline_is_not_checkpointed(fake_webui, monkeypatch):
+    monkeypatch.setattr(handler, "plan_for_deadline", lambda request, job_id, share=1.0: {
+        "planned_seconds": 5.0, "reduced": True, "over_budget": False, "steps": 20, "enable_hr": False
+    })
+    result, checkpoint = render(story_config("reduced"))
+
+    assert result["plan"]["reduced"] is True
+    assert checkpoint is None
+
+
+def test_failed_print_finalization_is_the_scenes_error(fake_webui, monkeypatch):
+    def upscale_to_print(*args, **kwargs):
+        raise RuntimeError("500 Server Error: extra-single-image")
+
+    monkeypatch.setattr(handler, "upscale_to_print", upscale_to_print)
+    result, checkpoint = render(story_config("finalize-fails", print_finalize=True, print_upscaler="R-ESRGAN 4x+"))
+
+    assert "Print finalization failed" in result["error"]
+    assert "images" not in result
+    assert checkpoint is None
+
+
+def test_failed_upload_is_the_scenes_error(fake_webui, monkeypatch):
+    class UnreachableSink:
+        bucket = "books"
+
+        def upload_many(self, items, content_type, presign=True):
+            raise ConnectionError("Could not connect to the endpoint URL")
+
+    monkeypatch.setattr(handler, "get_image_sink", lambda bucket=None: UnreachableSink())
+    result, _ = render(story_config("upload-fails", output_sink="s3", output_bucket="books"))
+
+    assert "Upload failed" in result["error"]
+    assert "images" not in result and "image_objects" not in result
+
+
+def test_only_scenes_seeded_by_the_clients_story_id_are_cached(monkeypatch):
+    cached = []
+
+    def run_inference(inference_request, method="img2img", use_cache=False, job_id=None):
+        cached.append(use_cache)
+        return {"error": "no WebUI"}
+
+    monkeypatch.setattr(handler, "run_inference", run_inference)
+    for input_data in ({"story_id": "cached"}, {}, {"story_id": "uncached", "use_cache": False}):
+        config = handler.build_story_config(input_data, "job-cache")
+        handler.render_scene(0, "a fox in the snow", [], config)
+
+    assert cached == [True, False, False]
+
+
+def test_checkpoint_keeps_images_and_resume_uploads_again(fake_webui, monkeypatch):
+    uploads = []
+
+    class RecordingSink:
+        bucket = "books"
+
+        def upload_many(self, items, content_type, presign=True):
+            uploads.append([key for _, key in items])
+            return [{"bucket": self.bucket, "key": key, "url": f"https://books/{key}?signature={len(uploads)}"} for _, key in items]
+
+    monkeypatch.setattr(handler, "get_image_sink", lambda bucket=None: RecordingSink())
+    config = story_config("uploaded", output_sink="s3", output_bucket="books")
+    result, checkpoint = render(config)
+
+    assert result["image_objects"][0]["url"].endswith("signature=1")
+    assert checkpoint["images"] and "image_objects" not in checkpoint
+
+    resumed = list(handler.iter_story_scenes(["a fox in the snow"], [], dict(config, job_id="job-uploaded-retry")))
+
+    assert resumed[0]["resumed"] is True
+    assert resumed[0]["image_objects"][0]["url"].endswith("signature=2")
+    assert uploads == [["uploaded/scene_000.png"]] * 2
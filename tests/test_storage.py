@@ -0,0 +1,59 @@
+import hashlib
+from urllib.parse import urlparse
+
+import boto3
+import pytest
+from moto import mock_aws
+
+import handler
+import storage
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """A moto S3 with an empty "books" bucket and fresh sinks"""
+    for name in ("AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SECURITY_TOKEN", "AWS_SESSION_TOKEN"):
+        monkeypatch.setenv(name, "testing")
+    monkeypatch.setattr(storage, "_sinks", {})
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="books")
+        yield client
+
+
+def story_job(job_id, **input_data):
+    return {"id": job_id, "input": {
+        "scene_prompts": ["a fox in the snow", "a fox at home"], "story_id": "fox", "resume": False,
+        "output_sink": "s3", "output_bucket": "books", "output_prefix": "orders/7", **input_data
+    }}
+
+
+def test_story_is_uploaded_with_keys_per_scene_and_presigned_urls(fake_webui, s3):
+    result = handler.process_job(story_job("s3-story"))
+
+    keys = [scene["image_objects"][0]["key"] for scene in result["scenes"]]
+    assert keys == ["orders/7/fox/scene_000.png", "orders/7/fox/scene_001.png"]
+    for scene in result["scenes"]:
+        assert "images" not in scene
+        uploaded = scene["image_objects"][0]
+        body = s3.get_object(Bucket="books", Key=uploaded["key"])["Body"].read()
+        assert hashlib.sha256(body).hexdigest() == uploaded["sha256"]
+        assert body.startswith(b"\x89PNG")
+        url = urlparse(uploaded["url"])
+        assert url.path.endswith(uploaded["key"])
+        assert "X-Amz-Signature=" in url.query
+
+
+def test_keys_only_without_presigned_urls(fake_webui, s3):
+    result = handler.process_job(story_job("s3-keys-only", presign_urls=False))
+
+    assert all("url" not in scene["image_objects"][0] for scene in result["scenes"])
+
+
+def test_s3_sink_without_a_bucket_fails_before_rendering(fake_webui, monkeypatch):
+    monkeypatch.setattr(storage, "BUCKET_NAME", None)
+
+    result = handler.process_job(story_job("s3-no-bucket", output_bucket=None))
+
+    assert "No output bucket configured" in result["error"]
+    assert fake_webui == []
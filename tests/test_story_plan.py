@@ -0,0 +1,25 @@
+import pytest
+
+import handler
+from story_plan import InvalidJobInput, build_story_config
+
+
+@pytest.mark.parametrize("scene_prompts", ["a fox", ["a fox", None], ["a fox", "  "], {"0": "a fox"}])
+def test_invalid_scene_prompts_are_rejected(scene_prompts):
+    with pytest.raises(InvalidJobInput, match="scene_prompts"):
+        build_story_config({"scene_prompts": scene_prompts}, "job")
+
+
+def test_scene_characters_need_one_entry_per_scene():
+    with pytest.raises(InvalidJobInput, match="one entry per scene"):
+        build_story_config({"scene_prompts": ["a fox", "a fox at home"], "scene_characters": [[0]]}, "job")
+
+    config = build_story_config({"scene_prompts": ["a fox", "a fox at home"], "scene_characters": [[0], [0, 1]]}, "job")
+    assert config["scene_characters"] == [[0], [0, 1]]
+
+
+def test_invalid_story_fails_before_any_inference(fake_webui):
+    result = handler.process_job({"id": "string-prompts", "input": {"scene_prompts": "a fox"}})
+
+    assert "scene_prompts" in result["error"]
+    assert fake_webui == []